@@ -1,58 +1,119 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-
-def basic_analysis(file_path):
-    df = pd.read_csv(file_path)
-    # make sure the DateTime column is datetime
-    df["DateTime"] = pd.to_datetime(df["DateTime"])
-    # make a column for the year
-    df["Year"] = df["DateTime"].dt.year
-    
+import numpy as np
+from charts import Chart, output_charts
+from dataset import load_crash_data
+from metrics import count
+
+# the only columns basic_analysis needs from the cleaned dataset
+BASIC_ANALYSIS_COLUMNS = [
+    "DateTime",
+    "Year",
+    "Location_Cleaned",
+    "Operator_Cleaned",
+    "Total_Aboard",
+    "Total_Fatalities",
+    "Summary",
+]
+
+
+def top_counts(column, n=10):
+    """The n most common values of column with their counts.
+
+    Ties are broken by name, so the order doesn't depend on the row order
+    or the column's dtype (value_counts orders ties differently for
+    category columns); CrashCube.top breaks them the same way.
+    """
+    counts = column.value_counts()
+    counts = counts[counts > 0]  # unused categories of a category column
+    counts = counts.sort_index(key=lambda names: names.astype(str))
+    return counts.sort_values(ascending=False, kind="stable").head(n)
+
+def basic_aggregates(source):
+    """Computes everything basic_analysis plots, once, from a path or DataFrame."""
+    # source is CrashTestInfo_Cleaned.csv, the Parquet file from scrub_crash_data
+    # or an already loaded DataFrame; files are only read once per process
+    # DateTime comes back parsed and with a Year column
+    df = load_crash_data(source, columns=BASIC_ANALYSIS_COLUMNS)
+    count("rows_in", len(df))
+    aggregates = {}
+
     # crashes per year
-    crash_counts = df["Year"].value_counts().sort_index()
-    # create a plot
-    crash_counts.plot(kind="line", title="Crashes Over Time")
-    # show the plot
-    plt.show()
-    
+    aggregates["crash_counts"] = df["Year"].value_counts().sort_index()
+
     # fatalities by year
-    fatalities_per_year = df.groupby("Year")["Total_Fatalities"].sum()
-    fatalities_per_year.plot(kind="bar", title="Total Fatalities Per Year")
-    # show the plot
-    plt.show()
-    
+    aggregates["fatalities_per_year"] = df.groupby("Year")["Total_Fatalities"].sum()
+
     # most dangerous locations
-    top_locations = df["Location_Cleaned"].value_counts().head(10)
-    top_locations.plot(kind="bar", title="Top 10 Locations with Most Crashes")
-    plt.show()
-    
+    aggregates["top_locations"] = top_counts(df["Location_Cleaned"])
+
     # most affected airline
-    top_operators = df["Operator_Cleaned"].value_counts().head(10)
-    top_operators.plot(kind="bar", title="Top 10 Operators with Most Crashes")
-    plt.show()
-    
+    aggregates["top_operators"] = top_counts(df["Operator_Cleaned"])
+
     # severity of crashes
     # Avoid division by zero errors by replacing zeros in Total_Aboard with NaN
     df["Survival_Rate"] = (1 - df["Total_Fatalities"] / df["Total_Aboard"]) * 100
-    
+
     # Replace infinite values (-inf) with NaN, then fill NaN with 0
-    df["Survival_Rate"].replace([float("inf"), -float("inf")], float("nan"), inplace=True)
-    df["Survival_Rate"].fillna(0, inplace=True)
-    
-    # Plot the distribution of survival rates
-    
-    plt.figure(figsize=(10, 5))
-    df["Survival_Rate"].hist(bins=20, edgecolor="black")
-    plt.title("Distribution of Survival Rates")
-    plt.xlabel("Survival Rate (%)")
-    plt.ylabel("Number of Crashes")
-    plt.show()
-    
+    # (assigned back rather than inplace, which has no effect on a column under copy-on-write)
+    df["Survival_Rate"] = (
+        df["Survival_Rate"].replace([float("inf"), -float("inf")], float("nan")).fillna(0)
+    )
+
+    # distribution of survival rates, binned like Series.hist(bins=20)
+    aggregates["survival_histogram"] = np.histogram(df["Survival_Rate"], bins=20)
+
     # worst disasters
-    worst_crashes = df.nlargest(10, "Total_Fatalities")[
+    aggregates["worst_crashes"] = df.nlargest(10, "Total_Fatalities")[
         ["DateTime", "Location_Cleaned", "Total_Fatalities", "Summary"]
     ]
-    print(worst_crashes)
-    
-    # Saves the plot
-    # plt.savefig("crash_trends.png")
+    return aggregates
+
+
+def basic_charts(aggregates):
+    """Returns the charts of basic_analysis drawn from basic_aggregates."""
+    return [
+        Chart("crashes_per_year", "line", aggregates["crash_counts"], "Crashes Over Time", {}),
+        Chart(
+            "fatalities_per_year",
+            "bar",
+            aggregates["fatalities_per_year"],
+            "Total Fatalities Per Year",
+            {},
+        ),
+        Chart(
+            "top_locations",
+            "bar",
+            aggregates["top_locations"],
+            "Top 10 Locations with Most Crashes",
+            {},
+        ),
+        Chart(
+            "top_operators",
+            "bar",
+            aggregates["top_operators"],
+            "Top 10 Operators with Most Crashes",
+            {},
+        ),
+        Chart(
+            "survival_rates",
+            "hist",
+            aggregates["survival_histogram"],
+            "Distribution of Survival Rates",
+            {
+                "figsize": (10, 5),
+                "xlabel": "Survival Rate (%)",
+                "ylabel": "Number of Crashes",
+            },
+        ),
+    ]
+
+
+def basic_analysis(source, output_dir=None, processes=None):
+    """Plots crashes and fatalities per year, top locations/operators and survival rates.
+
+    Charts are shown in windows, or with output_dir saved there as image
+    files, drawn in parallel worker processes with a non-interactive backend.
+    """
+    aggregates = basic_aggregates(source)
+    output_charts(basic_charts(aggregates), output_dir, processes)
+    print(aggregates["worst_crashes"])
+    return aggregates
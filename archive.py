@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Raw Page Archive for Plane Crash Dummy Project
+
+Keeps every downloaded page in one append-only file of compressed records
+(similar to a WARC file) next to a memory-mapped hash index, so pages can be
+re-parsed offline and a refresh only downloads pages that changed.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+ArchivedPage = namedtuple(
+    "ArchivedPage", ["url", "status", "etag", "last_modified", "fetched_at", "body"]
+)
+
+# data file record: magic, url length, metadata length, compressed body length
+RECORD_HEADER = struct.Struct("<4sHII")
+RECORD_MAGIC = b"PCA1"
+
+# index file: magic, slot count, used slots, archive length covered by the index
+INDEX_HEADER = struct.Struct("<4sQQQ")
+INDEX_MAGIC = b"PCX1"
+# index slot: 16 byte md5 of the url, record offset + 1 (0 marks an empty slot)
+SLOT = struct.Struct("<16sQ")
+INITIAL_SLOTS = 1 << 14
+
+
+def url_key(url):
+    return hashlib.md5(url.encode("utf-8")).digest()
+
+
+def conditional_headers(page):
+    """Returns the If-None-Match / If-Modified-Since headers to revalidate an archived page."""
+    headers = {}
+    if page is not None:
+        if page.etag:
+            headers["If-None-Match"] = page.etag
+        if page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+    return headers
+
+
+class PageArchive:
+    """Append-only archive of raw HTML pages keyed by URL.
+
+    Args:
+        path: The archive file; the index is kept at path + ".idx".
+        revalidate: When True, getdata and the crawler ask the server whether
+            archived pages changed (ETag / If-Modified-Since) instead of
+            serving them straight from the archive.
+    """
+
+    def __init__(self, path, revalidate=False):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.revalidate = revalidate
+        self.data = open(path, "a+b")
+        self._index_file = None
+        self._index = None
+        self._open_index()
+
+    # index handling
+
+    def _map_index(self):
+        self._index_file = open(self.index_path, "r+b")
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        magic, self.capacity, self.count, covered = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{self.index_path} is not a page archive index")
+        return covered
+
+    def _create_index(self, capacity):
+        with open(self.index_path, "wb") as file:
+            file.write(INDEX_HEADER.pack(INDEX_MAGIC, capacity, 0, 0))
+            file.truncate(INDEX_HEADER.size + capacity * SLOT.size)
+
+    def _close_index(self):
+        if self._index is not None:
+            self._index.close()
+            self._index_file.close()
+            self._index = None
+
+    def _open_index(self):
+        if not os.path.exists(self.index_path):
+            self._create_index(INITIAL_SLOTS)
+        try:
+            covered = self._map_index()
+        except ValueError:
+            self._close_index()
+            self._create_index(INITIAL_SLOTS)
+            covered = self._map_index()
+        # index any records appended after the index was last written (e.g. after a crash)
+        end = os.path.getsize(self.path)
+        if covered > end:
+            self.rebuild_index()
+        elif covered < end:
+            self._set_covered(self._index_records(covered))
+
+    def _set_covered(self, covered):
+        INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, self.capacity, self.count, covered)
+
+    def _slot(self, key):
+        """Returns the slot number holding key, or the empty slot where it belongs."""
+        slot = int.from_bytes(key[:8], "little") % self.capacity
+        while True:
+            position = INDEX_HEADER.size + slot * SLOT.size
+            stored, offset = SLOT.unpack_from(self._index, position)
+            if offset == 0 or stored == key:
+                return slot, offset
+            slot = (slot + 1) % self.capacity
+
+    def _insert(self, key, offset):
+        if (self.count + 1) * 2 > self.capacity:
+            self._grow()
+        slot, existing = self._slot(key)
+        if existing == 0:
+            self.count += 1
+        SLOT.pack_into(self._index, INDEX_HEADER.size + slot * SLOT.size, key, offset + 1)
+
+    def _grow(self):
+        entries = [
+            SLOT.unpack_from(self._index, INDEX_HEADER.size + slot * SLOT.size)
+            for slot in range(self.capacity)
+        ]
+        covered = INDEX_HEADER.unpack_from(self._index, 0)[3]
+        self._close_index()
+        self._create_index(self.capacity * 2)
+        self._map_index()
+        for key, stored in entries:
+            if stored:
+                self._insert(key, stored - 1)
+        self._set_covered(covered)
+
+    def rebuild_index(self):
+        """Rebuilds the index from scratch by scanning the archive file."""
+        self._close_index()
+        self._create_index(INITIAL_SLOTS)
+        self._map_index()
+        self._set_covered(self._index_records(0))
+
+    def _index_records(self, start):
+        """Indexes the complete records from start onwards and returns where they end.
+
+        A torn record after them (a write cut off by a crash) is truncated,
+        so pages archived from now on follow the last complete record.
+        """
+        good = start
+        for offset, url, good in self._scan(start):
+            self._insert(url_key(url), offset)
+        if good < os.path.getsize(self.path):
+            self.data.truncate(good)
+        return good
+
+    # archive records
+
+    def _scan(self, start):
+        """Yields (offset, url, end offset) for every complete record from start onwards."""
+        end = os.path.getsize(self.path)
+        offset = start
+        with open(self.path, "rb") as file:
+            while offset + RECORD_HEADER.size <= end:
+                file.seek(offset)
+                magic, url_len, meta_len, body_len = RECORD_HEADER.unpack(
+                    file.read(RECORD_HEADER.size)
+                )
+                size = RECORD_HEADER.size + url_len + meta_len + body_len
+                if magic != RECORD_MAGIC or offset + size > end:
+                    break  # torn write at the end of the file
+                yield offset, file.read(url_len).decode("utf-8"), offset + size
+                offset += size
+
+    def _read(self, offset):
+        self.data.seek(offset)
+        magic, url_len, meta_len, body_len = RECORD_HEADER.unpack(
+            self.data.read(RECORD_HEADER.size)
+        )
+        url = self.data.read(url_len).decode("utf-8")
+        meta = json.loads(self.data.read(meta_len))
+        body = zlib.decompress(self.data.read(body_len)).decode("utf-8")
+        return ArchivedPage(
+            url, meta["status"], meta["etag"], meta["last_modified"], meta["fetched_at"], body
+        )
+
+    def get(self, url):
+        """Returns the latest ArchivedPage for url, or None if it was never archived."""
+        slot, stored = self._slot(url_key(url))
+        if stored == 0:
+            return None
+        return self._read(stored - 1)
+
+    def put(self, url, body, status=200, etag=None, last_modified=None):
+        """Appends a page to the archive and points the index at it."""
+        encoded_url = url.encode("utf-8")
+        meta = json.dumps(
+            {
+                "status": status,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time(),
+            }
+        ).encode("utf-8")
+        compressed = zlib.compress(body.encode("utf-8"), 6)
+
+        self.data.seek(0, os.SEEK_END)
+        offset = self.data.tell()
+        self.data.write(RECORD_HEADER.pack(RECORD_MAGIC, len(encoded_url), len(meta), len(compressed)))
+        self.data.write(encoded_url)
+        self.data.write(meta)
+        self.data.write(compressed)
+        self.data.flush()
+
+        self._insert(url_key(url), offset)
+        self._set_covered(self.data.tell())
+
+    def urls(self):
+        """Returns every archived url in the order it was first archived."""
+        seen = {}
+        for offset, url, _ in self._scan(0):
+            seen.setdefault(url, offset)
+        return list(seen)
+
+    def __contains__(self, url):
+        return self._slot(url_key(url))[1] != 0
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self._index is not None:
+            self._index.flush()
+        self._close_index()
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,974 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for Plane Crash Dummy Project
+
+Run a benchmark by name, e.g.
+    python benchmark.py parsers
+    python benchmark.py scrub
+    python benchmark.py incremental
+    python benchmark.py sharded
+    python benchmark.py canonical
+    python benchmark.py columnar
+    python benchmark.py loader
+    python benchmark.py classifier
+    python benchmark.py search
+    python benchmark.py cube
+    python benchmark.py service
+    python benchmark.py backoff
+    python benchmark.py pipeline --rows 1000000 --pages 2000
+
+The pipeline benchmark appends its results as one JSON line to
+--output (benchmark_results.jsonl by default), so runs can be compared
+over time.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from metrics import memory_usage, reset_peak_memory
+from standin import StandinServer, build_site, fixture_pages
+
+def throughput(func, items):
+    """Runs func over every item and returns items per second."""
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def benchmark_parsers(raw_csv="data/crashtestdummy.csv", limit=2000, processes=None):
+    """Compares pages/second of the BeautifulSoup path with the targeted crash table parsers."""
+    from getdata import parse_crash_table
+    from tableparser import (
+        extract_crash_record_lxml,
+        extract_crash_record_stdlib,
+        lxml_html,
+        parse_pages,
+    )
+
+    pages = [html for path, html in fixture_pages(raw_csv, limit).items() if "-" in path]
+    results = {"BeautifulSoup (html.parser)": throughput(parse_crash_table, pages)}
+    results["stdlib tokenizer"] = throughput(extract_crash_record_stdlib, pages)
+    if lxml_html is not None:
+        results["lxml"] = throughput(extract_crash_record_lxml, pages)
+
+    start = time.perf_counter()
+    for _ in parse_pages(pages, processes=processes):
+        pass
+    results["process pool"] = len(pages) / (time.perf_counter() - start)
+
+    print(f"Parsed {len(pages)} crash pages")
+    baseline = results["BeautifulSoup (html.parser)"]
+    for name, pages_per_second in results.items():
+        print(f"{name:30} {pages_per_second:10.0f} pages/s  {pages_per_second / baseline:6.1f}x")
+    return results
+
+
+def clean_crash_frame_rowwise(df_cleaned):
+    """The original row-by-row scrub_crash_data cleaning, kept as the reference for benchmarks."""
+    import pandas as pd
+    from scrubdata import (
+        SCRUBBED_COLUMNS,
+        clean_location,
+        clean_operator,
+        extract_aboard_counts,
+        extract_fatalities,
+        generate_hash,
+    )
+
+    df_cleaned = df_cleaned.copy()
+    df_cleaned["Time"] = df_cleaned["Time"].replace("?", "0000")
+    df_cleaned["Time"] = df_cleaned["Time"].astype(str).str.zfill(4)
+    df_cleaned["Time"] = df_cleaned["Time"].str.replace("::", ":", regex=False)
+    df_cleaned["DateTime"] = df_cleaned["Date"] + " " + df_cleaned["Time"]
+    df_cleaned["DateTime"] = pd.to_datetime(df_cleaned["DateTime"], errors="coerce")
+    df_cleaned["UniqueID"] = df_cleaned.apply(generate_hash, axis=1)
+    df_cleaned["Location_Cleaned"] = df_cleaned["Location"].apply(clean_location)
+    df_cleaned["Operator_Cleaned"] = df_cleaned["Operator"].apply(clean_operator)
+    df_cleaned[["Passengers_Aboard", "Crew_Aboard"]] = df_cleaned["Aboard"].apply(
+        lambda x: pd.Series(extract_aboard_counts(x))
+    )
+    df_cleaned["Passengers_Aboard"] = df_cleaned["Passengers_Aboard"].fillna(0).astype(int)
+    df_cleaned["Crew_Aboard"] = df_cleaned["Crew_Aboard"].fillna(0).astype(int)
+    df_cleaned["Total_Aboard"] = df_cleaned["Passengers_Aboard"] + df_cleaned["Crew_Aboard"]
+    df_cleaned[["Passengers_Fatalities", "Crew_Fatalities"]] = df_cleaned["Fatalities"].apply(
+        lambda x: pd.Series(extract_fatalities(x))
+    )
+    df_cleaned["Passengers_Fatalities"] = df_cleaned["Passengers_Fatalities"].fillna(0).astype(int)
+    df_cleaned["Crew_Fatalities"] = df_cleaned["Crew_Fatalities"].fillna(0).astype(int)
+    df_cleaned["Total_Fatalities"] = (
+        df_cleaned["Passengers_Fatalities"] + df_cleaned["Crew_Fatalities"]
+    )
+    for column in ["Flight #", "Route", "Aircraft Type", "Registration"]:
+        df_cleaned[column] = df_cleaned[column].replace("?", "Unknown")
+    return df_cleaned[SCRUBBED_COLUMNS]
+
+
+def synthetic_raw_frame(rows, raw_csv="data/crashtestdummy.csv"):
+    """Returns `rows` raw crash rows made by repeating the real ones."""
+    from scrubdata import load_raw_crash_data
+
+    real = load_raw_crash_data(raw_csv)
+    positions = [i % len(real) for i in range(rows)]
+    return real.iloc[positions].reset_index(drop=True)
+
+
+def csv_text(df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def benchmark_scrub(sizes=(5_000, 500_000, 5_000_000), reference_limit=500_000):
+    """Times the vectorized clean_crash_frame against the row-wise original.
+
+    For every size the reference runs on, the CSV output of both must be
+    byte-identical; the row-wise version is skipped above reference_limit rows.
+    """
+    from scrubdata import clean_crash_frame
+
+    results = {}
+    for rows in sizes:
+        df = synthetic_raw_frame(rows)
+
+        start = time.perf_counter()
+        vectorized = clean_crash_frame(df)
+        vectorized_seconds = time.perf_counter() - start
+
+        if rows <= reference_limit:
+            start = time.perf_counter()
+            reference = clean_crash_frame_rowwise(df)
+            reference_seconds = time.perf_counter() - start
+            if csv_text(vectorized) != csv_text(reference):
+                raise AssertionError(f"vectorized scrub output differs at {rows} rows")
+            print(
+                f"{rows:>10} rows  row-wise {reference_seconds:8.2f}s  "
+                f"vectorized {vectorized_seconds:8.2f}s  {reference_seconds / vectorized_seconds:6.1f}x  (identical)"
+            )
+        else:
+            reference_seconds = None
+            print(f"{rows:>10} rows  row-wise  skipped  vectorized {vectorized_seconds:8.2f}s")
+        results[rows] = {"rowwise": reference_seconds, "vectorized": vectorized_seconds}
+    return results
+
+
+def benchmark_incremental(rows=500_000, new=1_000, raw_csv="data/crashtestdummy.csv"):
+    """Times a full scrub against an incremental one after `new` crashes were appended.
+
+    The incremental outputs must be byte-identical to a full scrub of the
+    grown raw file.
+    """
+    import pandas as pd
+
+    from scrubdata import load_raw_crash_data, scrub_crash_data
+
+    appended = load_raw_crash_data(raw_csv).iloc[:new].copy()
+    # different places, so they are new crashes rather than updates of the repeated ones
+    appended["Location"] = appended["Location"] + " (new)"
+    with tempfile.TemporaryDirectory() as folder:
+        raw = os.path.join(folder, "crashrecords.csv")
+        paths = {
+            name: (os.path.join(folder, f"{name}.csv"), os.path.join(folder, f"{name}.parquet"))
+            for name in ("incremental", "full")
+        }
+        write_synthetic_raw_csv(raw, rows, raw_csv)
+        output, parquet = paths["incremental"]
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            full_seconds = timed(scrub_crash_data, raw, output, parquet_path=parquet)
+            appended.to_csv(raw, mode="a", header=False, index=False)
+            incremental_seconds = timed(
+                scrub_crash_data, raw, output, parquet_path=parquet, incremental=True
+            )
+            scrub_crash_data(raw, paths["full"][0], parquet_path=paths["full"][1])
+        with open(paths["incremental"][0], "rb") as a, open(paths["full"][0], "rb") as b:
+            if a.read() != b.read():
+                raise AssertionError("incremental scrub output differs from a full scrub")
+        if not pd.read_parquet(paths["incremental"][1]).equals(pd.read_parquet(paths["full"][1])):
+            raise AssertionError("incremental Parquet output differs from a full scrub")
+
+    print(f"{rows} crashes, {new} appended (outputs identical to a full scrub)")
+    print(f"{'full scrub':20} {full_seconds:7.2f}s")
+    print(
+        f"{'incremental':20} {incremental_seconds:7.2f}s  "
+        f"{full_seconds / incremental_seconds:5.1f}x"
+    )
+    return {"full": full_seconds, "incremental": incremental_seconds}
+
+
+def benchmark_canonical(sizes=(50_000, 1_000_000), raw_csv="data/crashtestdummy.csv"):
+    """Times canonical names for the location and operator columns against the per-row cleaning.
+
+    "cold" starts from empty CanonicalNames, "warm" reuses the names already
+    worked out, like a scrub with a saved data/canonical.json.
+    """
+    from canonical import CanonicalNames
+    from scrubdata import clean_location, clean_location_column, clean_operator, clean_operator_column
+
+    results = {}
+    for rows in sizes:
+        df = synthetic_raw_frame(rows, raw_csv)
+        timings = {}
+        start = time.perf_counter()
+        df["Location"].apply(clean_location), df["Operator"].apply(clean_operator)
+        timings["per row"] = time.perf_counter() - start
+        start = time.perf_counter()
+        plain = clean_location_column(df["Location"]), clean_operator_column(df["Operator"])
+        timings["vectorized"] = time.perf_counter() - start
+        canonical = CanonicalNames()
+        start = time.perf_counter()
+        canonical.location.apply(df["Location"]), canonical.operator.apply(df["Operator"])
+        timings["canonical cold"] = time.perf_counter() - start
+        start = time.perf_counter()
+        names = canonical.location.apply(df["Location"]), canonical.operator.apply(df["Operator"])
+        timings["canonical warm"] = time.perf_counter() - start
+
+        print(
+            f"{rows} rows: {plain[0].nunique()} -> {names[0].nunique()} locations, "
+            f"{plain[1].nunique()} -> {names[1].nunique()} operators"
+        )
+        for name, seconds in timings.items():
+            print(
+                f"{name:20} {seconds:7.2f}s  {rows / seconds:12.0f} rows/s  "
+                f"{timings['per row'] / seconds:5.1f}x"
+            )
+        results[rows] = timings
+    return results
+
+
+def disk_size(path):
+    """Size in bytes of a file or of every file below a directory."""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    return os.path.getsize(path)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def benchmark_columnar(cleaned_csv="data/CrashTestInfo_Cleaned.csv", repeat=20):
+    """Compares on-disk size and load time of the cleaned CSV and the typed Parquet file.
+
+    repeat stacks copies of the cleaned data to get a bigger dataset.
+    """
+    import pandas as pd
+    from analysis import BASIC_ANALYSIS_COLUMNS
+    from dataset import read_crash_data, write_crash_parquet
+
+    df = pd.read_csv(cleaned_csv)
+    df = pd.concat([df] * repeat, ignore_index=True)
+    results = {"rows": len(df)}
+    with tempfile.TemporaryDirectory() as folder:
+        csv_path = os.path.join(folder, "cleaned.csv")
+        parquet_path = os.path.join(folder, "cleaned.parquet")
+        df.to_csv(csv_path, index=False)
+        write_crash_parquet(df, parquet_path)
+
+        loads = {
+            "all columns": None,
+            "basic_analysis columns": BASIC_ANALYSIS_COLUMNS,
+            "summarize_crashes columns": ["DateTime", "Year", "Summary"],
+            "Year + Total_Fatalities": ["Year", "Total_Fatalities"],
+        }
+        one_decade = range(1970, 1980)
+        print(f"{len(df)} rows")
+        for name, path in [("CSV", csv_path), ("Parquet", parquet_path)]:
+            size = disk_size(path)
+            results[name] = {"bytes": size}
+            print(f"{name:8} {size / 1e6:8.1f} MB on disk")
+            for load, columns in loads.items():
+                seconds = timed(read_crash_data, path, columns)
+                results[name][load] = seconds
+                print(f"    {load:28} {seconds:7.3f}s")
+            seconds = timed(read_crash_data, path, ["Year", "Total_Fatalities"], one_decade)
+            results[name]["1970s only"] = seconds
+            print(f"    {'1970s only':28} {seconds:7.3f}s")
+    return results
+
+
+def benchmark_loader(cleaned_path="data/CrashTestInfo_Cleaned.csv", loops=20):
+    """Times repeated analysis loads with read_crash_data against the memoized load_crash_data."""
+    from analysis import BASIC_ANALYSIS_COLUMNS
+    from dataset import clear_crash_data_cache, load_crash_data, read_crash_data
+
+    loads = [BASIC_ANALYSIS_COLUMNS, ["DateTime", "Year", "Summary"]] * loops
+    clear_crash_data_cache()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, os.path.basename(cleaned_path))
+        shutil.copyfile(cleaned_path, path)
+        results = {
+            "read_crash_data": timed(lambda: [read_crash_data(path, c) for c in loads]),
+            "load_crash_data": timed(lambda: [load_crash_data(path, c) for c in loads]),
+        }
+        # a touched file is re-hashed but not re-read
+        os.utime(path, ns=(0, 0))
+        results["after touch"] = timed(load_crash_data, path, BASIC_ANALYSIS_COLUMNS)
+        clear_crash_data_cache()
+
+    print(f"{len(loads)} analysis loads of {cleaned_path}")
+    for name, seconds in results.items():
+        print(f"{name:20} {seconds:7.3f}s")
+    return results
+
+
+def benchmark_backoff(pages=400, capacity=4, latency=0.03):
+    """Crawls a stand-in site that rejects requests above `capacity` in flight with 503.
+
+    Compares fixed concurrency above and at the capacity with AIMD adaptive
+    concurrency; rejected requests are retried with backoff.
+    """
+    import asyncio
+
+    from crawler import AdaptiveLimit, crawl
+    from retry import RetryPolicy
+    from standin import Faults
+
+    site = synthetic_site(pages)
+    policy = RetryPolicy(retries=8, timeout=5.0, backoff=0.05, max_backoff=1.0)
+    limits = {
+        "fixed 16": lambda: AdaptiveLimit(16, minimum=16),
+        f"fixed {capacity}": lambda: AdaptiveLimit(capacity, minimum=capacity),
+        "adaptive 8 (max 16)": lambda: AdaptiveLimit(16, initial=8),
+    }
+    print(f"{pages} pages, server capacity {capacity} requests, {latency * 1000:.0f} ms latency")
+    results = {}
+    for name, make_limit in limits.items():
+        limit = make_limit()
+        fetched = []
+        with StandinServer(site, Faults(capacity=capacity, latency=latency, seed=1)) as server:
+            urls = [server.url(path) for path in site if "-" in path.rsplit("/", 1)[-1]]
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                seconds = timed(
+                    asyncio.run,
+                    crawl(
+                        urls,
+                        lambda url, html: fetched.append(html is not None),
+                        rate=100_000,
+                        limit=limit,
+                        policy=policy,
+                    ),
+                )
+            results[name] = (seconds, sum(fetched), server.stats["requests"], server.stats["overloaded"])
+        print(
+            f"{name:20} {seconds:7.2f}s {sum(fetched):5} pages {server.stats['requests']:6} requests "
+            f"{server.stats['overloaded']:5} rejected, concurrency ended at {int(limit.limit)}"
+        )
+    return results
+
+
+def categorize_crash_ifchain(summary):
+    """The original if/elif categorize_crash, kept as the reference for benchmarks."""
+    summary = str(summary).lower()  # Convert to lowercase
+
+    if any(
+        keyword in summary for keyword in ["collision", "midair", "crash into another"]
+    ):
+        return "Mid-Air Collision"
+    elif any(
+        keyword in summary
+        for keyword in ["engine failure", "mechanical failure", "technical issue"]
+    ):
+        return "Mechanical Failure"
+    elif any(keyword in summary for keyword in ["weather", "storm", "turbulence"]):
+        return "Weather-Related"
+    elif any(keyword in summary for keyword in ["fire", "explosion", "smoke"]):
+        return "Fire/Explosion"
+    elif any(
+        keyword in summary
+        for keyword in ["pilot error", "loss of control", "incorrect maneuver"]
+    ):
+        return "Pilot Error"
+    elif any(keyword in summary for keyword in ["hijacking", "terrorist", "bomb"]):
+        return "Hijacking/Terrorism"
+    elif any(
+        keyword in summary for keyword in ["shot down", "missile", "military attack"]
+    ):
+        return "Shot Down (War/Conflict)"
+    elif any(keyword in summary for keyword in ["runway", "takeoff", "landing"]):
+        return "Takeoff/Landing Accident"
+    elif any(keyword in summary for keyword in ["fuel exhaustion", "ran out of fuel"]):
+        return "Fuel Exhaustion"
+    else:
+        return "Other/Unknown"
+
+
+def benchmark_classifier(cleaned_csv="data/CrashTestInfo_Cleaned.csv", sizes=(50_000, 1_000_000)):
+    """Compares rows/second of the original categorize_crash with the batch classifier.
+
+    The corpus is the real summaries repeated up to each size. The batch
+    output must match the original exactly, and the first category of the
+    multi-label output must be the single label.
+    """
+    import pandas as pd
+    from classifier import classify_crashes
+
+    summaries = pd.read_csv(cleaned_csv)["Summary"]
+    results = {}
+    for rows in sizes:
+        corpus = summaries.iloc[[i % len(summaries) for i in range(rows)]].reset_index(drop=True)
+
+        start = time.perf_counter()
+        reference = corpus.apply(categorize_crash_ifchain)
+        reference_rate = rows / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        single = classify_crashes(corpus)
+        single_rate = rows / (time.perf_counter() - start)
+        if not (single == reference).all():
+            raise AssertionError(f"classify_crashes differs from categorize_crash at {rows} rows")
+
+        start = time.perf_counter()
+        multi = classify_crashes(corpus, multi_label=True)
+        multi_rate = rows / (time.perf_counter() - start)
+        if not (multi.idxmax(axis=1) == reference).all():
+            raise AssertionError(f"multi-label first category differs at {rows} rows")
+
+        print(
+            f"{rows:>9} rows  if/elif {reference_rate:9.0f} rows/s  "
+            f"batch {single_rate:9.0f} rows/s ({single_rate / reference_rate:4.1f}x)  "
+            f"multi-label {multi_rate:9.0f} rows/s  (identical)"
+        )
+        results[rows] = {"ifchain": reference_rate, "batch": single_rate, "multi_label": multi_rate}
+    return results
+
+
+def benchmark_search(
+    cleaned_csv="data/CrashTestInfo_Cleaned.csv", rows=1_000_000, new=1_000, repeat=5
+):
+    """Compares keyword queries on the summary index with str.contains scans over every row.
+
+    The cleaned data is repeated up to `rows` crashes with distinct
+    UniqueIDs. Each query's matches must be the rows the scan finds; the
+    index build, an update after `new` crashes were appended and a reload
+    from disk are timed as well.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from search import INDEX_COLUMNS, SummaryIndex
+
+    real = pd.read_csv(cleaned_csv)
+    real["Year"] = pd.to_datetime(real["DateTime"]).dt.year
+    df = real.iloc[[i % len(real) for i in range(rows + new)]][INDEX_COLUMNS]
+    df = df.reset_index(drop=True)
+    df["UniqueID"] = df["UniqueID"] + "-" + (df.index // len(real)).astype(str)
+    summaries = df["Summary"].iloc[:rows].fillna("").str.casefold()
+    # the scans look for whole words, like the index does
+    queries = {
+        "icing": [r"\bicing\b"],
+        "engine fire": [r"\bengine\b", r"\bfire\b"],
+        '"loss of control"': [r"\bloss of control\b"],
+        "fog 1970-1979": [r"\bfog\b"],
+    }
+
+    index = SummaryIndex()
+    build_seconds = timed(index.update, df.iloc[:rows])
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "summary_index.npz")
+        save_seconds = timed(index.save, path)
+        size = os.path.getsize(path)
+        load_seconds = timed(SummaryIndex.load, path)
+    print(f"{rows} summaries: build {build_seconds:.2f}s, save {save_seconds:.2f}s, "
+          f"load {load_seconds:.2f}s, {size / 1e6:.1f} MB, {len(index.vocabulary)} terms")
+
+    results = {"build": build_seconds, "load": load_seconds, "bytes": size}
+    for query, patterns in queries.items():
+        years = range(1970, 1980) if query.endswith("1979") else None
+        start = time.perf_counter()
+        for _ in range(repeat):
+            mask = np.ones(rows, dtype=bool)
+            for pattern in patterns:
+                mask &= summaries.str.contains(pattern, regex=True).to_numpy()
+            if years is not None:
+                mask &= df["Year"].iloc[:rows].isin(list(years)).to_numpy()
+        scan_seconds = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            docs = index.match(query.replace(" 1970-1979", ""), years=years)
+        index_seconds = (time.perf_counter() - start) / repeat
+        if not np.array_equal(docs, np.flatnonzero(mask)):
+            raise AssertionError(f"index matches for {query} differ from the scan")
+        print(
+            f"{query:20} {len(docs):8} matches  scan {scan_seconds * 1000:8.1f} ms  "
+            f"index {index_seconds * 1000:7.1f} ms  {scan_seconds / index_seconds:7.1f}x"
+        )
+        results[query] = {"scan": scan_seconds, "index": index_seconds}
+
+    update_seconds = timed(index.update, df)
+    print(f"update with {new} new crashes {update_seconds:.2f}s (build {build_seconds:.2f}s)")
+    results["update"] = update_seconds
+    return results
+
+
+def benchmark_cube(cleaned_csv="data/CrashTestInfo_Cleaned.csv", rows=1_000_000, new=1_000, repeat=20):
+    """Compares analysis queries on the aggregate cube with pandas over every row.
+
+    The cleaned data is repeated up to `rows` crashes with distinct
+    UniqueIDs and classified once for the pandas side. Each query's answer
+    must equal the pandas one; the cube build, a reload from disk and an
+    update after `new` crashes were appended are timed as well.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from analysis import top_counts
+    from classifier import classify_crashes
+    from cube import CUBE_COLUMNS, CrashCube, survival_rates
+
+    real = pd.read_csv(cleaned_csv)
+    real["Year"] = pd.to_datetime(real["DateTime"]).dt.year
+    df = real.iloc[[i % len(real) for i in range(rows + new)]].reset_index(drop=True)
+    df["UniqueID"] = df["UniqueID"] + "-" + (df.index // len(real)).astype(str)
+    rows_df = df.iloc[:rows].copy()
+    rows_df["Crash_Category"] = classify_crashes(rows_df["Summary"]).to_numpy()
+    rows_df["Survival_Rate"] = survival_rates(rows_df["Total_Fatalities"], rows_df["Total_Aboard"])
+
+    def pandas_queries(frame):
+        return {
+            "crashes per year": frame["Year"].value_counts().sort_index(),
+            "fatalities per year": frame.groupby("Year")["Total_Fatalities"].sum(),
+            "top operators": top_counts(frame["Operator_Cleaned"]),
+            "top locations": top_counts(frame["Location_Cleaned"]),
+            "survival histogram": np.histogram(frame["Survival_Rate"], bins=20)[0],
+            "category trends": frame.groupby(["Year", "Crash_Category"])
+            .size()
+            .unstack()
+            .rolling(window=3, min_periods=1)
+            .mean(),
+        }
+
+    def cube_queries(cube, filters):
+        return {
+            "crashes per year": cube.crashes_per_year(**filters),
+            "fatalities per year": cube.fatalities_per_year(**filters),
+            "top operators": cube.top("operators", **filters),
+            "top locations": cube.top("locations", **filters),
+            "survival histogram": cube.survival_histogram(**filters)[0],
+            "category trends": cube.category_trends(**filters),
+        }
+
+    cube = CrashCube()
+    build_seconds = timed(cube.update, df.iloc[:rows][CUBE_COLUMNS])
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "crash_cube.npz")
+        save_seconds = timed(cube.save, path)
+        size = os.path.getsize(path)
+        load_seconds = timed(CrashCube.load, path)
+    print(f"{rows} crashes: build {build_seconds:.2f}s, save {save_seconds:.2f}s, "
+          f"load {load_seconds:.2f}s, {size / 1e6:.1f} MB, {cube.size} cells")
+
+    results = {"build": build_seconds, "load": load_seconds, "bytes": size, "cells": cube.size}
+    selections = {
+        "all crashes": ({}, None),
+        "1970s": ({"years": range(1970, 1980)}, rows_df["Year"].between(1970, 1979)),
+        "Aeroflot": ({"operators": ["Aeroflot"]}, rows_df["Operator_Cleaned"] == "Aeroflot"),
+    }
+    for selection, (filters, mask) in selections.items():
+        start = time.perf_counter()
+        for _ in range(repeat // 4 or 1):
+            expected = pandas_queries(rows_df if mask is None else rows_df[mask])
+        pandas_seconds = (time.perf_counter() - start) / (repeat // 4 or 1)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            answers = cube_queries(cube, filters)
+        cube_seconds = (time.perf_counter() - start) / repeat
+        for query, answer in answers.items():
+            reference = expected[query]
+            if isinstance(answer, pd.DataFrame):
+                pd.testing.assert_frame_equal(
+                    answer, reference, check_index_type=False, check_column_type=False, check_like=True
+                )
+            elif isinstance(answer, pd.Series):
+                pd.testing.assert_series_equal(
+                    answer, reference, check_dtype=False, check_index_type=False
+                )
+            elif not np.array_equal(answer, reference):
+                raise AssertionError(f"cube {query} for {selection} differs from pandas")
+        print(
+            f"{selection:12} {len(answers)} queries  pandas {pandas_seconds * 1000:8.1f} ms  "
+            f"cube {cube_seconds * 1000:6.2f} ms ({cube_seconds * 1000 / len(answers):.2f} ms per query)  "
+            f"{pandas_seconds / cube_seconds:7.1f}x"
+        )
+        results[selection] = {"pandas": pandas_seconds, "cube": cube_seconds}
+
+    update_seconds = timed(cube.update, df[CUBE_COLUMNS])
+    print(f"update with {new} new crashes {update_seconds:.2f}s (build {build_seconds:.2f}s)")
+    results["update"] = update_seconds
+    return results
+
+
+def benchmark_service(
+    cleaned_csv="data/CrashTestInfo_Cleaned.csv", rows=1_000_000, clients=32, requests=4_000
+):
+    """Loads `rows` crashes into the query service and has `clients` threads ask it questions.
+
+    The questions are drawn from a few hundred distinct ones, spelled in
+    different parameter orders so the cache has to normalize them. Compared
+    with reading the Parquet file and running basic_aggregates for a single
+    question; then 1000 crashes are changed and the first answer after that
+    (which reloads the file) is timed.
+    """
+    import random
+    import threading
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    import numpy as np
+    import pandas as pd
+
+    from analysis import basic_aggregates
+    from dataset import read_crash_data, write_crash_parquet
+    from service import CrashQueryService, make_server
+
+    real = pd.read_csv(cleaned_csv)
+    df = real.iloc[[i % len(real) for i in range(rows)]].reset_index(drop=True)
+    df["UniqueID"] = df["UniqueID"] + "-" + (df.index // len(real)).astype(str)
+    operators = real["Operator_Cleaned"].value_counts().index[:20].tolist()
+    rng = random.Random(0)
+    questions = []
+    for _ in range(300):
+        params = [("years", f"{start}-{start + 9}") for start in [rng.randrange(1920, 2000)]]
+        params += [("operator", name) for name in rng.sample(operators, rng.randrange(0, 3))]
+        question = rng.choice(["years", "top", "worst", "categories", "survival"])
+        if question == "top":
+            params.append(("by", rng.choice(["operators", "locations"])))
+        questions.append((question, params))
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "cleaned.parquet")
+        write_crash_parquet(df, path)
+        direct_seconds = timed(lambda: basic_aggregates(read_crash_data(path)))
+        start = time.perf_counter()
+        service = CrashQueryService(path, check_interval=0.5)
+        load_seconds = time.perf_counter() - start
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        def ask(number):
+            question, params = questions[number % len(questions)]
+            params = params[:]
+            random.Random(number).shuffle(params)
+            query = "&".join(f"{name}={urllib.request.quote(value)}" for name, value in params)
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"{base_url}/{question}?{query}") as response:
+                response.read()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            latencies = np.array(list(pool.map(ask, range(requests))))
+        total_seconds = time.perf_counter() - start
+        cache = service.cache.stats()
+
+        changed = df.copy()
+        changed.loc[: 999, "Total_Fatalities"] = changed.loc[: 999, "Total_Fatalities"] + 1
+        write_crash_parquet(changed, path)
+        time.sleep(service.check_interval)
+        reload_seconds = timed(ask, 0)
+        server.shutdown()
+        server.server_close()
+
+    print(f"{rows} crashes: service load {load_seconds:.2f}s, "
+          f"one read + basic_aggregates {direct_seconds:.2f}s")
+    print(
+        f"{requests} questions from {clients} clients in {total_seconds:.2f}s "
+        f"({requests / total_seconds:.0f}/s), latency p50 {np.median(latencies) * 1000:.1f} ms "
+        f"p99 {np.percentile(latencies, 99) * 1000:.1f} ms, "
+        f"cache {cache['hits']} hits {cache['misses']} misses"
+    )
+    print(f"first answer after 1000 crashes changed {reload_seconds:.2f}s")
+    return {
+        "load": load_seconds,
+        "direct": direct_seconds,
+        "per_second": requests / total_seconds,
+        "p50": float(np.median(latencies)),
+        "p99": float(np.percentile(latencies, 99)),
+        "reload": reload_seconds,
+    }
+
+
+def write_synthetic_raw_csv(path, rows, raw_csv="data/crashtestdummy.csv", chunk_rows=100_000):
+    """Writes `rows` raw crash rows (one per crash, like RecordSink) made by repeating the real ones."""
+    from scrubdata import load_raw_crash_data
+
+    real = load_raw_crash_data(raw_csv)
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        while written < rows:
+            count = min(chunk_rows, rows - written)
+            positions = [(written + i) % len(real) for i in range(count)]
+            real.iloc[positions].to_csv(file, index=False, header=written == 0)
+            written += count
+
+
+def benchmark_sharded(rows=1_000_000, processes=(2, 4), raw_csv="data/crashtestdummy.csv"):
+    """Times the serial scrub and classification against the sharded ones in worker processes.
+
+    Every sharded output must be byte-identical to the serial one, with
+    and without canonical names. Speedups are bounded by the CPUs there
+    are; the count is printed with the results.
+    """
+    import pandas as pd
+
+    from canonical import CanonicalNames
+    from classifier import classify_crashes
+    from scrubdata import scrub_crash_data
+
+    def outputs(path):
+        with open(path + ".csv", "rb") as file:
+            return file.read(), pd.read_parquet(path + ".parquet")
+
+    cpus = os.cpu_count() or 1
+    timings = {}
+    with tempfile.TemporaryDirectory() as folder:
+        raw = os.path.join(folder, "crashrecords.csv")
+        write_synthetic_raw_csv(raw, rows, raw_csv)
+        for canonical in (False, True):
+            label = "canonical" if canonical else "plain"
+            runs = {}
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                for workers in (1,) + tuple(processes):
+                    path = os.path.join(folder, f"{label}-{workers}")
+                    runs[workers] = timed(
+                        scrub_crash_data,
+                        raw,
+                        path + ".csv",
+                        parquet_path=path + ".parquet",
+                        canonical=CanonicalNames() if canonical else None,
+                        processes=workers,
+                    )
+            serial_csv, serial_parquet = outputs(os.path.join(folder, f"{label}-1"))
+            for workers in processes:
+                csv, parquet = outputs(os.path.join(folder, f"{label}-{workers}"))
+                if csv != serial_csv or not parquet.equals(serial_parquet):
+                    raise AssertionError(f"{label} scrub in {workers} processes differs from serial")
+            timings[f"scrub {label}"] = runs
+        summaries = pd.read_parquet(os.path.join(folder, "plain-1.parquet"), columns=["Summary"])["Summary"]
+
+    serial = classify_crashes(summaries)
+    runs = {}
+    for workers in (1,) + tuple(processes):
+        runs[workers] = timed(classify_crashes, summaries, processes=workers)
+        if workers > 1 and not classify_crashes(summaries, processes=workers).equals(serial):
+            raise AssertionError(f"classification in {workers} processes differs from serial")
+    timings["classify"] = runs
+
+    print(f"{rows} crashes on {cpus} CPUs (sharded outputs identical to serial)")
+    for name, runs in timings.items():
+        line = "  ".join(
+            f"{workers} proc {seconds:6.2f}s ({runs[1] / seconds:3.1f}x)" for workers, seconds in runs.items()
+        )
+        print(f"{name:16} {line}")
+    return timings
+
+
+def synthetic_site(pages, raw_csv="data/crashtestdummy.csv"):
+    """Returns a stand-in site with `pages` crash pages made by repeating the real crashes."""
+    from scrubdata import load_raw_crash_data
+
+    real = load_raw_crash_data(raw_csv).values.tolist()
+    return build_site([real[i % len(real)] for i in range(pages)])
+
+
+def discover_stage(base_url, folder):
+    from getdata import process_url_list, scrape_links
+
+    yearindex = os.path.join(folder, "yearindex.txt")
+    crashpages = os.path.join(folder, "crashpages.txt")
+    return lambda: (
+        scrape_links(base_url + "/database.htm", yearindex, "w"),
+        process_url_list(yearindex, crashpages, domain=base_url + "/"),
+    )
+
+
+def extract_stage(urls, output_csv):
+    from getdata import extract_plane_crash_data
+    from sink import RecordSink
+
+    def run():
+        with RecordSink(output_csv) as sink:
+            for url in urls:
+                extract_plane_crash_data(url, sink)
+
+    return run
+
+
+def crawl_stage(urls, output_csv):
+    from crawler import crawl_crash_pages
+
+    return lambda: crawl_crash_pages(urls, output_csv, rate=10_000, concurrency=8)
+
+
+def crawl_site_stage(base_url, output_csv):
+    from crawler import crawl_site
+
+    return lambda: crawl_site(base_url + "/database.htm", output_csv, rate=10_000, concurrency=8)
+
+
+def scrub_stage(raw_csv, cleaned_csv, chunksize):
+    from scrubdata import scrub_crash_data
+
+    return lambda: scrub_crash_data(raw_csv, cleaned_csv, chunksize=chunksize)
+
+
+def aggregate_stage(cleaned_csv):
+    from analysis import basic_aggregates
+
+    return lambda: basic_aggregates(cleaned_csv)
+
+
+def categorize_stage(cleaned_csv):
+    from classifier import classify_crashes
+    from dataset import read_crash_data
+
+    summaries = read_crash_data(cleaned_csv, columns=["Summary"])["Summary"]
+    return lambda: classify_crashes(summaries)
+
+
+def measure_stage(stage, args):
+    """Sets up a stage, then times it; runs in a fresh process so memory peaks don't mix.
+
+    Returns (seconds, memory in use before the timed part, peak memory during it).
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run = stage(*args)
+        reset_peak_memory()
+        before, _ = memory_usage()
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        _, peak = memory_usage()
+    return seconds, before, peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_pipeline(rows=10_000, pages=500, output="benchmark_results.jsonl", chunksize=None):
+    """Times every pipeline stage on synthetic data and appends the results to output.
+
+    rows is the number of crashes in the raw/cleaned CSVs (e.g. 10k, 1M, 10M);
+    pages is the number of crash pages the fetch stages download from a local
+    stand-in server (0 skips them). Scrubbing streams in chunks above 1M rows
+    unless chunksize is given. Each stage runs in its own process and reports
+    throughput, peak resident memory and how much of it the stage added
+    (the crawl's parser processes aren't counted).
+    """
+    if chunksize is None and rows > 1_000_000:
+        chunksize = 500_000
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "rows": rows,
+        "pages": pages,
+        "scrub_chunksize": chunksize,
+        "stages": [],
+    }
+
+    with tempfile.TemporaryDirectory() as folder:
+        raw_csv = os.path.join(folder, "crashrecords.csv")
+        cleaned_csv = os.path.join(folder, "cleaned.csv")
+        write_synthetic_raw_csv(raw_csv, rows)
+
+        stages = []
+        site = synthetic_site(pages) if pages else {}
+        with StandinServer(site) as server:
+            if pages:
+                urls = [server.url(path) for path in site if "-" in path.rsplit("/", 1)[-1]]
+                year_pages = sum(1 for path in site if "-" not in path.rsplit("/", 1)[-1])
+                stages += [
+                    ("scrape_links/process_url_list", discover_stage, (server.base_url, folder), year_pages, "pages"),
+                    ("extract_plane_crash_data", extract_stage, (urls, os.path.join(folder, "extract.csv")), len(urls), "pages"),
+                    ("crawl_crash_pages", crawl_stage, (urls, os.path.join(folder, "crawl.csv")), len(urls), "pages"),
+                    ("crawl_site (discover + crawl)", crawl_site_stage, (server.base_url, os.path.join(folder, "site.csv")), len(urls), "pages"),
+                ]
+            stages += [
+                ("scrub_crash_data", scrub_stage, (raw_csv, cleaned_csv, chunksize), rows, "rows"),
+                ("basic_analysis aggregation", aggregate_stage, (cleaned_csv,), rows, "rows"),
+                ("categorize_crash (batch)", categorize_stage, (cleaned_csv,), rows, "rows"),
+            ]
+
+            print(f"{rows} rows, {pages} pages")
+            for name, stage, args, items, unit in stages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    seconds, before, peak = pool.submit(measure_stage, stage, args).result()
+                result = {
+                    "stage": name,
+                    "items": items,
+                    "unit": unit,
+                    "seconds": round(seconds, 4),
+                    "per_second": round(items / seconds, 1),
+                    "peak_rss_mb": round(peak / 1e6, 1) if peak else None,
+                    "stage_rss_mb": round(max(peak - before, 0) / 1e6, 1) if peak else None,
+                }
+                record["stages"].append(result)
+                memory = (
+                    f"{result['peak_rss_mb']:8.1f} MB peak {result['stage_rss_mb']:8.1f} MB used"
+                    if peak
+                    else ""
+                )
+                print(
+                    f"{name:32} {seconds:8.2f}s {result['per_second']:12.0f} {unit}/s  {memory}"
+                )
+
+    with open(output, "a", encoding="utf-8") as file:
+        file.write(json.dumps(record) + "\n")
+    print(f"Results appended to {output}")
+    return record
+
+
+BENCHMARKS = {
+    "parsers": benchmark_parsers,
+    "scrub": benchmark_scrub,
+    "columnar": benchmark_columnar,
+    "loader": benchmark_loader,
+    "incremental": benchmark_incremental,
+    "sharded": benchmark_sharded,
+    "canonical": benchmark_canonical,
+    "classifier": benchmark_classifier,
+    "search": benchmark_search,
+    "cube": benchmark_cube,
+    "service": benchmark_service,
+    "backoff": benchmark_backoff,
+    "pipeline": benchmark_pipeline,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=10_000, help="pipeline: crashes in the CSVs")
+    parser.add_argument("--pages", type=int, default=500, help="pipeline: crash pages to fetch")
+    parser.add_argument("--chunksize", type=int, help="pipeline: scrub in chunks of this many rows")
+    parser.add_argument(
+        "--output", default="benchmark_results.jsonl", help="pipeline: JSON lines results file"
+    )
+    args = parser.parse_args()
+    if args.benchmark == "pipeline":
+        benchmark_pipeline(args.rows, args.pages, args.output, args.chunksize)
+    else:
+        BENCHMARKS[args.benchmark]()
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+Canonical Names for Plane Crash Dummy Project
+
+The same location, operator or aircraft type is spelled many ways on the
+site ("Near Moscow, Russia" / "Moscow,Russia", "Military -U.S. Navy" /
+"Military - US Navy", "AVIANCA" / "Avianca"), which splits their counts in
+the top-10 charts. A Canonicalizer maps every raw spelling to one canonical
+name. Each distinct raw value is worked out once and remembered, so a column
+is canonicalized with one dictionary lookup per distinct value and a numpy
+take for the rows.
+
+A value is first cleaned (spacing, "Near ", commas), then reduced to a
+fingerprint: case folded, accents and punctuation removed and, except for
+operators, words sorted. Values with the same fingerprint are one group and
+share a canonical name, the most common cleaned spelling when the group is
+first seen. Fuzzy matching joins a new fingerprint to a known one that
+differs by a typo in one word, if the known one has clearly more crashes.
+Bad results are corrected in two tables per column: aliases map spellings
+to a fixed name, and apart lists names fuzzy matching must never join.
+"""
+import json
+import os
+import re
+import unicodedata
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# bump when a clean function, the fingerprint or the saved format changes, so saved
+# dictionaries are rebuilt
+CANONICAL_VERSION = 3
+
+CANONICAL_PATH = "data/canonical.json"
+
+# shortest word fuzzy matching corrects; shorter words differ by one letter too often
+FUZZY_MIN_LENGTH = 7
+
+# how many times more crashes a known group needs before a new one a typo away joins
+# it; two names with a similar count ("Trondheim" / "Trontheim") are both taken as
+# they are, since either could be the misspelling
+FUZZY_DOMINANCE = 4
+
+# canonical name: spellings that mean it, compared by fingerprint
+OPERATOR_ALIASES = {
+    "Unknown Operator": ["?", "Unknown"],
+}
+LOCATION_ALIASES = {}
+AIRCRAFT_ALIASES = {}
+
+# names that are a typo apart but different, which fuzzy matching must not join
+OPERATOR_APART = [
+    ["Capital Airlines", "Capitol Airlines"],
+    ["Aerocon", "Aerocom"],
+    ["Tranair", "Transair", "Transfair"],
+]
+LOCATION_APART = []
+AIRCRAFT_APART = []
+
+
+def clean_location_text(location):
+    """Tidies a location: no "Near ", one space after each comma, no trailing punctuation."""
+    location = re.sub(r"\bnear\s+", "", location, flags=re.IGNORECASE)
+    location = re.sub(r"\s*,[\s,:;]*", ", ", location)
+    return " ".join(location.split()).strip(" ,;:")
+
+
+def clean_operator_text(operator):
+    """Tidies an operator: single spaces and " - " around a dash that stands between words."""
+    operator = re.sub(r"\s+-\s*|\s*-\s+", " - ", operator)
+    return " ".join(operator.split())
+
+
+def clean_aircraft_text(aircraft):
+    """Tidies an aircraft type: single spaces."""
+    return " ".join(aircraft.split())
+
+
+def fingerprint(text, sort_words=True):
+    """Returns the key two spellings of the same name have in common.
+
+    Case, accents, punctuation and (with sort_words) word order are ignored
+    ("U.S. Navy" and "US navy" are the same); repeated words are kept, so
+    "Aeroflot / Aeroflot" (a collision of two Aeroflot planes) stays its
+    own name.
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = re.sub(r"[^\w\s]|_", "", text).split()
+    return " ".join(sorted(words) if sort_words else words)
+
+
+def within_one_edit(a, b):
+    """True if a and b differ by one inserted, removed or replaced letter, or two swapped ones."""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    if len(a) == len(b):
+        if a[start + 1 :] == b[start + 1 :]:
+            return True
+        # neighbouring letters swapped
+        return a[start : start + 2] == b[start : start + 2][::-1] and a[start + 2 :] == b[start + 2 :]
+    longer, shorter = (a, b) if len(a) > len(b) else (b, a)
+    return longer[start + 1 :] == shorter[start:]
+
+
+class Canonicalizer:
+    """Maps raw values of one column to canonical names.
+
+    Args:
+        clean: Function tidying a raw string; its result is what a canonical
+            name looks like.
+        aliases: {canonical name: [spellings]}; matched by fingerprint
+            before anything else.
+        apart: Lists of names fuzzy matching never joins to each other,
+            compared by fingerprint.
+        fuzzy: Whether a new fingerprint joins a known group when they differ
+            in one word by one letter (see within_one_edit), e.g. "Seattle,
+            Washingon", and the known group has FUZZY_DOMINANCE times as
+            many crashes. Words with digits or shorter than FUZZY_MIN_LENGTH
+            letters are never corrected, so "Antonov An-24" stays apart
+            from "Antonov An-26" and "Air Niger" from "Air Nigeria".
+        sort_words: Whether word order is ignored; "Air Transport
+            Associates" and "Associated Air Transport" are different
+            operators.
+        cache_size: How many raw values are remembered; the least recently
+            used ones are dropped beyond that. Groups are never dropped, so a
+            value worked out again gets the same name, and neither is the
+            record of which values were counted, so its crashes aren't
+            counted twice.
+    """
+
+    def __init__(
+        self, clean, aliases=None, apart=None, fuzzy=True, sort_words=True, cache_size=100_000
+    ):
+        self.clean = clean
+        self.sort_words = sort_words
+        self.aliases = {
+            self.fingerprint(spelling): name
+            for name, spellings in (aliases or {}).items()
+            for spelling in [name] + list(spellings)
+        }
+        self.apart = {}  # fingerprint -> fingerprints it must not be joined to
+        for names in apart or []:
+            keys = {self.fingerprint(name) for name in names}
+            for key in keys:
+                self.apart.setdefault(key, set()).update(keys - {key})
+        self.fuzzy = fuzzy
+        self.cache_size = cache_size
+        self.forms = OrderedDict()  # raw value -> canonical name, least recently used first
+        self.groups = {}  # fingerprint -> canonical name
+        self.counts = {}  # fingerprint -> crashes learned with it
+        self.counted = set()  # raw values whose crashes are in counts
+        self.names = set(self.aliases.values())  # every canonical name handed out or fixed
+        self.blocks = {}  # fingerprint with one word left out -> [(that word, fingerprint)]
+        self.changed = False
+
+    def fingerprint(self, text):
+        return fingerprint(text, self.sort_words)
+
+    def rules(self):
+        """What the mapping depends on besides the clean function, as a JSON-able value."""
+        return {
+            "aliases": sorted(self.aliases.items()),
+            "apart": sorted((key, sorted(keys)) for key, keys in self.apart.items()),
+            "fuzzy": self.fuzzy,
+            "dominance": FUZZY_DOMINANCE,
+            "sort_words": self.sort_words,
+        }
+
+    def _fuzzy_words(self, key):
+        # (fingerprint with the word left out, word) for every word fuzzy matching may correct
+        words = key.split()
+        for position, word in enumerate(words):
+            if len(word) >= FUZZY_MIN_LENGTH and not any(char.isdigit() for char in word):
+                yield " ".join(words[:position] + ["*"] + words[position + 1 :]), word
+
+    def _add_group(self, key, name):
+        self.groups[key] = name
+        self.names.add(name)
+        if self.fuzzy:
+            for rest, word in self._fuzzy_words(key):
+                self.blocks.setdefault(rest, []).append((word, key))
+
+    def _close_group(self, key, amount):
+        # the known fingerprint with the most crashes that is one typo away from key
+        # and has FUZZY_DOMINANCE times its `amount` crashes
+        if not self.fuzzy:
+            return None
+        close = None
+        apart = self.apart.get(key, ())
+        for rest, word in self._fuzzy_words(key):
+            for known_word, known in self.blocks.get(rest, []):
+                if (
+                    known not in apart
+                    and self.counts.get(known, 0) >= FUZZY_DOMINANCE * amount
+                    and within_one_edit(word, known_word)
+                    and (close is None or self.counts[known] > self.counts[close])
+                ):
+                    close = known
+        return close
+
+    def _remember(self, value, name):
+        self.forms[value] = name
+        if len(self.forms) > self.cache_size:
+            self.forms.popitem(last=False)
+        self.changed = True
+
+    def learn(self, values, counts=None):
+        """Works out and remembers the canonical names of raw string values.
+
+        counts (how often each value occurs) decide which spelling names a
+        new group and whether it may join a known one. Of spellings with the
+        same count, one that is already a canonical name (or an alias) wins,
+        then the first one seen. Returns the names.
+        """
+        counts = [1] * len(values) if counts is None else counts
+        cleaned = [self.clean(value) for value in values]
+        keys = [self.fingerprint(text) for text in cleaned]
+
+        new_groups = {}  # fingerprint -> {cleaned spelling: count}, in order of appearance
+        for value, text, key, amount in zip(values, cleaned, keys, counts):
+            if key and key not in self.aliases and key not in self.groups:
+                spellings = new_groups.setdefault(key, {})
+                spellings[text] = spellings.get(text, 0) + int(amount)
+            if key and value not in self.counted:
+                self.counts[key] = self.counts.get(key, 0) + int(amount)
+        # common names first, so a rare misspelling joins them rather than the other way round
+        for key, spellings in sorted(new_groups.items(), key=lambda item: -sum(item[1].values())):
+            close = self._close_group(key, sum(spellings.values()))
+            if close is None:
+                name = max(spellings, key=lambda text: (spellings[text], text in self.names))
+                self._add_group(key, name)
+            else:
+                self._add_group(key, self.groups[close])
+        self.counted.update(values)
+
+        names = []
+        for value, text, key in zip(values, cleaned, keys):
+            if key in self.aliases:
+                name = self.aliases[key]
+            elif not key:
+                name = text  # nothing but punctuation, e.g. "?"
+            else:
+                name = self.groups[key]
+            self._remember(value, name)
+            names.append(name)
+        return names
+
+    def canonical(self, value):
+        """Returns the canonical name of one raw value."""
+        value = str(value)
+        if value in self.forms:
+            self.forms.move_to_end(value)
+            return self.forms[value]
+        return self.learn([value])[0]
+
+    def apply(self, column):
+        """Returns the canonical names of a column, working out each distinct value once.
+
+        Missing values are treated as the string "nan", like str() does.
+        """
+        codes, uniques = column.factorize(use_na_sentinel=False)
+        values = ["nan" if pd.isna(value) else str(value) for value in uniques]
+        names = [None] * len(values)
+        unknown = []
+        for position, value in enumerate(values):
+            if value in self.forms:
+                self.forms.move_to_end(value)
+                names[position] = self.forms[value]
+            else:
+                unknown.append(position)
+        if unknown:
+            counts = np.bincount(codes, minlength=len(values))
+            learned = self.learn([values[position] for position in unknown], counts[unknown])
+            for position, name in zip(unknown, learned):
+                names[position] = name
+        return pd.Series(
+            np.array(names, dtype=object)[codes], index=column.index, dtype=object
+        )
+
+    def to_json(self):
+        return {
+            "groups": self.groups,
+            "counts": self.counts,
+            "counted": sorted(self.counted),
+            "forms": list(self.forms.items()),
+        }
+
+    def load_json(self, data):
+        for key, name in data["groups"].items():
+            self._add_group(key, name)
+        self.counts = dict(data["counts"])
+        self.counted = set(data["counted"])
+        self.forms = OrderedDict((value, name) for value, name in data["forms"])
+
+
+class CanonicalNames:
+    """The location, operator and aircraft type Canonicalizers, kept in one JSON file.
+
+    The file is read when the object is made and written by save() (or
+    when a with block ends) if anything new was learned. It is ignored
+    when it was made with other rules or CANONICAL_VERSION. Without a path
+    the names are only kept in memory.
+    """
+
+    def __init__(self, path=None, cache_size=100_000, fuzzy=True):
+        self.path = path
+        self.location = Canonicalizer(
+            clean_location_text,
+            LOCATION_ALIASES,
+            LOCATION_APART,
+            fuzzy=fuzzy,
+            cache_size=cache_size,
+        )
+        self.operator = Canonicalizer(
+            clean_operator_text,
+            OPERATOR_ALIASES,
+            OPERATOR_APART,
+            fuzzy=fuzzy,
+            sort_words=False,  # "Service Air" and "Air Services" are different operators
+            cache_size=cache_size,
+        )
+        self.aircraft = Canonicalizer(
+            clean_aircraft_text,
+            AIRCRAFT_ALIASES,
+            AIRCRAFT_APART,
+            fuzzy=fuzzy,
+            cache_size=cache_size,
+        )
+        # a new id whenever the names start from scratch; scrub states remember it
+        self.id = uuid.uuid4().hex[:12]
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+            except (OSError, ValueError):
+                data = None  # an unreadable file just means the names are learned again
+            if data and data.get("rules") == self.rules():
+                self.id = data["id"]
+                for name, canonicalizer in self.canonicalizers().items():
+                    canonicalizer.load_json(data["columns"][name])
+
+    def canonicalizers(self):
+        return {"location": self.location, "operator": self.operator, "aircraft": self.aircraft}
+
+    def rules(self):
+        rules = {name: c.rules() for name, c in self.canonicalizers().items()}
+        # through JSON so it compares equal to the rules read back from the file
+        return json.loads(json.dumps({"version": CANONICAL_VERSION, **rules}))
+
+    def save(self):
+        canonicalizers = self.canonicalizers()
+        if not self.path or not any(c.changed for c in canonicalizers.values()):
+            return
+        data = {
+            "id": self.id,
+            "rules": self.rules(),
+            "columns": {name: c.to_json() for name, c in canonicalizers.items()},
+        }
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(self.path + ".tmp", self.path)
+        for canonicalizer in canonicalizers.values():
+            canonicalizer.changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Chart Rendering for Plane Crash Dummy Project
+
+Draws the analysis charts from precomputed aggregates, either in interactive
+windows or headless into image files, one worker process per chart.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# name: file name without extension; kind: "line", "bar" or "hist"
+# data: Series/DataFrame to plot, or (counts, bin_edges) for "hist"
+# options: figsize, xlabel, ylabel, legend_title
+Chart = namedtuple("Chart", ["name", "kind", "data", "title", "options"])
+
+
+def draw_chart(chart, fig):
+    """Draws a chart on an empty figure."""
+    ax = fig.subplots()
+    if chart.kind == "hist":
+        counts, edges = chart.data
+        ax.hist(edges[:-1], bins=edges, weights=counts, edgecolor="black")
+        ax.grid(True)
+        ax.set_title(chart.title)
+    else:
+        chart.data.plot(kind=chart.kind, title=chart.title, ax=ax)
+    if "xlabel" in chart.options:
+        ax.set_xlabel(chart.options["xlabel"])
+    if "ylabel" in chart.options:
+        ax.set_ylabel(chart.options["ylabel"])
+    if "legend_title" in chart.options:
+        ax.legend(title=chart.options["legend_title"])
+
+
+def show_charts(charts):
+    """Shows the charts one after another in interactive windows."""
+    import matplotlib.pyplot as plt
+
+    for chart in charts:
+        draw_chart(chart, plt.figure(figsize=chart.options.get("figsize")))
+        plt.show()
+
+
+def save_chart(chart, output_dir, image_format="png"):
+    """Draws a chart off-screen and saves it; returns the file path.
+
+    The figure is made without pyplot, so it is rendered by the
+    non-interactive Agg backend whatever backend pyplot is using.
+    """
+    from matplotlib.figure import Figure
+
+    path = os.path.join(output_dir, f"{chart.name}.{image_format}")
+    fig = Figure(figsize=chart.options.get("figsize"))
+    draw_chart(chart, fig)
+    fig.savefig(path, bbox_inches="tight")
+    return path
+
+
+def render_charts(charts, output_dir, image_format="png", processes=None):
+    """Saves every chart to output_dir, drawing them in parallel worker processes.
+
+    Returns the paths of the image files in chart order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if not charts:
+        return []
+    workers = min(len(charts), processes or os.cpu_count() or 1)
+    if workers == 1:
+        return [save_chart(chart, output_dir, image_format) for chart in charts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(save_chart, chart, output_dir, image_format) for chart in charts]
+        return [future.result() for future in futures]
+
+
+def output_charts(charts, output_dir=None, processes=None):
+    """Shows the charts interactively, or saves them to output_dir if one is given."""
+    if output_dir is None:
+        show_charts(charts)
+        return []
+    paths = render_charts(charts, output_dir, processes=processes)
+    for path in paths:
+        print(f"Chart saved: {path}")
+    return paths
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Crash Classifier for Plane Crash Dummy Project
+
+Sorts crash summaries into cause categories using a table of keyword rules.
+The first rule with a keyword in the lowercased summary wins, so the order
+of CRASH_RULES is the priority order.
+"""
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# (category, keywords) in priority order
+CRASH_RULES = [
+    ("Mid-Air Collision", ["collision", "midair", "crash into another"]),
+    ("Mechanical Failure", ["engine failure", "mechanical failure", "technical issue"]),
+    ("Weather-Related", ["weather", "storm", "turbulence"]),
+    ("Fire/Explosion", ["fire", "explosion", "smoke"]),
+    ("Pilot Error", ["pilot error", "loss of control", "incorrect maneuver"]),
+    ("Hijacking/Terrorism", ["hijacking", "terrorist", "bomb"]),
+    ("Shot Down (War/Conflict)", ["shot down", "missile", "military attack"]),
+    ("Takeoff/Landing Accident", ["runway", "takeoff", "landing"]),
+    ("Fuel Exhaustion", ["fuel exhaustion", "ran out of fuel"]),
+]
+DEFAULT_CATEGORY = "Other/Unknown"
+
+# summaries one worker process classifies at a time; smaller columns aren't worth a pool
+CLASSIFY_SHARD_ROWS = 100_000
+
+
+def keyword_pattern(keywords):
+    """Returns a regex matching any of the keywords as plain substrings."""
+    return "|".join(re.escape(keyword) for keyword in keywords)
+
+
+class CrashClassifier:
+    """Classifies crash summaries with a rule table like CRASH_RULES.
+
+    Whole columns are classified at once with combined keyword patterns:
+    one pattern for all rules finds the summaries that match any of them,
+    then the first matching rule is found by halving the rule range, so a
+    summary is scanned about log2(rules) more times instead of once per
+    rule. With pyarrow installed pandas runs the patterns in C++.
+    """
+
+    def __init__(self, rules=CRASH_RULES, default=DEFAULT_CATEGORY):
+        if not rules:
+            raise ValueError("CrashClassifier needs at least one rule")
+        for category, keywords in rules:
+            if not keywords:
+                raise ValueError(f"Rule {category!r} has no keywords")
+        self.rules = [(category, list(keywords)) for category, keywords in rules]
+        self.categories = [category for category, _ in self.rules]
+        self.default = default
+        self.patterns = [keyword_pattern(keywords) for _, keywords in self.rules]
+        self.range_patterns = {}
+
+    def range_pattern(self, start, stop):
+        """Returns the pattern matching any keyword of rules[start:stop]."""
+        if (start, stop) not in self.range_patterns:
+            keywords = [keyword for _, words in self.rules[start:stop] for keyword in words]
+            self.range_patterns[start, stop] = keyword_pattern(dict.fromkeys(keywords))
+        return self.range_patterns[start, stop]
+
+    def _first_rule(self, texts, positions, start, stop, codes):
+        # every text matches one of rules[start:stop]; store the first one in codes
+        if texts.empty:
+            return
+        if stop - start == 1:
+            codes[positions] = start
+            return
+        middle = (start + stop) // 2
+        hits = texts.str.contains(self.range_pattern(start, middle)).to_numpy(dtype=bool)
+        self._first_rule(texts[hits], positions[hits], start, middle, codes)
+        self._first_rule(texts[~hits], positions[~hits], middle, stop, codes)
+
+    def categorize(self, summary):
+        """Returns the category of a single summary."""
+        summary = str(summary).lower()
+        for category, keywords in self.rules:
+            if any(keyword in summary for keyword in keywords):
+                return category
+        return self.default
+
+    def classify(self, summaries, multi_label=False, processes=None):
+        """Classifies a column of crash summaries in one call.
+
+        Args:
+            summaries: A Series (its index is kept) or any iterable of summaries.
+            multi_label: Return every matching category instead of the first.
+            processes: With more than one, columns longer than
+                CLASSIFY_SHARD_ROWS are classified in shards by that many
+                worker processes; the result is the same.
+
+        Returns:
+            A Series with the first matching category of every summary, or with
+            multi_label a boolean DataFrame with one column per category (in
+            priority order, then the default category for summaries that
+            matched no rule).
+        """
+        index = summaries.index if isinstance(summaries, pd.Series) else None
+        values = np.asarray(summaries, dtype=object)
+        if processes and processes > 1 and len(values) > CLASSIFY_SHARD_ROWS:
+            shards = [
+                values[start : start + CLASSIFY_SHARD_ROWS]
+                for start in range(0, len(values), CLASSIFY_SHARD_ROWS)
+            ]
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                parts = list(pool.map(self.classify, shards, [multi_label] * len(shards)))
+            result = pd.concat(parts, ignore_index=True)
+            result.index = index if index is not None else pd.RangeIndex(len(values))
+            return result
+
+        # same text categorize sees: missing summaries become "nan"
+        texts = pd.Series([str(summary).lower() for summary in values], dtype="str")
+        any_rule = self.range_pattern(0, len(self.rules))
+        candidates = np.flatnonzero(texts.str.contains(any_rule).to_numpy(dtype=bool))
+        candidate_texts = texts.iloc[candidates]
+
+        if multi_label:
+            labels = np.zeros((len(texts), len(self.categories) + 1), dtype=bool)
+            for column, pattern in enumerate(self.patterns):
+                hits = candidate_texts.str.contains(pattern).to_numpy(dtype=bool)
+                labels[candidates[hits], column] = True
+            labels[:, -1] = ~labels[:, :-1].any(axis=1)
+            return pd.DataFrame(
+                labels,
+                index=index if index is not None else pd.RangeIndex(len(texts)),
+                columns=self.categories + [self.default],
+            )
+
+        codes = np.full(len(texts), len(self.categories))
+        self._first_rule(candidate_texts, candidates, 0, len(self.rules), codes)
+        names = np.array(self.categories + [self.default], dtype=object)
+        return pd.Series(names[codes], index=index, name="Crash_Category")
+
+
+# classifier for the built-in rule table
+crash_classifier = CrashClassifier()
+
+
+def classify_crashes(summaries, multi_label=False, processes=None):
+    """Classifies a column of crash summaries with CRASH_RULES; see CrashClassifier.classify."""
+    return crash_classifier.classify(summaries, multi_label=multi_label, processes=processes)
@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent Crawler for Plane Crash Dummy Project
+https://www.planecrashinfo.com/database.htm
+
+Fetches crash pages over a pooled keep-alive session with a bounded number of
+connections and a requests-per-second token bucket, and hands every page to
+the table extraction in getdata. crawl_site also discovers the crash pages
+from the year pages and streams them straight into the extraction.
+"""
+import asyncio
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from urllib.parse import urljoin
+
+import aiohttp
+
+from archive import conditional_headers
+from getdata import HEADERS, crash_page_url, extract_links, is_crash_page_link
+from manifest import DONE, FAILED, content_hash
+from metrics import count, record_request
+from retry import DEFAULT_POLICY, RETRY_STATUSES, backoff_delay, retry_after_seconds
+from sink import RecordSink
+from tableparser import extract_crash_record
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` requests per second in bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        # the lock keeps waiters in FIFO order so nobody starves
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class AdaptiveLimit:
+    """Async concurrency limit that adapts to how the server copes (AIMD).
+
+    Every healthy response raises the limit by 1/limit, so about one more
+    request in flight per round of requests, up to `maximum`. A pushback
+    (429/5xx, timeout or connection error) halves it, at least to `minimum`.
+    Only requests started after the last cut can cut it again, so one burst
+    of errors from the same round halves the limit once instead of once per
+    error.
+    """
+
+    def __init__(self, maximum, initial=None, minimum=1, decrease=0.5):
+        if maximum < minimum:
+            raise ValueError("maximum must be at least minimum")
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.limit = float(min(maximum, initial or maximum))
+        self.active = 0
+        self.generation = 0  # counts the cuts
+        self.cuts = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        """Waits for a free slot; returns a token to hand back to release."""
+        while self.active >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+        self.active += 1
+        return self.generation
+
+    def release(self, token, pushback=False):
+        """Frees the slot taken with acquire and adjusts the limit to the response."""
+        self.active -= 1
+        if not pushback:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        elif token == self.generation:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self.generation += 1
+            self.cuts += 1
+        for _ in range(int(self.limit) - self.active):
+            while self._waiters and self._waiters[0].done():
+                self._waiters.popleft()
+            if not self._waiters:
+                break
+            self._waiters.popleft().set_result(None)
+
+
+async def get_page(session, url, headers, bucket, limit=None, timeout=None):
+    """GETs a URL once within the rate and concurrency limits; returns (response, body).
+
+    Timeouts and connection errors are raised; the limit is told whether
+    the server pushed back.
+    """
+    await bucket.acquire()
+    token = await limit.acquire() if limit is not None else None
+    pushback = True
+    try:
+        async with session.get(
+            url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            body = await response.read()
+        pushback = response.status in RETRY_STATUSES
+        return response, body
+    finally:
+        if limit is not None:
+            limit.release(token, pushback)
+
+
+async def fetch_page(session, url, bucket, archive=None, limit=None, policy=DEFAULT_POLICY):
+    """Fetches one page once the rate limiter allows it and returns its text.
+
+    With a PageArchive, archived pages are served from it (or revalidated when
+    the archive was opened with revalidate=True) and downloads are archived.
+    Timeouts, connection errors and 429/5xx answers are retried as the
+    RetryPolicy says, honouring Retry-After. Every fetch is recorded with
+    record_request.
+    """
+    page = archive.get(url) if archive is not None else None
+    if page is not None and not archive.revalidate:
+        record_request(url, page.status, 0, source="archive")
+        return page.body
+
+    headers = dict(HEADERS)
+    headers.update(conditional_headers(page))
+    for attempt in range(policy.retries + 1):
+        start = time.perf_counter()
+        try:
+            response, body = await get_page(session, url, headers, bucket, limit, policy.timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = str(e) or type(e).__name__
+            if attempt == policy.retries:
+                record_request(url, None, time.perf_counter() - start, retries=attempt, error=error)
+                raise
+            print(f"Retrying {url} after error: {error}")
+            await asyncio.sleep(backoff_delay(policy, attempt))
+            continue
+        if response.status not in RETRY_STATUSES or attempt == policy.retries:
+            break
+        retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+        print(f"Retrying {url} after status {response.status}")
+        await asyncio.sleep(backoff_delay(policy, attempt, retry_after))
+    seconds = time.perf_counter() - start
+
+    if page is not None and response.status == 304:
+        record_request(url, 304, seconds, retries=attempt, source="not_modified")
+        return page.body  # not modified since it was archived
+    try:
+        response.raise_for_status()  # Raise an error for failed requests
+    except aiohttp.ClientResponseError as e:
+        record_request(url, response.status, seconds, retries=attempt, error=str(e))
+        raise
+    html = await response.text()  # decodes the body get_page read
+    record_request(url, response.status, seconds, len(body), attempt)
+
+    if archive is not None:
+        archive.put(
+            url,
+            html,
+            status=response.status,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+    return html
+
+
+def open_session(concurrency):
+    """Returns an aiohttp session with one pooled keep-alive connector of `concurrency` connections."""
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector)
+
+
+def rate_limiter(rate, concurrency):
+    return TokenBucket(rate, capacity=max(1, min(concurrency, int(rate))))
+
+
+async def crawl(
+    urls,
+    handle_page,
+    rate=2.0,
+    concurrency=8,
+    archive=None,
+    handle_error=None,
+    session=None,
+    bucket=None,
+    limit=None,
+    policy=DEFAULT_POLICY,
+    max_concurrency=None,
+):
+    """Fetches every URL concurrently and calls handle_page(url, html) in input order.
+
+    urls can be a list or an (async) iterator that is still discovering URLs;
+    fetching starts with the first one. Pages that fail to download are
+    reported, passed to handle_error(url, error) and then on to handle_page as
+    None so the output keeps the same order as a sequential crawl. A session,
+    rate limiter and AdaptiveLimit can be shared with other fetches, e.g. the
+    discovery feeding urls. Concurrency starts at `concurrency` and adapts
+    between 1 and max_concurrency (default: concurrency) to how the server
+    copes. Returns the number of URLs crawled.
+    """
+    if limit is None:
+        limit = AdaptiveLimit(max_concurrency or concurrency, initial=concurrency)
+    if session is None:
+        async with open_session(limit.maximum) as session:
+            return await crawl(
+                urls,
+                handle_page,
+                rate,
+                concurrency,
+                archive,
+                handle_error,
+                session=session,
+                bucket=bucket,
+                limit=limit,
+                policy=policy,
+            )
+    if bucket is None:
+        bucket = rate_limiter(rate, limit.maximum)
+    concurrency = limit.maximum  # one worker per slot the limit can grow to
+    # bounded, so discovery only runs a little ahead of the downloads
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+
+    # completed pages wait here until every page before them is done
+    queued = []
+    finished = {}
+    next_index = 0
+
+    def release():
+        nonlocal next_index
+        while next_index in finished:
+            html = finished.pop(next_index)
+            handle_page(queued[next_index], html)
+            next_index += 1
+
+    async def feed():
+        try:
+            if hasattr(urls, "__aiter__"):
+                async for url in urls:
+                    queued.append(url)
+                    await queue.put((len(queued) - 1, url))
+            else:
+                for url in urls:
+                    queued.append(url)
+                    await queue.put((len(queued) - 1, url))
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)  # one stop signal per worker
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            index, url = item
+            try:
+                finished[index] = await fetch_page(session, url, bucket, archive, limit, policy)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error fetching data from {url}: {e}")
+                if handle_error is not None:
+                    handle_error(url, e)
+                finished[index] = None
+            release()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await asyncio.gather(feed(), *workers)
+    return len(queued)
+
+
+# links on the database page that lead to a year page, e.g. /1976/1976.htm
+YEAR_PAGE_LINK = re.compile(r"/?\d{4}/\d{4}\.htm")
+
+
+async def discover_crash_urls(
+    session,
+    bucket,
+    database_url,
+    archive=None,
+    window=8,
+    snapshot=None,
+    limit=None,
+    policy=DEFAULT_POLICY,
+):
+    """Yields the URL of every crash page on the site while the year pages are still coming in.
+
+    The year pages linked from the database page are fetched `window` at a
+    time and read in order. Their links go through the same filter and
+    absolute URL rules as filter_lines and fix_urls, and every URL is yielded
+    once. With snapshot, the URLs are also written to that file (like
+    crashurls.txt).
+    """
+
+    def fetch(url):
+        return asyncio.ensure_future(fetch_page(session, url, bucket, archive, limit, policy))
+
+    html = await fetch(database_url)
+    domain = urljoin(database_url, "/")
+    year_urls = list(
+        dict.fromkeys(
+            urljoin(database_url, link.strip())
+            for link in extract_links(html)
+            if YEAR_PAGE_LINK.fullmatch(link.strip())
+        )
+    )
+
+    seen = set()
+    fetching = deque()
+    upcoming = iter(year_urls)
+    snapshot_file = open(snapshot, "w", encoding="utf-8") if snapshot else None
+    try:
+        for url in islice(upcoming, window):
+            fetching.append((url, fetch(url)))
+        while fetching:
+            year_url, task = fetching.popleft()
+            for url in islice(upcoming, 1):
+                fetching.append((url, fetch(url)))
+            try:
+                year_html = await task
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error fetching the URL {year_url}: {e}")
+                continue
+
+            for link in extract_links(year_html):
+                link = link.strip()
+                if len(link) < 4 or not is_crash_page_link(link):
+                    continue
+                url = crash_page_url(link, domain)
+                if url in seen:
+                    continue
+                seen.add(url)
+                if snapshot_file is not None:
+                    snapshot_file.write(url + "\n")
+                yield url
+    finally:
+        for _, task in fetching:
+            task.cancel()
+        if snapshot_file is not None:
+            snapshot_file.close()
+    print(f"Discovered {len(seen)} crash pages on {len(year_urls)} year pages")
+
+
+def crawl_crash_pages(
+    urls,
+    output_csv,
+    rate=2.0,
+    concurrency=8,
+    archive=None,
+    manifest=None,
+    processes=None,
+    max_concurrency=None,
+    policy=DEFAULT_POLICY,
+):
+    """Extracts plane crash data from a list of URLs concurrently and appends it to a CSV file.
+
+    Pages are fetched on the event loop and parsed in a process pool, so the
+    parsing cost is spread over every core while downloads continue. Records
+    are written in batches by a RecordSink, one row per crash.
+
+    Args:
+        urls: The crash page URLs to fetch.
+        output_csv: The raw CSV file the crash records are appended to.
+        rate: Maximum number of requests per second sent to the site.
+        concurrency: Number of requests in flight to start with.
+        archive: Optional PageArchive pages are read from and saved to.
+        manifest: Optional CrawlManifest; URLs it marks as done are skipped and
+            every outcome is recorded, so an interrupted crawl can be resumed.
+        processes: Number of parser processes (defaults to the number of CPUs).
+        max_concurrency: Most requests in flight while the server answers
+            well (defaults to concurrency); see AdaptiveLimit.
+        policy: RetryPolicy with the request timeout and retry backoff.
+    """
+    urls = list(urls)
+    if manifest is not None:
+        total = len(urls)
+        urls = manifest.pending(urls)
+        print(f"{total - len(urls)} of {total} pages already done, {len(urls)} to crawl")
+    return _crawl_to_csv(
+        lambda session, bucket, limit: urls,
+        output_csv,
+        rate,
+        concurrency,
+        archive,
+        manifest,
+        processes,
+        max_concurrency,
+        policy,
+    )
+
+
+def crawl_site(
+    database_url,
+    output_csv,
+    rate=2.0,
+    concurrency=8,
+    archive=None,
+    manifest=None,
+    processes=None,
+    snapshot=None,
+    max_concurrency=None,
+    policy=DEFAULT_POLICY,
+):
+    """Finds every crash page from the database page and extracts them in one streaming pass.
+
+    Crash pages are downloaded as soon as their year page has been read,
+    while the other year pages are still being fetched; no link files are
+    needed in between. Takes the same arguments as crawl_crash_pages, plus
+    an optional snapshot file the discovered crash URLs are written to.
+    """
+    skipped = 0
+
+    async def pending(urls):
+        nonlocal skipped
+        async for url in urls:
+            if manifest.is_done(url):
+                skipped += 1
+            else:
+                yield url
+
+    def discover(session, bucket, limit):
+        urls = discover_crash_urls(
+            session, bucket, database_url, archive, concurrency, snapshot, limit, policy
+        )
+        return urls if manifest is None else pending(urls)
+
+    try:
+        written = _crawl_to_csv(
+            discover,
+            output_csv,
+            rate,
+            concurrency,
+            archive,
+            manifest,
+            processes,
+            max_concurrency,
+            policy,
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Error fetching the URL {database_url}: {e}")
+        return 0
+    if manifest is not None:
+        print(f"{skipped} pages were already done")
+    return written
+
+
+def _crawl_to_csv(
+    make_urls, output_csv, rate, concurrency, archive, manifest, processes, max_concurrency, policy
+):
+    # make_urls(session, bucket, limit) returns the URLs to crawl, as a list or async iterator
+    # pages being parsed, in input order: (url, content hash, future)
+    parsing = deque()
+
+    def mark_done(keys):
+        # only called once the rows are on disk, so a crash never loses a "done" page
+        if manifest is not None:
+            for url, page_hash in keys:
+                manifest.record(url, DONE, 200, page_hash)
+
+    def write_parsed(wait):
+        while parsing and (wait or parsing[0][2].done()):
+            url, page_hash, future = parsing.popleft()
+            try:
+                record = future.result()
+            except IndexError:
+                print(f"Error: No table found on the page {url}.")
+                if manifest is not None:
+                    manifest.record(url, FAILED, 200)
+                continue
+            sink.append(record, key=(url, page_hash))
+
+    def handle_page(url, html):
+        if html is None:
+            return
+        parsing.append((url, content_hash(html), pool.submit(extract_crash_record, html)))
+        write_parsed(wait=False)
+
+    def handle_error(url, error):
+        if manifest is not None:
+            manifest.record(url, FAILED, getattr(error, "status", None))
+
+    limit = AdaptiveLimit(max_concurrency or concurrency, initial=concurrency)
+
+    async def run():
+        async with open_session(limit.maximum) as session:
+            bucket = rate_limiter(rate, limit.maximum)
+            return await crawl(
+                make_urls(session, bucket, limit),
+                handle_page,
+                archive=archive,
+                handle_error=handle_error,
+                session=session,
+                bucket=bucket,
+                limit=limit,
+                policy=policy,
+            )
+
+    start = time.perf_counter()
+    sink = RecordSink(output_csv, on_flush=mark_done)
+    with sink, ProcessPoolExecutor(max_workers=processes) as pool:
+        crawled = asyncio.run(run())
+        write_parsed(wait=True)
+    elapsed = time.perf_counter() - start
+    count("rows_in", crawled)
+    count("rows_out", sink.written)
+    print(f"Saved {sink.written} of {crawled} pages to {output_csv} in {elapsed:.1f}s")
+    if limit.cuts:
+        print(f"Server pushed back {limit.cuts} times; concurrency ended at {int(limit.limit)}")
+    return sink.written
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+"""
+Aggregate Cube for Plane Crash Dummy Project
+
+Precomputed crash counts, fatality and aboard sums per year, crash
+category, operator, location and survival rate, so the numbers behind
+basic_analysis and summarize_crashes (with any filter on those dimensions)
+come from a few thousand cells instead of every crash. Examples:
+    python cube.py
+    python cube.py --years 1970-1979 --operator Aeroflot
+    python cube.py --category "Weather-Related" --top 5
+
+Every distinct (year, category, operator, location, survival rate) is one
+cell. The survival rate is a dimension rather than a measure, so survival
+histograms over any filter bin the same values basic_analysis would. The
+cube is saved to one .npz file together with a ledger of every crash's
+cell and content hash; updating it classifies and adds only the new and
+changed crashes and subtracts the changed and removed ones.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from classifier import crash_classifier
+from dataset import content_hashes, crash_occurrences, load_crash_data, match_crashes
+from metrics import count
+
+CUBE_PATH = "data/crash_cube.npz"
+CUBE_FORMAT = 2
+
+# ledger entries worst_rows() checks at a time
+WORST_CHUNK = 4096
+
+CUBE_COLUMNS = [
+    "UniqueID",
+    "Year",
+    "Location_Cleaned",
+    "Operator_Cleaned",
+    "Total_Aboard",
+    "Total_Fatalities",
+    "Summary",
+]
+
+
+def survival_rates(fatalities, aboard):
+    """Survival rate of every crash in percent, 0 where nobody was aboard (as in basic_analysis)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = (1 - np.asarray(fatalities, dtype=np.float64) / np.asarray(aboard, dtype=np.float64)) * 100
+    rates[~np.isfinite(rates)] = 0
+    return rates
+
+
+class CrashCube:
+    """Crash counts, fatalities and people aboard per cell of the crash dimensions.
+
+    Build or refresh it with update(), query it with crashes_per_year(),
+    fatalities_per_year(), aboard_per_year(), top(), worst_rows(),
+    survival_histogram() and category_counts(), and keep it with save() / CrashCube.load().
+    Every query takes the same filters: years, categories, operators and
+    locations (each a list of accepted values, or None for all).
+    """
+
+    def __init__(self, classifier=crash_classifier):
+        self.classifier = classifier
+        # names of the coded dimensions, in the order they were first seen
+        self.categories = []
+        self.operators = []
+        self.locations = []
+        self.codes = {"categories": {}, "operators": {}, "locations": {}}
+        # cells
+        self.cell_ids = {}  # (year, category, operator, location, rate) -> cell
+        self.cell_years = np.empty(0, dtype=np.int16)  # -1 for crashes without a date
+        self.cell_categories = np.empty(0, dtype=np.int32)
+        self.cell_operators = np.empty(0, dtype=np.int32)
+        self.cell_locations = np.empty(0, dtype=np.int32)
+        self.cell_rates = np.empty(0, dtype=np.float64)
+        self.crashes = np.empty(0, dtype=np.int64)
+        self.fatalities = np.empty(0, dtype=np.int64)
+        self.aboard = np.empty(0, dtype=np.int64)
+        # ledger: one entry per crash, in dataset order
+        self.uids = np.empty(0, dtype=object)
+        self.occurrences = np.empty(0, dtype=np.int32)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.row_cells = np.empty(0, dtype=np.int64)
+        self.row_fatalities = np.empty(0, dtype=np.int64)
+        self.row_aboard = np.empty(0, dtype=np.int64)
+        self.by_fatalities = None  # ledger positions, most fatalities first; made by worst_rows
+        self.sorted_names = {}  # dimension -> (names as an array, codes in name order); made by top
+        self.rollups = {}  # answers to unfiltered queries, kept until the next update
+
+    def rules(self):
+        """The classifier rules the categories come from, as a JSON string."""
+        return json.dumps([self.classifier.rules, self.classifier.default])
+
+    @property
+    def size(self):
+        return len(self.crashes)
+
+    @property
+    def total(self):
+        return int(self.crashes.sum())
+
+    def _codes(self, dimension, values):
+        # codes of a column's values, new values numbered in order of appearance
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna("nan"))
+        known = self.codes[dimension]
+        names = getattr(self, dimension)
+        lookup = np.empty(len(uniques), dtype=np.int32)
+        for position, name in enumerate(uniques):
+            if name not in known:
+                known[name] = len(names)
+                names.append(name)
+            lookup[position] = known[name]
+        return lookup[codes]
+
+    def _cells(self, years, categories, operators, locations, rates):
+        # the cell of every crash, making the cells that don't exist yet
+        keys = pd.DataFrame(
+            {"y": years, "c": categories, "o": operators, "l": locations, "r": rates}
+        )
+        groups = keys.groupby(list(keys), sort=False).ngroup().to_numpy()
+        distinct = keys.drop_duplicates()
+        cells = np.empty(len(distinct), dtype=np.int64)
+        new = []
+        for position, key in enumerate(distinct.itertuples(index=False, name=None)):
+            cell = self.cell_ids.get(key)
+            if cell is None:
+                cell = self.cell_ids[key] = self.size + len(new)
+                new.append(position)
+            cells[position] = cell
+        if new:
+            new_keys = distinct.iloc[new]
+            self.cell_years = np.concatenate([self.cell_years, new_keys["y"].to_numpy(np.int16)])
+            self.cell_categories = np.concatenate([self.cell_categories, new_keys["c"].to_numpy(np.int32)])
+            self.cell_operators = np.concatenate([self.cell_operators, new_keys["o"].to_numpy(np.int32)])
+            self.cell_locations = np.concatenate([self.cell_locations, new_keys["l"].to_numpy(np.int32)])
+            self.cell_rates = np.concatenate([self.cell_rates, new_keys["r"].to_numpy(np.float64)])
+            zeros = np.zeros(len(new), dtype=np.int64)
+            self.crashes = np.concatenate([self.crashes, zeros])
+            self.fatalities = np.concatenate([self.fatalities, zeros])
+            self.aboard = np.concatenate([self.aboard, zeros])
+        return cells[groups]
+
+    def _tally(self, cells, fatalities, aboard, sign):
+        # adds (sign 1) or subtracts (sign -1) crashes from their cells
+        size = self.size
+        self.crashes += sign * np.bincount(cells, minlength=size)
+        self.fatalities += sign * np.bincount(cells, fatalities, size).round().astype(np.int64)
+        self.aboard += sign * np.bincount(cells, aboard, size).round().astype(np.int64)
+
+    def update(self, df):
+        """Brings the cube in line with the crashes in df (CUBE_COLUMNS).
+
+        Crashes are matched with the ledger by UniqueID and occurrence, as
+        in the summary index; only new crashes and crashes whose content
+        changed are classified and added, and changed or removed ones are
+        subtracted from their cells. Returns (added, removed) counts.
+        """
+        df = df[CUBE_COLUMNS].reset_index(drop=True)
+        uids = df["UniqueID"].astype(object).to_numpy()
+        occurrences = crash_occurrences(uids)
+        years = df["Year"].astype("Int64").fillna(-1).to_numpy(dtype=np.int64)
+        fatalities = df["Total_Fatalities"].to_numpy(dtype=np.int64)
+        aboard = df["Total_Aboard"].to_numpy(dtype=np.int64)
+        hashes = content_hashes(
+            {
+                "year": years,
+                "location": df["Location_Cleaned"],
+                "operator": df["Operator_Cleaned"],
+                "fatalities": fatalities,
+                "aboard": aboard,
+                "summary": df["Summary"],
+            }
+        )
+
+        rows = match_crashes(self.uids, self.occurrences, uids, occurrences)
+        found = rows >= 0
+        unchanged = found.copy()
+        unchanged[found] = self.hashes[rows[found]] == hashes[found]
+        kept = np.zeros(len(self.uids), dtype=bool)
+        kept[rows[unchanged]] = True
+        removed = np.flatnonzero(~kept)
+        added = np.flatnonzero(~unchanged)
+
+        self._tally(self.row_cells[removed], self.row_fatalities[removed], self.row_aboard[removed], -1)
+        row_cells = np.empty(len(df), dtype=np.int64)
+        row_cells[unchanged] = self.row_cells[rows[unchanged]]
+        if len(added):
+            new = df.iloc[added]
+            categories = self.classifier.classify(new["Summary"]).to_numpy()
+            row_cells[added] = self._cells(
+                years[added],
+                self._codes("categories", categories),
+                self._codes("operators", new["Operator_Cleaned"]),
+                self._codes("locations", new["Location_Cleaned"]),
+                survival_rates(fatalities[added], aboard[added]),
+            )
+            self._tally(row_cells[added], fatalities[added], aboard[added], 1)
+
+        self.uids = uids
+        self.occurrences = occurrences.astype(np.int32)
+        self.hashes = hashes
+        self.row_cells = row_cells
+        self.row_fatalities = fatalities
+        self.row_aboard = aboard
+        self.by_fatalities = None
+        self.rollups = {}
+        return len(added), len(removed)
+
+    # querying
+
+    def cells(self, years=None, categories=None, operators=None, locations=None):
+        """Returns which cells hold crashes from the years, categories, operators and locations asked for."""
+        mask = self.crashes > 0
+        if years is not None:
+            mask &= np.isin(self.cell_years, list(years))
+        for values, dimension, cell_codes in [
+            (categories, "categories", self.cell_categories),
+            (operators, "operators", self.cell_operators),
+            (locations, "locations", self.cell_locations),
+        ]:
+            if values is not None:
+                codes = [self.codes[dimension][name] for name in values if name in self.codes[dimension]]
+                mask &= np.isin(cell_codes, codes)
+        return mask
+
+    def _per_year(self, measure, name, filters):
+        mask = self.cells(**filters) & (self.cell_years >= 0)
+        years = self.cell_years[mask].astype(np.int64)
+        first = years.min() if len(years) else 0
+        totals = np.bincount(years - first, measure[mask])
+        present = np.bincount(years - first, self.crashes[mask]) > 0
+        index = pd.Index(np.flatnonzero(present) + first, name="Year")
+        return pd.Series(totals[present].round().astype(np.int64), index=index, name=name)
+
+    def crashes_per_year(self, **filters):
+        """Crashes per year, like df["Year"].value_counts().sort_index()."""
+        return self._per_year(self.crashes, "count", filters)
+
+    def fatalities_per_year(self, **filters):
+        """Fatalities per year, like df.groupby("Year")["Total_Fatalities"].sum()."""
+        return self._per_year(self.fatalities, "Total_Fatalities", filters)
+
+    def aboard_per_year(self, **filters):
+        """People aboard per year, like df.groupby("Year")["Total_Aboard"].sum()."""
+        return self._per_year(self.aboard, "Total_Aboard", filters)
+
+    def _names(self, dimension):
+        # (names of a dimension as an array, their codes sorted by name); names are only ever added
+        names = getattr(self, dimension)
+        cached = self.sorted_names.get(dimension)
+        if cached is None or len(cached[0]) != len(names):
+            array = np.array(names, dtype=object)
+            cached = self.sorted_names[dimension] = (array, np.argsort(array, kind="stable"))
+        return cached
+
+    def _ranking(self, dimension, filters):
+        # (codes with crashes, most crashes first and ties by name; crashes per code)
+        names, by_name = self._names(dimension)
+        mask = self.cells(**filters)
+        cell_codes = self.cell_operators if dimension == "operators" else self.cell_locations
+        counts = np.bincount(cell_codes[mask], self.crashes[mask], len(names)).astype(np.int64)
+        ranked = counts[by_name]
+        present = np.flatnonzero(ranked)
+        return by_name[present[np.argsort(-ranked[present], kind="stable")]], counts
+
+    def top(self, dimension, n=10, **filters):
+        """The n operators or locations with the most crashes, like analysis.top_counts.
+
+        dimension is "operators" or "locations"; ties are broken by name.
+        Without filters the ranking is computed once per update.
+        """
+        if all(values is None for values in filters.values()):
+            key = ("top", dimension)
+            if key not in self.rollups:
+                self.rollups[key] = self._ranking(dimension, filters)
+            order, counts = self.rollups[key]
+        else:
+            order, counts = self._ranking(dimension, filters)
+        order = order[:n]
+        column = "Operator_Cleaned" if dimension == "operators" else "Location_Cleaned"
+        index = pd.Index(self._names(dimension)[0][order], name=column)
+        return pd.Series(counts[order], index=index, name="count")
+
+    def worst_rows(self, n=10, **filters):
+        """Positions of the n crashes with the most fatalities in the data last given to update().
+
+        Ties are in dataset order, as with nlargest(n, "Total_Fatalities").
+        Crashes are checked from the worst down, so this is fast unless the
+        filters leave only a few crashes.
+        """
+        if self.by_fatalities is None:
+            self.by_fatalities = np.argsort(-self.row_fatalities, kind="stable")
+        mask = self.cells(**filters)
+        found = []
+        total = 0
+        for start in range(0, len(self.by_fatalities), WORST_CHUNK):
+            rows = self.by_fatalities[start : start + WORST_CHUNK]
+            rows = rows[mask[self.row_cells[rows]]]
+            found.append(rows)
+            total += len(rows)
+            if total >= n:
+                break
+        return np.concatenate(found)[:n] if found else np.empty(0, dtype=np.int64)
+
+    def survival_histogram(self, bins=20, **filters):
+        """(counts, bin edges) of the survival rates, like np.histogram(rates, bins)."""
+        mask = self.cells(**filters)
+        counts, edges = np.histogram(self.cell_rates[mask], bins=bins, weights=self.crashes[mask])
+        return counts.round().astype(np.int64), edges
+
+    def _category_table(self, filters):
+        # (years, category names, crashes per year and category), categories sorted by name
+        unfiltered = all(values is None for values in filters.values())
+        if unfiltered and "categories" in self.rollups:
+            years, names, table = self.rollups["categories"]
+            return years, names, table.copy()
+        mask = self.cells(**filters) & (self.cell_years >= 0)
+        cell_years = self.cell_years[mask].astype(np.int64)
+        first = cell_years.min() if len(cell_years) else 0
+        span = cell_years.max() - first + 1 if len(cell_years) else 0
+        names, by_name = self._names("categories")
+        table = np.bincount(
+            (cell_years - first) * len(names) + self.cell_categories[mask],
+            self.crashes[mask],
+            span * len(names),
+        ).reshape(span, len(names))[:, by_name]
+        # only the years and categories that have crashes
+        years = np.flatnonzero(table.any(axis=1))
+        present = np.flatnonzero(table.any(axis=0))
+        years, names, table = years + first, names[by_name][present], table[np.ix_(years, present)]
+        if unfiltered:
+            self.rollups["categories"] = (years, names, table.copy())
+        return years, names, table
+
+    def _category_frame(self, years, names, table):
+        return pd.DataFrame(
+            table,
+            index=pd.Index(years.astype(np.int64), name="Year"),
+            columns=pd.Index(names, name="Crash_Category"),
+        )
+
+    def category_counts(self, **filters):
+        """Crashes per year (rows) and category (columns), like groupby(["Year", "Crash_Category"]).size().unstack()."""
+        years, names, table = self._category_table(filters)
+        table[table == 0] = np.nan
+        return self._category_frame(years, names, table)
+
+    def category_trends(self, window=3, **filters):
+        """category_counts smoothed like rolling(window, min_periods=1).mean(), as summarize_crashes plots them."""
+        years, names, table = self._category_table(filters)
+        # sums and numbers of years with crashes over the last `window` rows
+        sums = np.cumsum(np.vstack([np.zeros((1, len(names))), table]), axis=0)
+        seen = np.cumsum(np.vstack([np.zeros((1, len(names))), table > 0]), axis=0)
+        start = np.maximum(np.arange(len(years)) - window + 1, 0)
+        stop = np.arange(1, len(years) + 1)
+        with np.errstate(invalid="ignore"):
+            means = (sums[stop] - sums[start]) / (seen[stop] - seen[start])
+        return self._category_frame(years, names, means)
+
+    def basic_aggregates(self, **filters):
+        """What analysis.basic_aggregates computes, apart from the worst crashes."""
+        return {
+            "crash_counts": self.crashes_per_year(**filters),
+            "fatalities_per_year": self.fatalities_per_year(**filters),
+            "top_locations": self.top("locations", **filters),
+            "top_operators": self.top("operators", **filters),
+            "survival_histogram": self.survival_histogram(**filters),
+        }
+
+    # storage
+
+    def save(self, path=CUBE_PATH):
+        """Writes the cube to an .npz file, replacing the old one only once it is complete."""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            np.savez(
+                file,
+                format=np.array(CUBE_FORMAT),
+                rules=np.array(self.rules()),
+                categories=np.array(self.categories, dtype=str),
+                operators=np.array(self.operators, dtype=str),
+                locations=np.array(self.locations, dtype=str),
+                cell_years=self.cell_years,
+                cell_categories=self.cell_categories,
+                cell_operators=self.cell_operators,
+                cell_locations=self.cell_locations,
+                cell_rates=self.cell_rates,
+                crashes=self.crashes,
+                fatalities=self.fatalities,
+                aboard=self.aboard,
+                uids=self.uids.astype(bytes),
+                occurrences=self.occurrences,
+                hashes=self.hashes,
+                row_cells=self.row_cells,
+                row_fatalities=self.row_fatalities,
+                row_aboard=self.row_aboard,
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=CUBE_PATH, classifier=crash_classifier):
+        """Reads a cube written by save(); an empty cube if there is none or it is outdated.
+
+        A cube made with other classifier rules is outdated too, as its
+        categories would be wrong.
+        """
+        cube = cls(classifier)
+        if not os.path.exists(path):
+            return cube
+        with np.load(path) as data:
+            if int(data["format"]) != CUBE_FORMAT or str(data["rules"]) != cube.rules():
+                return cube
+            for dimension in ["categories", "operators", "locations"]:
+                names = data[dimension].tolist()
+                setattr(cube, dimension, names)
+                cube.codes[dimension] = {name: code for code, name in enumerate(names)}
+            for name in [
+                "cell_years",
+                "cell_categories",
+                "cell_operators",
+                "cell_locations",
+                "cell_rates",
+                "crashes",
+                "fatalities",
+                "aboard",
+                "occurrences",
+                "hashes",
+                "row_cells",
+                "row_fatalities",
+                "row_aboard",
+            ]:
+                setattr(cube, name, data[name])
+            cube.uids = data["uids"].astype(str).astype(object)
+        keys = zip(
+            cube.cell_years.tolist(),
+            cube.cell_categories.tolist(),
+            cube.cell_operators.tolist(),
+            cube.cell_locations.tolist(),
+            cube.cell_rates.tolist(),
+        )
+        cube.cell_ids = {key: cell for cell, key in enumerate(keys)}
+        return cube
+
+
+def update_crash_cube(source, path=CUBE_PATH):
+    """Builds or refreshes the aggregate cube saved at path from the cleaned crash data."""
+    df = load_crash_data(source, columns=CUBE_COLUMNS)
+    count("rows_in", len(df))
+    cube = CrashCube.load(path)
+    added, removed = cube.update(df)
+    cube.save(path)
+    count("rows_out", added)
+    print(f"Cubed {added} crashes, {removed} removed ({cube.total} crashes in {cube.size} cells)")
+    print(f"Cube saved successfully: {path}")
+    return cube
+
+
+if __name__ == "__main__":
+    from search import parse_years
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cube", default=CUBE_PATH, help="cube file")
+    parser.add_argument("--years", type=parse_years, help="a year or range, e.g. 1970-1999")
+    parser.add_argument("--category", action="append", help="only this category (repeatable)")
+    parser.add_argument("--operator", action="append", help="only this operator (repeatable)")
+    parser.add_argument("--location", action="append", help="only this location (repeatable)")
+    parser.add_argument("--top", type=int, default=10, help="how many operators and locations to show")
+    args = parser.parse_args()
+
+    cube = CrashCube.load(args.cube)
+    if not cube.size:
+        parser.error(f"no cube at {args.cube}; run python main.py cube first")
+    filters = {
+        "years": args.years,
+        "categories": args.category,
+        "operators": args.operator,
+        "locations": args.location,
+    }
+    per_year = pd.DataFrame(
+        {
+            "crashes": cube.crashes_per_year(**filters),
+            "fatalities": cube.fatalities_per_year(**filters),
+            "aboard": cube.aboard_per_year(**filters),
+        }
+    )
+    print(per_year.to_string())
+    print(cube.top("operators", args.top, **filters).to_string())
+    print(cube.top("locations", args.top, **filters).to_string())
+    print(cube.category_counts(**filters).sum().astype(int).to_string())
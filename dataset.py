@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Cleaned Dataset Storage for Plane Crash Dummy Project
+
+Writes the scrubbed crash data as a typed, year-partitioned Parquet file
+and reads the cleaned data back (from Parquet or CSV) with only the columns
+an analysis needs. load_crash_data keeps what it has read in a per-process
+cache so back-to-back analyses parse the file once.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from manifest import file_digest, file_signature
+
+# columns written to the cleaned dataset
+SCRUBBED_COLUMNS = [
+    "UniqueID",
+    "DateTime",
+    "Location_Cleaned",
+    "Operator_Cleaned",
+    "Flight #",
+    "Route",
+    "Aircraft Type",
+    "Registration",
+    "Total_Aboard",
+    "Passengers_Aboard",
+    "Crew_Aboard",
+    "Total_Fatalities",
+    "Passengers_Fatalities",
+    "Crew_Fatalities",
+    "Summary",
+]
+
+# aboard / fatality counts are stored as small unsigned ints
+COUNT_COLUMNS = [
+    "Total_Aboard",
+    "Passengers_Aboard",
+    "Crew_Aboard",
+    "Total_Fatalities",
+    "Passengers_Fatalities",
+    "Crew_Fatalities",
+]
+COUNT_DTYPE = "uint16"
+
+# low-cardinality text columns; Parquet dictionary-encodes them on disk and
+# they are read back as categoricals
+CATEGORY_COLUMNS = ["Location_Cleaned", "Operator_Cleaned", "Aircraft Type"]
+
+
+def is_parquet(path):
+    """True for a Parquet file written by write_crash_parquet."""
+    return str(path).endswith(".parquet")
+
+
+def to_typed_frame(df_scrubbed, categories=True):
+    """Returns the scrubbed crash data with compact dtypes and a Year column.
+
+    With categories=False the CATEGORY_COLUMNS stay plain strings; Parquet
+    dictionary-encodes them itself.
+    """
+    df = df_scrubbed.copy()
+    df["DateTime"] = pd.to_datetime(df["DateTime"])
+    for column in COUNT_COLUMNS:
+        counts = df[column]
+        if len(counts) and (counts.min() < 0 or counts.max() > 65535):
+            raise ValueError(f"{column} has counts that don't fit in {COUNT_DTYPE}")
+        df[column] = counts.astype(COUNT_DTYPE)
+    if categories:
+        for column in CATEGORY_COLUMNS:
+            df[column] = df[column].astype("category")
+    df["Year"] = df["DateTime"].dt.year.astype("Int16")
+    return df
+
+
+def crash_parquet_schema():
+    import pyarrow as pa
+
+    types = {"DateTime": pa.timestamp("us"), "Year": pa.int16()}
+    types.update({column: pa.uint16() for column in COUNT_COLUMNS})
+    return pa.schema(
+        [(column, types.get(column, pa.string())) for column in SCRUBBED_COLUMNS + ["Year"]]
+    )
+
+
+class CrashParquetWriter:
+    """Writes scrubbed crash data to one Parquet file partitioned by year (needs pyarrow).
+
+    Every year gets its own row groups, so readers filtering on Year skip
+    the other years using the row group statistics. One file is used rather
+    than a directory per year: the dataset has over a hundred years with a
+    few dozen crashes each, and opening that many small files costs more
+    than reading the data. The file is written next to path and moved into
+    place on close, so readers never see a half-written dataset.
+    """
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.temp_path = path + ".tmp"
+        self.schema = crash_parquet_schema()
+        self.writer = pq.ParquetWriter(self.temp_path, self.schema, compression="zstd")
+
+    def write(self, df_scrubbed):
+        import pyarrow as pa
+
+        df = to_typed_frame(df_scrubbed, categories=False)
+        # one row group per year; crashes without a date go into their own group
+        for _, group in df.groupby("Year", sort=True, dropna=False):
+            table = pa.Table.from_pandas(group, schema=self.schema, preserve_index=False)
+            self.writer.write_table(table, row_group_size=len(group))
+
+    def write_row_group(self, table):
+        """Writes a row group read from another crash Parquet file as it is."""
+        self.writer.write_table(table, row_group_size=table.num_rows)
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.writer.close()
+            os.remove(self.temp_path)
+
+
+def write_crash_parquet(df_scrubbed, path):
+    """Writes scrubbed crash data as a typed Parquet file partitioned by year."""
+    with CrashParquetWriter(path) as writer:
+        writer.write(df_scrubbed)
+
+
+def update_crash_parquet(path, added=None, replaced=None):
+    """Rewrites a crash Parquet file with some crashes replaced and new ones added.
+
+    Args:
+        path: A Parquet file written by write_crash_parquet.
+        added: Scrubbed crashes to add after the crashes of their year.
+        replaced: Scrubbed crashes with an extra Occurrence column; each one
+            replaces the Occurrence-th crash (from 0, in file order) with its
+            UniqueID.
+
+    Row groups of the years that don't change are copied without decoding
+    them, so the cost mostly depends on how many years the change touches.
+    """
+    import pyarrow.parquet as pq
+
+    changes = [df for df in (added, replaced) if df is not None and len(df)]
+    if not changes:
+        return
+    years = set()
+    for df in changes:
+        years.update(int(year) for year in pd.to_datetime(df["DateTime"]).dt.year.dropna().unique())
+        if pd.to_datetime(df["DateTime"]).isna().any():
+            years.add(None)
+    if added is not None and len(added):
+        added_years = pd.to_datetime(added["DateTime"]).dt.year.to_numpy()
+    source = pq.ParquetFile(path)
+    groups = {}  # year -> row group numbers in file order
+    for number in range(source.num_row_groups):
+        year = source.read_row_group(number, columns=["Year"]).column(0)[0].as_py()
+        groups.setdefault(year, []).append(number)
+
+    # crashes without a date last, like the groupby in CrashParquetWriter.write
+    order = sorted(set(groups) | years, key=lambda year: (year is None, year or 0))
+    with CrashParquetWriter(path) as writer:
+        for year in order:
+            if year not in years:
+                for number in groups[year]:
+                    writer.write_row_group(source.read_row_group(number))
+                continue
+            df = pd.concat(
+                [source.read_row_group(number).to_pandas() for number in groups.get(year, [])]
+                or [pd.DataFrame(columns=SCRUBBED_COLUMNS)],
+                ignore_index=True,
+            )[SCRUBBED_COLUMNS]
+            if replaced is not None and len(replaced):
+                occurrence = df.groupby("UniqueID", sort=False).cumcount()
+                rows = {
+                    (uid, int(n)): position
+                    for position, (uid, n) in enumerate(zip(replaced["UniqueID"], replaced["Occurrence"]))
+                }
+                positions = pd.Series(
+                    [rows.get(key) for key in zip(df["UniqueID"], occurrence)], dtype="Int64"
+                )
+                hits = positions.notna().to_numpy()
+                if hits.any():
+                    new_rows = to_typed_frame(
+                        replaced.iloc[positions[hits].to_numpy(dtype=int)][SCRUBBED_COLUMNS],
+                        categories=False,
+                    )
+                    df = df.copy()
+                    for column in SCRUBBED_COLUMNS:
+                        df.loc[hits, column] = new_rows[column].to_numpy()
+            if added is not None and len(added):
+                in_year = np.isnan(added_years) if year is None else added_years == year
+                df = pd.concat([df, added[in_year][SCRUBBED_COLUMNS]], ignore_index=True)
+            writer.write(df)
+
+
+def read_crash_data(path, columns=None, years=None):
+    """Reads the cleaned crash data from a CSV file or a Parquet file.
+
+    Args:
+        path: CrashTestInfo_Cleaned.csv or the .parquet file written by
+            write_crash_parquet.
+        columns: Only read these columns (Year can always be asked for).
+        years: Only read crashes from these years; from Parquet only the
+            matching year partitions are read.
+
+    Returns:
+        A DataFrame with DateTime parsed as datetime and a Year column.
+    """
+    wanted = list(dict.fromkeys(columns)) if columns is not None else None
+    # Year is always derived from DateTime, never read from the file
+    read = [column for column in (wanted or SCRUBBED_COLUMNS) if column != "Year"]
+    if (years is not None or "Year" in (wanted or [])) and "DateTime" not in read:
+        read.append("DateTime")
+
+    if is_parquet(path):
+        filters = [("Year", "in", list(years))] if years is not None else None
+        df = pd.read_parquet(
+            path,
+            columns=read,
+            filters=filters,
+            read_dictionary=[column for column in CATEGORY_COLUMNS if column in read],
+        )
+    else:
+        df = pd.read_csv(path, usecols=read)
+
+    if "DateTime" in df.columns:
+        # make sure the DateTime column is datetime
+        df["DateTime"] = pd.to_datetime(df["DateTime"])
+        # make a column for the year
+        df["Year"] = df["DateTime"].dt.year
+
+    if years is not None and not is_parquet(path):
+        df = df[df["Year"].isin(list(years))].reset_index(drop=True)
+
+    if wanted is not None:
+        df = df[wanted]
+    return df
+
+
+# per-process cache of cleaned datasets: absolute path -> _CachedDataset
+_dataset_cache = {}
+_dataset_cache_lock = threading.Lock()
+
+
+class _CachedDataset:
+    def __init__(self, signature, digest):
+        self.signature = signature
+        self.digest = digest
+        self.frame = None
+
+
+def with_derived_columns(df):
+    """Returns df with DateTime parsed and a Year column, copying only if something is missing."""
+    if "DateTime" not in df.columns:
+        return df
+    parsed = pd.api.types.is_datetime64_any_dtype(df["DateTime"])
+    if parsed and "Year" in df.columns:
+        return df
+    df = df.copy(deep=False)
+    if not parsed:
+        df["DateTime"] = pd.to_datetime(df["DateTime"])
+    df["Year"] = df["DateTime"].dt.year
+    return df
+
+
+def _cached_crash_data(path, columns):
+    key = os.path.abspath(path)
+    with _dataset_cache_lock:
+        signature = file_signature(path)
+        entry = _dataset_cache.get(key)
+        if entry is not None and entry.signature != signature:
+            # touched or rewritten; only reload if the contents really changed
+            digest = file_digest(path)
+            if digest == entry.digest:
+                entry.signature = signature
+            else:
+                entry = None
+        if entry is None:
+            entry = _CachedDataset(signature, file_digest(path))
+            _dataset_cache[key] = entry
+
+        cached = entry.frame.columns if entry.frame is not None else []
+        missing = [column for column in columns if column not in cached]
+        if missing:
+            # rows come back in file order, so new columns line up with the cached ones
+            frame = read_crash_data(path, columns=missing)
+            if entry.frame is not None:
+                frame = pd.concat(
+                    [entry.frame, frame.drop(columns=[c for c in frame if c in cached])],
+                    axis=1,
+                )
+            entry.frame = frame
+        return entry.frame
+
+
+def load_crash_data(source, columns=None, years=None):
+    """Returns the cleaned crash data from a path or a preloaded DataFrame.
+
+    Paths are read with read_crash_data and memoized per process: each column
+    is read at most once, and the cache for a file is dropped when its
+    mtime/size change and its content hash no longer matches. The returned
+    frame can be modified freely without touching the cache.
+
+    Args:
+        source: CrashTestInfo_Cleaned.csv, the .parquet file, or a DataFrame
+            that has already been loaded.
+        columns: Only return these columns (all of them by default).
+        years: Only return crashes from these years.
+
+    Returns:
+        A DataFrame with DateTime parsed as datetime and a Year column.
+    """
+    if isinstance(source, pd.DataFrame):
+        df = with_derived_columns(source)
+        wanted = list(df.columns)
+    else:
+        wanted = SCRUBBED_COLUMNS + ["Year"]
+        needed = wanted if columns is None else list(columns)
+        if years is not None:
+            needed = needed + ["Year"]
+        df = _cached_crash_data(source, list(dict.fromkeys(needed)))
+
+    if years is not None:
+        df = df[df["Year"].isin(list(years))].reset_index(drop=True)
+    # a new frame, so callers adding or changing columns leave the cache alone
+    return df[list(dict.fromkeys(columns if columns is not None else wanted))]
+
+
+def crash_occurrences(uids):
+    """Returns how many crashes with the same UniqueID come before each crash.
+
+    A few distinct crashes share a UniqueID (same date and location), so a
+    crash is identified by its UniqueID and this number.
+    """
+    return pd.Series(uids).groupby(uids, sort=False).cumcount().to_numpy()
+
+
+def match_crashes(known_uids, known_occurrences, uids, occurrences):
+    """Returns the position of every crash among the known ones, or -1 for new crashes."""
+    known = len(known_uids)
+    if (
+        known <= len(uids)
+        and (known_uids == uids[:known]).all()
+        and (known_occurrences == occurrences[:known]).all()
+    ):
+        # crashes were only appended (or changed in place), the usual case
+        positions = np.full(len(uids), -1, dtype=np.int64)
+        positions[:known] = np.arange(known)
+        return positions
+    stored = pd.DataFrame(
+        {"UniqueID": known_uids, "Occurrence": known_occurrences, "position": np.arange(known)}
+    )
+    current = pd.DataFrame({"UniqueID": uids, "Occurrence": occurrences})
+    positions = current.merge(stored, how="left", on=["UniqueID", "Occurrence"])["position"]
+    return positions.fillna(-1).to_numpy(dtype=np.int64, copy=True)
+
+
+def content_hashes(columns):
+    """Returns one number per crash that changes when any of its values in columns changes.
+
+    columns maps names to equally long columns; text columns may be
+    strings, categoricals or objects, numbers must not be missing.
+    """
+    combined = None
+    for values in columns.values():
+        if isinstance(values, pd.Series) and not pd.api.types.is_numeric_dtype(values):
+            values = values.astype(object).fillna("").to_numpy()
+        hashed = pd.util.hash_array(np.asarray(values))
+        combined = hashed if combined is None else combined * np.uint64(1099511628211) ^ hashed
+    return combined
+
+
+def clear_crash_data_cache():
+    """Forgets every dataset load_crash_data has cached."""
+    with _dataset_cache_lock:
+        _dataset_cache.clear()
@@ -5,10 +5,18 @@ https://www.planecrashinfo.com/database.htm
 Created on Thu May 15 14:37:31 2025
 @author: Ansley Ingram
 """
-import os
+import re
+import time
+
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
+from archive import conditional_headers
+from manifest import DONE, FAILED, content_hash
+from metrics import debug, record_request
+from retry import DEFAULT_POLICY, RETRY_STATUSES, backoff_delay, retry_after_seconds
+from sink import RecordSink
+from tableparser import extract_crash_record
 
 # Fake a real browser's User-Agent to avoid bot detection
 HEADERS = {
@@ -17,19 +25,89 @@ HEADERS = {
     "Referer": "https://www.google.com",  # Some sites check referer headers
 }
 
-def scrape_links(url, outfile, mode):
-    """Fetches hyperlinks from a given URL while avoiding bot detection."""
+def get_with_retries(url, session=None, headers=None, policy=DEFAULT_POLICY):
+    """GETs a URL, retrying timeouts, connection errors and 429/5xx answers.
+
+    Waits between attempts as the RetryPolicy says, honouring Retry-After.
+    Returns (response, retries, seconds of the last attempt); the response of
+    the last attempt is returned even if it still has an error status, and
+    the last connection error is raised if every attempt failed.
+    """
+    for attempt in range(policy.retries + 1):
+        start = time.perf_counter()
+        try:
+            response = (session or requests).get(url, headers=headers, timeout=policy.timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == policy.retries:
+                record_request(url, None, time.perf_counter() - start, retries=attempt, error=str(e))
+                raise
+            print(f"Retrying {url} after error: {e}")
+            time.sleep(backoff_delay(policy, attempt))
+            continue
+        if response.status_code not in RETRY_STATUSES or attempt == policy.retries:
+            return response, attempt, time.perf_counter() - start
+        retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+        print(f"Retrying {url} after status {response.status_code}")
+        time.sleep(backoff_delay(policy, attempt, retry_after))
+
+def fetch_html(url, archive=None, session=None, headers=None, policy=DEFAULT_POLICY):
+    """Returns the HTML of a page, going through a PageArchive when one is given.
+
+    Archived pages are served without touching the network unless the archive
+    was opened with revalidate=True, in which case the server is asked whether
+    the page changed and only a changed page is downloaded and archived again.
+    Transient failures are retried with get_with_retries.
+    """
+    page = archive.get(url) if archive is not None else None
+    if page is not None and not archive.revalidate:
+        record_request(url, page.status, 0, source="archive")
+        return page.body
+
+    request_headers = dict(headers or {})
+    request_headers.update(conditional_headers(page))
+    response, retries, seconds = get_with_retries(url, session, request_headers, policy)
+    if page is not None and response.status_code == 304:
+        record_request(url, 304, seconds, retries=retries, source="not_modified")
+        return page.body  # not modified since it was archived
+    record_request(url, response.status_code, seconds, len(response.content), retries)
+    response.raise_for_status()  # Check for HTTP errors
+
+    if archive is not None:
+        archive.put(
+            url,
+            response.text,
+            status=response.status_code,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+    return response.text
+
+def extract_links(html):
+    """Returns the href of every link on a page."""
+    # Parse the HTML content
+    soup = BeautifulSoup(html, "html.parser")
+    # Extract all anchor tags with href attributes
+    return [a["href"] for a in soup.find_all("a", href=True)]
+
+def is_crash_page_link(link):
+    # all individual crash pages start with the year (e.g. 1920 - 2025)
+    return link[:1] in ("1", "2")
+
+def crash_page_url(link, domain="https://www.planecrashinfo.com/"):
+    """Makes a crash page link from a year page (e.g. 1976-1.htm) absolute."""
+    return f"{domain}{link[:4]}/{link}"
+
+def scrape_links(url, outfile, mode, archive=None):
+    """Fetches hyperlinks from a given URL while avoiding bot detection.
+
+    Returns the list of links, or None if the page could not be fetched.
+    """
     # mode is w for overwrite or a for append
     try:
         session = requests.Session()
-        response = session.get(url, headers=HEADERS)
-        response.raise_for_status()  # Check for HTTP errors
-        session.cookies.update(response.cookies)
+        html = fetch_html(url, archive, session=session, headers=HEADERS)
 
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, "html.parser")
-        # Extract all anchor tags with href attributes
-        links = [a["href"] for a in soup.find_all("a", href=True)]
+        links = extract_links(html)
 
         # Save links to a file
         with open(outfile, mode, encoding="utf-8") as file:
@@ -37,22 +115,48 @@ def scrape_links(url, outfile, mode):
                 file.write(link + "\n")
 
         print(f"Extracted {len(links)} links and saved to {outfile}")
+        return links
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching the URL: {e}")
-        
-def process_url_list(input_file, output_file):
-    """Reads a list of URLs from a file and extracts links from each."""
+        return None
+
+# entries of the year index that are a year page, e.g. /1976/1976.htm or 1976/
+YEAR_PAGE_ENTRY = re.compile(r"/?(\d{4})(?:/(?:\d{4}\.htm)?)?")
+
+
+def page_year(url):
+    """Returns the year of a year index entry, or None for anything else (e.g. index.html)."""
+    match = YEAR_PAGE_ENTRY.fullmatch(url)
+    return int(match.group(1)) if match else None
+
+
+def process_url_list(
+    input_file, output_file, archive=None, manifest=None, domain="http://www.planecrashinfo.com/"
+):
+    """Reads a list of URLs from a file and extracts links from each.
+
+    With a CrawlManifest, year pages that were already processed are skipped,
+    except the newest year which keeps getting new crashes.
+    """
     try:
         with open(input_file, "r", encoding="utf-8") as file:
             urls = [line.strip() for line in file if line.strip()]
 
-        domain = "http://www.planecrashinfo.com/"
+        years = [year for year in map(page_year, urls) if year is not None]
+        newest = max(years) if years else None
 
+        processed = 0
         for url in urls:
-            scrape_links(domain + url, output_file, "a")
+            newest_year = page_year(url) == newest
+            if manifest is not None and not newest_year and manifest.is_done(domain + url):
+                continue
+            links = scrape_links(domain + url, output_file, "a", archive)
+            processed += 1
+            if manifest is not None:
+                manifest.record(domain + url, DONE if links is not None else FAILED)
 
-        print(f"Finished processing {len(urls)} URLs.")
+        print(f"Finished processing {processed} of {len(urls)} URLs.")
 
     except FileNotFoundError:
         print(f"File {input_file} not found.")
@@ -65,7 +169,7 @@ def filter_lines(input_file, output_file):
 
         # Keep only lines that start with '1' or '2'
         filtered_lines = [
-            line for line in lines if line.strip() and line[0] in ("1", "2")
+            line for line in lines if line.strip() and is_crash_page_link(line)
         ]
 
         with open(output_file, "w", encoding="utf-8") as outfile:
@@ -78,7 +182,7 @@ def filter_lines(input_file, output_file):
     except FileNotFoundError:
         print(f"File {input_file} not found.")
 
-def fix_urls(file_path, output_path):
+def fix_urls(file_path, output_path, domain="https://www.planecrashinfo.com/"):
     with open(file_path, "r") as file:
         lines = file.readlines()
 
@@ -86,60 +190,78 @@ def fix_urls(file_path, output_path):
         for line in lines:
             line = line.strip()  # Remove leading/trailing whitespace
             if len(line) >= 4:
-                modified_line = f"https://www.planecrashinfo.com/{line[:4]}/{line}"
+                modified_line = crash_page_url(line, domain)
                 file.write(modified_line + "\n")
                 
-def extract_plane_crash_data(url, output_csv):
-    """Extracts plane crash data from a given URL and saves it to a CSV file."""
-    try:
-        # Send request to the webpage
-        reqs = requests.get(url)
-        reqs.raise_for_status()  # Raise an error for failed requests
+def parse_crash_table(html):
+    """Parses the first table of a crash page into a label row and a value row.
+
+    This is the original BeautifulSoup path; extract_plane_crash_data and the
+    crawler use the faster tableparser.extract_crash_record, which gives the
+    same rows.
+    """
+    # Parse the HTML
+    soup = BeautifulSoup(html, "html.parser")
 
-        # Parse the HTML
-        soup = BeautifulSoup(reqs.text, "html.parser")
+    # Find the first table
+    table = soup.find_all("table")[0]
 
-        # Find the first table
-        table = soup.find_all("table")[0]
+    # Extract table rows (skipping the header row)
+    data = []
+    rows = table.find_all("tr")[1:]  # Skip the header row
 
-        # Extract table headers
-        # headers = [header.get_text(strip=True) for header in table.find("tr").find_all("td")]
+    for row in rows:
+        columns = row.find_all("td")
+        row_data = [col.get_text(strip=True) for col in columns]
+        data.append(row_data)
 
-        # Extract table rows (skipping the header row)
-        data = []
-        rows = table.find_all("tr")[1:]  # Skip the header row
+    transposed_data = list(zip(*data))
 
-        # data = []
-        # for row in table.find_all("tr")[1:]:
-        #     cells = row.find_all("td")  # Or "th" for header cells
-        #     row_data = [cell.text.strip() for cell in cells]
-        #     data.append(row_data)
+    # Store data into a Pandas DataFrame
+    return pd.DataFrame(transposed_data)
 
-        for row in rows:
-            columns = row.find_all("td")
-            row_data = [col.get_text(strip=True) for col in columns]
-            data.append(row_data)
+def extract_plane_crash_data(url, output_csv, archive=None, manifest=None):
+    """Extracts plane crash data from a given URL and saves it to a CSV file.
 
-        transposed_data = list(zip(*data))
+    output_csv is either a path or an open RecordSink; passing a sink lets a
+    loop over many URLs write its rows in batches instead of once per page.
+    With a CrawlManifest, URLs that are already done are skipped so a rerun
+    doesn't append duplicate rows, and the outcome of this URL is recorded.
+    """
+    if manifest is not None and manifest.is_done(url):
+        return
+    try:
+        # Send request to the webpage (or read it from the archive)
+        html = fetch_html(url, archive)
 
-        # Store data into a Pandas DataFrame
-        df = pd.DataFrame(transposed_data)
+        record = extract_crash_record(html)
 
-        print(df)
+        debug(record)
 
-        # Save to CSV
-        # Append to CSV
-        if os.path.exists(output_csv):
-            df.to_csv(output_csv, mode="a", header=False, index=False)
+        # Append one row to the CSV
+        if isinstance(output_csv, RecordSink):
+            output_csv.append(record)
+            if manifest is not None:
+                output_csv.flush()  # the row must be on disk before the URL is marked done
+            output_path = output_csv.path
         else:
-            df.to_csv(output_csv, mode="w", header=True, index=False)
+            with RecordSink(output_csv) as sink:
+                sink.append(record)
+            output_path = output_csv
+        if manifest is not None:
+            manifest.record(url, DONE, 200, content_hash(html))
 
-        print(f"Data extracted successfully and saved to {output_csv}")
+        debug(f"Data extracted successfully and saved to {output_path}")
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data from {url}: {e}")
+        if manifest is not None:
+            status = e.response.status_code if e.response is not None else None
+            manifest.record(url, FAILED, status)
     except IndexError:
         print("Error: No table found on the page.")
+        if manifest is not None:
+            manifest.record(url, FAILED, 200)
 
 
 def file_to_array(file_path):
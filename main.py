@@ -3,68 +3,173 @@
 Main Pipeline for Plane Crash Dummy Project
 https://www.planecrashinfo.com/database.htm
 @author: Ansley Ingram
+
+Every step is a stage with its input and output files; stages whose inputs
+haven't changed since their last run are skipped. Timings, row counts, memory
+and every page request are appended to data/metrics.jsonl. Examples:
+    python main.py                      # run everything that is out of date
+    python main.py scrub                # scrub, and whatever scrub needs first
+    python main.py crash_records --only --force
+    python main.py --list
+    python main.py scrub --debug        # also print the verbose data dumps
+    python main.py crash_records --touch    # accept an existing crashrecords.csv as up to date
+    python main.py summary_index        # then: python search.py "engine fire" --years 1970-1979
+    python main.py cube                 # then: python cube.py --years 1970-1979 --operator Aeroflot
 """
 import os
-import time
-from getdata import scrape_links, process_url_list, filter_lines, fix_urls, extract_plane_crash_data, file_to_array
-from scrubdata import scrub_crash_data
-from analysis import basic_analysis
-from summary_analysis import summarize_crashes
+import sys
+
+from pipeline import Stage, main
+
+DATABASE_URL = "https://www.planecrashinfo.com/database.htm"
+# every downloaded page is kept in the archive; revalidate only downloads pages that changed
+ARCHIVE = "data/pages.pca"
+# per-URL crawl status so reruns only fetch pending, failed or new pages
+MANIFEST = "data/crawl_manifest.jsonl"
+CHART_DIR = "data/charts"
 
-# set the working directory
-os.chdir("D:\Projects\crashtest_env")
-print("Current directory:", os.getcwd())
 
 """
 Scrape URLs and Data to CSV
 """
 
-# get links from the main list of years and save to yearindex.txt
-scrape_links("https://www.planecrashinfo.com/database.htm", "data/yearindex.txt", "w")
 
-# loop through yearindex.txt and extract urls from each page, append them to crashpages.txt
-process_url_list("data/yearindex.txt", "data/crashpages.txt")
+def crash_records():
+    # find every crash page from the database page and append its crash to crashrecords.csv;
+    # crash pages are fetched as soon as their year page is read, and the discovered urls
+    # are kept in crashurls.txt for reference (yearindex.txt and crashpages*.txt are no
+    # longer needed, getdata still has the step-by-step functions that wrote them)
+    # crashrecords.csv has one row per crash; scrub_crash_data still reads the old
+    # alternating label/value layout of crashtestdummy.csv as well
+    from archive import PageArchive
+    from crawler import crawl_site
+    from manifest import CrawlManifest
+
+    # requests per second replaces the old fixed sleep between pages
+    with PageArchive(ARCHIVE, revalidate=True) as archive, CrawlManifest(MANIFEST) as manifest:
+        crawl_site(
+            DATABASE_URL,
+            "data/crashrecords.csv",
+            rate=2.0,
+            concurrency=8,
+            archive=archive,
+            manifest=manifest,
+            snapshot="data/crashurls.txt",
+        )
 
-# some links reference other pages on the site that we don't want to crawl/scrape
-# all individual crash pages start with the year (e.g. 1920 - 2025)
-# function is hard coded to remove any line that doesn't start with 1 or 2
-filter_lines("data/crashpages.txt", "data/crashpages_clean.txt")
 
-# urls were relative so this will make them absolute
-fix_urls("data/crashpages_clean.txt", "data/crashurls.txt")
+"""
+Scrub & Clean Data
+"""
+
 
-# test run
-extract_plane_crash_data(
-    "https://www.planecrashinfo.com/1976/1976-1.htm", "data/crashtestdummy.csv"
-)
+def scrub():
+    # only the crashes crawled since the last scrub are cleaned and merged in;
+    # the first run (or one after the raw file was rewritten) scrubs everything
+    # locations, operators and aircraft types get the canonical names kept in
+    # data/canonical.json; delete it (and rerun with --force) to work them out afresh
+    # a full scrub cleans the rows in one worker process per CPU
+    from canonical import CANONICAL_PATH, CanonicalNames
+    from scrubdata import scrub_crash_data
 
-# loop through every html file in crashurls.txt and extract data / append to CSV
-text_array = file_to_array("data/crashurls.txt")
+    with CanonicalNames(CANONICAL_PATH) as canonical:
+        scrub_crash_data(
+            "data/crashrecords.csv",
+            "data/CrashTestInfo_Cleaned.csv",
+            parquet_path="data/CrashTestInfo_Cleaned.parquet",
+            incremental=True,
+            canonical=canonical,
+            processes=os.cpu_count(),
+        )
 
-if text_array:
-    for line in text_array:
-        #         print(line)
-        extract_plane_crash_data(line, "data/crashtestdummy.csv")
-        time.sleep(0.5)
-else:
-    print("No data was read from the file.")
 
 """
-Scrub & Clean Data
+Perform Basic Analysis
 """
 
-scrub_crash_data("data/crashtestdummy.csv", "data/CrashTestInfo_Cleaned.csv")
+
+def analysis():
+    # charts are saved to data/charts; call basic_analysis without output_dir to see them in windows
+    from analysis import basic_analysis
+
+    basic_analysis("data/CrashTestInfo_Cleaned.parquet", output_dir=CHART_DIR)
+
 
 """
-Perform Basic Analysis
+Summarize Crashes by Cause
 """
-basic_analysis("data/CrashTestInfo_Cleaned.csv")
+
+
+def summary():
+    from summary_analysis import summarize_crashes
+
+    # large datasets are classified in one worker process per CPU
+    summarize_crashes(
+        "data/CrashTestInfo_Cleaned.parquet", output_dir=CHART_DIR, processes=os.cpu_count()
+    )
+
 
 """
-Summarize Crashes by Cause
+Index Crash Summaries for Search
 """
-summarize_crashes("data/CrashTestInfo_Cleaned.csv")
 
 
+def summary_index():
+    # only new and changed summaries are indexed; search.py answers queries from the index
+    from search import INDEX_PATH, update_summary_index
+
+    update_summary_index("data/CrashTestInfo_Cleaned.parquet", INDEX_PATH)
+
+
+"""
+Precompute Aggregates
+"""
 
 
+def cube():
+    # crash counts, fatalities and aboard per year, category, operator and location;
+    # only new and changed crashes are classified again
+    from cube import CUBE_PATH, update_crash_cube
+
+    update_crash_cube("data/CrashTestInfo_Cleaned.parquet", CUBE_PATH)
+
+
+def charts(*names):
+    return [os.path.join(CHART_DIR, f"{name}.png") for name in names]
+
+
+STAGES = [
+    # the site has no input file; rerun with --force to pick up new crashes
+    Stage("crash_records", crash_records, [], ["data/crashrecords.csv"]),
+    Stage(
+        "scrub",
+        scrub,
+        ["data/crashrecords.csv"],
+        ["data/CrashTestInfo_Cleaned.csv", "data/CrashTestInfo_Cleaned.parquet"],
+    ),
+    Stage(
+        "analysis",
+        analysis,
+        ["data/CrashTestInfo_Cleaned.parquet"],
+        charts(
+            "crashes_per_year",
+            "fatalities_per_year",
+            "top_locations",
+            "top_operators",
+            "survival_rates",
+        ),
+    ),
+    Stage("summary", summary, ["data/CrashTestInfo_Cleaned.parquet"], charts("crash_categories")),
+    Stage(
+        "summary_index",
+        summary_index,
+        ["data/CrashTestInfo_Cleaned.parquet"],
+        ["data/summary_index.npz"],
+    ),
+    Stage("cube", cube, ["data/CrashTestInfo_Cleaned.parquet"], ["data/crash_cube.npz"]),
+]
+
+if __name__ == "__main__":
+    # paths are relative to the project folder, wherever main.py is run from
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.exit(main(STAGES, description=__doc__.strip().splitlines()[0], directory=project_dir))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Crawl Manifest for Plane Crash Dummy Project
+
+Records the outcome of every fetched URL so an interrupted or nightly crawl
+only has to process pending, failed or new URLs.
+"""
+import hashlib
+import json
+import os
+import time
+
+DONE = "done"
+FAILED = "failed"
+
+
+def content_hash(html):
+    """Returns the md5 hex digest of a page body."""
+    return hashlib.md5(html.encode("utf-8")).hexdigest()
+
+
+def file_signature(path):
+    """Returns (mtime in ns, size) of a file, the cheap check for a changed file."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_digest(path, size=None):
+    """Returns the md5 hex digest of a file's contents, or of its first `size` bytes."""
+    md5 = hashlib.md5()
+    remaining = size
+    with open(path, "rb") as file:
+        while remaining is None or remaining > 0:
+            block = file.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            md5.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return md5.hexdigest()
+
+
+class CrawlManifest:
+    """Per-URL crawl status kept in an append-only JSON lines file.
+
+    Each line is one status update ({"url", "status", "http", "hash", "time"});
+    the last line for a URL wins, so a crash mid-write loses at most one update.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from an interrupted run
+                    self.entries[entry["url"]] = entry
+        self.file = open(path, "a", encoding="utf-8")
+
+    def record(self, url, status, http_status=None, page_hash=None):
+        """Stores the outcome for url and flushes it to disk straight away."""
+        entry = {
+            "url": url,
+            "status": status,
+            "http": http_status,
+            "hash": page_hash,
+            "time": time.time(),
+        }
+        self.entries[url] = entry
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def is_done(self, url):
+        entry = self.entries.get(url)
+        return entry is not None and entry["status"] == DONE
+
+    def pending(self, urls):
+        """Returns the URLs that are new, failed or never finished, keeping their order."""
+        return [url for url in dict.fromkeys(urls) if not self.is_done(url)]
+
+    def summary(self):
+        """Returns the number of URLs per status."""
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+    def compact(self):
+        """Rewrites the manifest with only the latest entry per URL."""
+        self.file.close()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            for entry in self.entries.values():
+                file.write(json.dumps(entry) + "\n")
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics for Plane Crash Dummy Project
+
+Records what the pipeline spends its time on as a stream of JSON lines:
+one "stage" event per pipeline stage (wall time, rows in/out, peak memory)
+and one "request" event per page fetch (latency, bytes, status, retries).
+Closing the recorder appends a "summary" event with a latency histogram.
+Only the standard library is used, so any module can import it cheaply.
+
+Functions here are no-ops until a recorder is started with recording(),
+e.g. by the pipeline runner. Verbose dumps go through debug(), which only
+prints when debug output is enabled (set_debug or CRASHTESTDUMMY_DEBUG=1).
+"""
+import bisect
+import json
+import os
+import platform
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak memory is left out there
+    resource = None
+
+METRICS_PATH = "data/metrics.jsonl"
+
+# upper bounds of the latency histogram buckets in milliseconds; the last bucket is open
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+_debug = os.environ.get("CRASHTESTDUMMY_DEBUG", "") not in ("", "0")
+_recorder = None
+
+
+def set_debug(enabled):
+    """Turns the verbose debug output on or off."""
+    global _debug
+    _debug = bool(enabled)
+
+
+def is_debug():
+    return _debug
+
+
+def debug(*values):
+    """Prints the values like print, but only when debug output is enabled."""
+    if _debug:
+        print(*values)
+
+
+def memory_usage():
+    """Returns (current, peak) resident memory of this process in bytes.
+
+    Uses /proc on Linux; elsewhere both are the peak from getrusage, or
+    None where that isn't available either.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        pass
+    if resource is None:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    peak = peak if platform.system() == "Darwin" else peak * 1024
+    return peak, peak
+
+
+def reset_peak_memory():
+    # Linux only: restart the peak (VmHWM) from the current memory use
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def latency_histogram(latencies_ms):
+    """Summarizes request latencies: counts per LATENCY_BUCKETS_MS bucket plus percentiles."""
+    counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for latency in latencies_ms:
+        counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency)] += 1
+    labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+    ordered = sorted(latencies_ms)
+
+    def percentile(fraction):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "buckets": dict(zip(labels, counts)),
+        "p50": percentile(0.50),
+        "p90": percentile(0.90),
+        "p99": percentile(0.99),
+        "max": round(ordered[-1], 2) if ordered else None,
+    }
+
+
+class MetricsRecorder:
+    """Appends metric events to a JSONL file; safe to use from several threads.
+
+    Every event carries the time, the run id and the name of the stage that
+    was running. close() writes the summary event and returns it.
+    """
+
+    def __init__(self, path=METRICS_PATH):
+        self.path = path
+        self.run = uuid.uuid4().hex[:12]
+        self.stage = None
+        self.counters = {}
+        self.latencies_ms = []
+        self.statuses = {}
+        self.sources = {}
+        self.bytes = 0
+        self.retries = 0
+        self.stages = []
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def event(self, kind, **fields):
+        """Writes one event line."""
+        record = {"time": round(time.time(), 3), "run": self.run, "event": kind, "stage": self.stage}
+        record.update(fields)
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self.file.write(line)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def request(self, url, status, seconds, size=0, retries=0, source="network", error=None):
+        """Records one page fetch.
+
+        source is "network" for a download, "not_modified" for a 304
+        revalidation and "archive" for a page served from the PageArchive
+        without a request; only the first two count towards the latency
+        histogram.
+        """
+        with self._lock:
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.sources[source] = self.sources.get(source, 0) + 1
+            self.bytes += size
+            self.retries += retries
+            if source != "archive":
+                self.latencies_ms.append(seconds * 1000)
+        fields = {
+            "url": url,
+            "status": status,
+            "ms": round(seconds * 1000, 2),
+            "bytes": size,
+            "retries": retries,
+            "source": source,
+        }
+        if error is not None:
+            fields["error"] = error
+        self.event("request", **fields)
+
+    @contextmanager
+    def time_stage(self, name):
+        """Times the block as pipeline stage `name` and records a stage event when it ends.
+
+        Counters added with count() during the block (e.g. rows_in and
+        rows_out) are stored with the stage.
+        """
+        self.stage = name
+        self.counters = {}
+        reset_peak_memory()
+        before, _ = memory_usage()
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            seconds = time.perf_counter() - start
+            _, peak = memory_usage()
+            stage = {
+                "name": name,
+                "ok": ok,
+                "seconds": round(seconds, 4),
+                "peak_rss_mb": round(peak / 1e6, 1) if peak else None,
+                "stage_rss_mb": round(max(peak - before, 0) / 1e6, 1) if peak else None,
+            }
+            stage.update(self.counters)
+            self.stages.append(stage)
+            self.event("stage", **stage)
+            self.stage = None
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": sum(self.sources.values()),
+                "bytes": self.bytes,
+                "retries": self.retries,
+                "status": dict(self.statuses),
+                "source": dict(self.sources),
+                "latency_ms": latency_histogram(self.latencies_ms),
+                "stages": list(self.stages),
+            }
+
+    def close(self):
+        summary = self.summary()
+        self.event("summary", **summary)
+        self.file.close()
+        return summary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def print_summary(summary):
+    for stage in summary["stages"]:
+        rows = "".join(
+            f" {key}={value}" for key, value in stage.items() if key.startswith("rows")
+        )
+        memory = f" peak {stage['peak_rss_mb']} MB" if stage["peak_rss_mb"] else ""
+        print(f"{stage['name']:20} {stage['seconds']:8.2f}s{memory}{rows}")
+    latency = summary["latency_ms"]
+    if summary["requests"]:
+        print(
+            f"{summary['requests']} requests, {summary['bytes'] / 1e6:.1f} MB, "
+            f"{summary['retries']} retries, status {summary['status']}"
+        )
+    if latency["count"]:
+        print(
+            f"latency p50 {latency['p50']} ms, p90 {latency['p90']} ms, "
+            f"p99 {latency['p99']} ms, max {latency['max']} ms"
+        )
+
+
+@contextmanager
+def recording(path=METRICS_PATH):
+    """Sends metrics to a MetricsRecorder on path for the duration of the block."""
+    global _recorder
+    previous = _recorder
+    _recorder = MetricsRecorder(path)
+    try:
+        yield _recorder
+    finally:
+        recorder, _recorder = _recorder, previous
+        print_summary(recorder.close())
+        print(f"Metrics appended to {path}")
+
+
+@contextmanager
+def measure_stage(name):
+    """Measures a pipeline stage if metrics are being recorded; see MetricsRecorder.time_stage."""
+    if _recorder is None:
+        yield
+    else:
+        with _recorder.time_stage(name):
+            yield
+
+
+def count(name, amount=1):
+    """Adds to a counter of the current stage, e.g. count("rows_out", len(df))."""
+    if _recorder is not None:
+        _recorder.count(name, amount)
+
+
+def record_request(url, status, seconds, size=0, retries=0, source="network", error=None):
+    """Records a page fetch if metrics are being recorded; see MetricsRecorder.request."""
+    if _recorder is not None:
+        _recorder.request(url, status, seconds, size, retries, source, error)
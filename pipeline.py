@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline Runner for Plane Crash Dummy Project
+
+Runs a list of stages that each declare their input and output files. A
+stage is skipped when its outputs exist and its inputs have the same
+content hashes as the last time it ran. Only the standard library is
+imported here, so stages import the heavy libraries they need themselves.
+"""
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+
+from manifest import file_digest, file_signature
+from metrics import METRICS_PATH, measure_stage, recording, set_debug
+
+# run: function without arguments; inputs/outputs: lists of file paths
+Stage = namedtuple("Stage", ["name", "run", "inputs", "outputs"])
+
+STATE_PATH = "data/pipeline_state.json"
+
+
+class PipelineState:
+    """Input hashes of every stage's last successful run, kept in a JSON file.
+
+    Each input is stored with its (mtime, size) signature and md5 digest; the
+    file is only hashed again when its signature changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    self.stages = json.load(file)
+            except (OSError, json.JSONDecodeError):
+                self.stages = {}  # unreadable state just means everything reruns
+
+    def input_hashes(self, stage):
+        """Returns {path: {"signature", "md5"}} for the current contents of the stage's inputs."""
+        known = self.stages.get(stage.name, {}).get("inputs", {})
+        hashes = {}
+        for path in stage.inputs:
+            signature = list(file_signature(path))
+            previous = known.get(path)
+            if previous is not None and previous["signature"] == signature:
+                digest = previous["md5"]
+            else:
+                digest = file_digest(path)
+            hashes[path] = {"signature": signature, "md5": digest}
+        return hashes
+
+    def is_current(self, stage, hashes):
+        """True if the stage ran before on inputs with these contents and its outputs still exist.
+
+        A stage without input files is current as long as its outputs exist.
+        """
+        if not all(os.path.exists(path) for path in stage.outputs):
+            return False
+        if not stage.inputs:
+            return True
+        entry = self.stages.get(stage.name)
+        if entry is None:
+            return False
+        digests = {path: value["md5"] for path, value in entry["inputs"].items()}
+        return digests == {path: value["md5"] for path, value in hashes.items()}
+
+    def record(self, stage, hashes):
+        """Stores a successful run of the stage and writes the state file."""
+        self.stages[stage.name] = {"inputs": hashes, "time": time.time()}
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self.stages, file, indent=1)
+        os.replace(temp_path, self.path)
+
+
+def select_stages(stages, targets, only=False):
+    """Returns the stages needed for targets (stage names or output files), in pipeline order.
+
+    Upstream stages producing a selected stage's inputs are included unless only is set.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    producers = {path: stage for stage in stages for path in stage.outputs}
+    selected = set()
+    pending = []
+    for target in targets:
+        stage = by_name.get(target) or producers.get(target)
+        if stage is None:
+            raise ValueError(f"Unknown stage or output: {target}")
+        pending.append(stage)
+    while pending:
+        stage = pending.pop()
+        if stage.name in selected:
+            continue
+        selected.add(stage.name)
+        if not only:
+            pending.extend(producers[path] for path in stage.inputs if path in producers)
+    return [stage for stage in stages if stage.name in selected]
+
+
+def touch_stages(stages, targets=None, only=False, state_path=STATE_PATH):
+    """Marks the stages for targets as up to date with their current inputs, without running them.
+
+    Useful when the files were made outside the pipeline. Stages with
+    missing inputs or outputs are left alone.
+    """
+    targets = targets or [stage.name for stage in stages]
+    state = PipelineState(state_path)
+    for stage in select_stages(stages, targets, only):
+        paths = stage.inputs + stage.outputs
+        if all(os.path.exists(path) for path in paths):
+            state.record(stage, state.input_hashes(stage))
+            print(f"[{stage.name}] marked up to date")
+        else:
+            print(f"[{stage.name}] not marked, files missing")
+
+
+def run_pipeline(stages, targets=None, only=False, force=False, state_path=STATE_PATH):
+    """Runs the stages needed for targets (all stages by default), skipping up-to-date ones.
+
+    With force the target stages run even if they are up to date. Returns
+    True if every stage succeeded or was skipped.
+    """
+    targets = targets or [stage.name for stage in stages]
+    forced = {stage.name for stage in select_stages(stages, targets, only=True)} if force else set()
+    state = PipelineState(state_path)
+
+    for stage in select_stages(stages, targets, only):
+        missing = [path for path in stage.inputs if not os.path.exists(path)]
+        if missing:
+            if all(os.path.exists(path) for path in stage.outputs):
+                # e.g. a crash CSV copied in without the crawl files that made it
+                print(f"[{stage.name}] inputs missing, keeping existing outputs")
+                continue
+            print(f"[{stage.name}] missing input {', '.join(missing)}")
+            return False
+        hashes = state.input_hashes(stage)
+        if stage.name not in forced and state.is_current(stage, hashes):
+            print(f"[{stage.name}] up to date")
+            continue
+
+        print(f"[{stage.name}] running")
+        start = time.perf_counter()
+        try:
+            with measure_stage(stage.name):
+                stage.run()
+        except Exception as e:
+            print(f"[{stage.name}] failed: {e}")
+            return False
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            print(f"[{stage.name}] failed: did not write {', '.join(missing)}")
+            return False
+        state.record(stage, hashes)
+        print(f"[{stage.name}] done in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def print_stages(stages, state_path):
+    state = PipelineState(state_path)
+    for stage in stages:
+        if any(not os.path.exists(path) for path in stage.inputs):
+            status = "waiting for inputs"
+        elif state.is_current(stage, state.input_hashes(stage)):
+            status = "up to date"
+        else:
+            status = "needs to run"
+        print(f"{stage.name:20} {status:20} -> {', '.join(stage.outputs)}")
+
+
+def main(stages, argv=None, description=None, directory=None):
+    """Command line for a pipeline: run stages/targets, list them, or force reruns.
+
+    Returns the exit code.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "targets", nargs="*", help="stage names or output files to build (default: everything)"
+    )
+    parser.add_argument("--only", action="store_true", help="don't run upstream stages")
+    parser.add_argument(
+        "--force", action="store_true", help="run the target stages even if they are up to date"
+    )
+    parser.add_argument("--list", action="store_true", help="show the stages and their status")
+    parser.add_argument(
+        "--touch",
+        action="store_true",
+        help="mark the target stages as up to date without running them",
+    )
+    parser.add_argument("-C", "--directory", default=directory, help="project directory")
+    parser.add_argument(
+        "--state", default=STATE_PATH, help="file keeping the input hashes"
+    )
+    parser.add_argument(
+        "--metrics",
+        default=METRICS_PATH,
+        help="JSONL file stage and request metrics are appended to ('' to turn off)",
+    )
+    parser.add_argument(
+        "--debug", action="store_true", help="print verbose output such as every parsed page"
+    )
+    args = parser.parse_args(argv)
+
+    if args.directory:
+        os.chdir(args.directory)
+    if args.debug:
+        set_debug(True)
+    if args.list:
+        print_stages(stages, args.state)
+        return 0
+    try:
+        if args.touch:
+            touch_stages(stages, args.targets, args.only, args.state)
+            return 0
+        if args.metrics:
+            with recording(args.metrics):
+                ok = run_pipeline(stages, args.targets, args.only, args.force, args.state)
+        else:
+            ok = run_pipeline(stages, args.targets, args.only, args.force, args.state)
+    except ValueError as e:
+        parser.error(str(e))
+    return 0 if ok else 1
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Retry Policy for Plane Crash Dummy Project
+
+Decides when a failed page fetch is tried again and how long to wait first.
+Both the requests based fetchers in getdata and the aiohttp crawler use it.
+"""
+import random
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+
+# responses that mean "try again later" rather than "this page is broken"
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# retries: extra attempts after the first one
+# timeout: seconds a single request may take before it counts as failed
+# backoff: delay before the first retry; it doubles with every attempt up to max_backoff
+# max_retry_after: longest Retry-After header that is honoured
+RetryPolicy = namedtuple(
+    "RetryPolicy",
+    ["retries", "timeout", "backoff", "max_backoff", "max_retry_after"],
+    defaults=(4, 30.0, 0.5, 30.0, 120.0),
+)
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+def retry_after_seconds(value, now=None):
+    """Returns the wait a Retry-After header asks for in seconds, or None if there is none.
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+def backoff_delay(policy, attempt, retry_after=None):
+    """Returns how long to wait before retry number `attempt` (0 for the first retry).
+
+    The delay is drawn uniformly up to the exponential backoff ("full
+    jitter"), so clients that failed together don't retry together. A
+    Retry-After from the server is a minimum, capped at max_retry_after.
+    """
+    delay = random.uniform(0, min(policy.max_backoff, policy.backoff * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, policy.max_retry_after))
+    return delay
@@ -4,9 +4,27 @@ Scrub Data Functions for Plane Crash Dummy Project
 
 @author: Ansley Ingram
 """
+import numpy as np
 import pandas as pd
 import hashlib
+import io
+import json
+import os
 import re
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from dataset import (
+    COUNT_COLUMNS,
+    SCRUBBED_COLUMNS,
+    CrashParquetWriter,
+    crash_parquet_schema,
+    to_typed_frame,
+    update_crash_parquet,
+    write_crash_parquet,
+)
+from manifest import file_digest, file_signature
+from metrics import count, is_debug
+from sink import RAW_COLUMNS
 
 # helper functions
 
@@ -48,146 +66,477 @@ def generate_hash(row):
     return hashlib.md5(f"{row['DateTime']}_{row['Location']}".encode()).hexdigest()
 
 
-def scrub_crash_data(filepath, output_file_path):
+# the Aboard and Fatalities columns look like "2   (passengers:1  crew:1)"
+COUNTS_PATTERN = r"(\d+)\s+\(passengers:(\d+)\s+crew:(\d+)\)"
+
+# vectorized versions of the helper functions above; they work on object
+# columns so pandas uses Python's str and re semantics, exactly like the helpers
+
+def _as_text(column):
+    # str(value) for every entry, like the helpers do (NaN becomes "nan")
+    return column.astype(object).fillna("nan")
+
+def _collapse_spaces(column):
+    # same as " ".join(value.split())
+    return column.str.replace(r"\s+", " ", regex=True).str.strip()
+
+def clean_location_column(locations):
+    """Vectorized clean_location."""
+    locations = _as_text(locations).str.strip().str.replace("Near ", "", regex=False)
+    return _collapse_spaces(locations)
+
+def clean_operator_column(operators):
+    """Vectorized clean_operator."""
+    operators = _collapse_spaces(_as_text(operators))
+    return operators.mask(operators.isin(["?", "Unknown", "unknown"]), "Unknown Operator")
+
+def extract_counts_column(texts):
+    """Vectorized extract_aboard_counts / extract_fatalities.
+
+    Returns the passengers and crew counts as two int columns, 0 where the
+    text doesn't have the expected format.
+    """
+    counts = _as_text(texts).str.extract(COUNTS_PATTERN)
+    # int() rather than to_numeric so any digit \d matched converts like in the helpers
+    passengers = counts[1].map(int, na_action="ignore").fillna(0).astype(int)
+    crew = counts[2].map(int, na_action="ignore").fillna(0).astype(int)
+    return passengers, crew
+
+def generate_hash_column(datetimes, locations):
+    """Batch generate_hash over the DateTime and Location columns."""
+    md5 = hashlib.md5
+    return pd.Series(
+        [
+            md5(f"{datetime}_{location}".encode()).hexdigest()
+            for datetime, location in zip(datetimes, locations)
+        ],
+        index=datetimes.index,
+        dtype=object,
+    )
+
+
+def load_raw_crash_data(filepath):
+    """Reads a raw crash CSV into one row per crash with the RAW_COLUMNS names."""
+    # load the CSV into a data frame
+    df = pd.read_csv(filepath, dtype=str)
+
+    if list(df.columns) == RAW_COLUMNS:
+        # written by RecordSink: already one row per crash with named columns
+        return df
+
+    # old layout from save_crash_table: alternating label rows and value rows
+    # drop rows that contain repeated column headers
+    df_cleaned = df.iloc[1::2].reset_index(drop=True)
+
+    # rename columns
+    df_cleaned.columns = RAW_COLUMNS
+
+    # drop any remaining rows with header-like attributes
+    return df_cleaned[1:].reset_index(drop=True)
+
+
+def combine_date_time(df_cleaned):
+    """Returns the "Date Time" strings that the DateTime column is parsed from."""
+    # Replace missing times ("?") with "0000"
+    times = df_cleaned["Time"].replace("?", "0000")
+
+    # Ensure all times are in HH:MM format
+    times = times.astype(str).str.zfill(4)  # Ensure 4-character format (e.g., '630' -> '0630')
+
+    # Fix any formatting issues like "00::00"
+    times = times.str.replace("::", ":", regex=False)
+
+    # Create a combined DateTime column
+    return df_cleaned["Date"] + " " + times
+
+
+# strings pandas treats as missing when it looks for a value to guess the date format from
+NAT_STRINGS = {"", "NaT", "nat", "NAT", "nan", "NaN"}
+
+def guess_datetime_format(date_times):
+    """Returns the format pd.to_datetime would infer for date_times.
+
+    Like pandas, the format is guessed from the first non-missing value;
+    returns "mixed" when that value has no recognisable format (each value is
+    then parsed on its own) and None when every value is missing.
+    """
+    for value in date_times:
+        if isinstance(value, str) and value not in NAT_STRINGS:
+            return pd.tseries.api.guess_datetime_format(value) or "mixed"
+    return None
+
+
+def clean_crash_frame(df_cleaned, datetime_format=None, canonical=None):
+    """Cleans raw crash rows and returns them with the SCRUBBED_COLUMNS.
+
+    datetime_format fixes the format the DateTime column is parsed with;
+    by default pandas infers it from the first value, as it always has.
+    With canonical (a canonical.CanonicalNames) the location, operator and
+    aircraft type columns get canonical names, so spellings of the same
+    name are counted together.
+    """
+    df_cleaned = df_cleaned.copy()
+
+    # Convert to proper datetime format
+    df_cleaned["DateTime"] = pd.to_datetime(
+        combine_date_time(df_cleaned), format=datetime_format, errors="coerce"
+    )
+
+    df_cleaned["UniqueID"] = generate_hash_column(df_cleaned["DateTime"], df_cleaned["Location"])
+
+    # Create new columns with cleaned location and operator names
+    if canonical is None:
+        df_cleaned["Location_Cleaned"] = clean_location_column(df_cleaned["Location"])
+        df_cleaned["Operator_Cleaned"] = clean_operator_column(df_cleaned["Operator"])
+    else:
+        df_cleaned["Location_Cleaned"] = canonical.location.apply(df_cleaned["Location"])
+        df_cleaned["Operator_Cleaned"] = canonical.operator.apply(df_cleaned["Operator"])
+
+    # Extract passengers and crew aboard (missing values become 0)
+    df_cleaned["Passengers_Aboard"], df_cleaned["Crew_Aboard"] = extract_counts_column(
+        df_cleaned["Aboard"]
+    )
+
+    # Create a new column that sums Passengers_Aboard and Crew_Aboard
+    df_cleaned["Total_Aboard"] = df_cleaned["Passengers_Aboard"] + df_cleaned["Crew_Aboard"]
+
+    # Extract passenger and crew fatalities (missing values become 0)
+    df_cleaned["Passengers_Fatalities"], df_cleaned["Crew_Fatalities"] = extract_counts_column(
+        df_cleaned["Fatalities"]
+    )
+
+    # Create a new column that sums Passengers_Fatalities and Crew_Fatalities
+    df_cleaned["Total_Fatalities"] = (
+        df_cleaned["Passengers_Fatalities"] + df_cleaned["Crew_Fatalities"]
+    )
+
+    # Rename the "Ground" column to "Ground_Fatalities"
+    df_cleaned = df_cleaned.rename(columns={"Ground": "Ground_Fatalities"})
+
+    # Replace "?" with "Unknown" in the Flight #, Route, Aircraft Type and Registration columns
+    for column in ["Flight #", "Route", "Aircraft Type", "Registration"]:
+        df_cleaned[column] = df_cleaned[column].replace("?", "Unknown")
+    if canonical is not None:
+        df_cleaned["Aircraft Type"] = canonical.aircraft.apply(df_cleaned["Aircraft Type"])
+
+    # create a new dataset with just the columns we want to keeps
+    return df_cleaned[SCRUBBED_COLUMNS]
+
+
+def iter_raw_crash_chunks(filepath, chunksize):
+    """Reads a raw crash CSV in chunks and yields them as one row per crash.
+
+    Handles both layouts like load_raw_crash_data; in the old layout value rows
+    are picked by their position in the whole file, so label/value pairs split
+    across a chunk boundary still line up.
+    """
+    legacy = None
+    position = 0  # row number of the chunk's first row in the whole file
+    for chunk in pd.read_csv(filepath, dtype=str, chunksize=chunksize):
+        if legacy is None:
+            legacy = list(chunk.columns) != RAW_COLUMNS
+        rows = chunk
+        if legacy:
+            positions = np.arange(position, position + len(chunk))
+            # value rows sit at odd positions; the first one is dropped like in load_raw_crash_data
+            rows = chunk[(positions % 2 == 1) & (positions != 1)]
+            rows.columns = RAW_COLUMNS
+        position += len(chunk)
+        if len(rows):
+            yield rows.reset_index(drop=True)
+
+
+# how DateTime is written to the cleaned CSV; pandas leaves the time out when every time is midnight
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def csv_date_format(datetimes):
+    """Returns the format DataFrame.to_csv writes a DateTime column with."""
+    times = datetimes.dropna()
+    return DATETIME_FORMAT if (times != times.dt.normalize()).any() else DATE_FORMAT
+
+
+def report_duplicate_datetimes(duplicates):
+    if duplicates == 0:
+        print("✅ The DateTime column is unique and can be used as an identifier.")
+    else:
+        print(f"⚠️ The DateTime column has {duplicates} duplicates. Consider using an additional column for uniqueness.")
+
+
+def scrub_crash_data_in_chunks(
+    filepath, output_file_path, chunksize=50_000, parquet_path=None, canonical=None
+):
+    """Streaming scrub_crash_data: cleans the raw CSV chunk by chunk and appends to the output.
+
+    Memory stays flat apart from the set of DateTime values used for the
+    duplicate check. The output matches scrub_crash_data as long as the data
+    has at least one time that isn't midnight (DateTime is always written
+    with its time here, while pandas drops an all-midnight time part). With
+    canonical, a name first seen in a chunk is spelled the way it is most
+    often spelled in that chunk rather than in the whole file.
+    """
+    raw_size = os.path.getsize(filepath)
+    seen = set()  # DateTime values as int64 nanoseconds, NaT included like duplicated()
+    duplicates = 0
+    rows_in = 0
+    rows = 0
+    datetime_format = None
+    parquet = CrashParquetWriter(parquet_path) if parquet_path else None
+    with open(output_file_path, "w", encoding="utf-8", newline="") as output:
+        for chunk in iter_raw_crash_chunks(filepath, chunksize):
+            # every chunk must parse dates with the format the whole file would be inferred with
+            if datetime_format is None:
+                datetime_format = guess_datetime_format(combine_date_time(chunk))
+            df_scrubbed = clean_crash_frame(chunk, datetime_format, canonical)
+            rows_in += len(chunk)
+
+            for value in df_scrubbed["DateTime"].to_numpy().view("i8").tolist():
+                if value in seen:
+                    duplicates += 1
+                else:
+                    seen.add(value)
+
+            df_scrubbed.to_csv(output, header=rows == 0, index=False, date_format=DATETIME_FORMAT)
+            rows += len(df_scrubbed)
+            if parquet is not None:
+                parquet.write(df_scrubbed)
+    if parquet is not None:
+        parquet.close()
+    save_scrub_state(
+        filepath,
+        raw_size,
+        output_file_path,
+        parquet_path,
+        datetime_format,
+        DATETIME_FORMAT,
+        canonical=canonical,
+    )
+
+    # Check for duplicate DateTime entries
+    report_duplicate_datetimes(duplicates)
+    count("rows_in", rows_in)
+    count("rows_out", rows)
+    print(f"Scrubbed {rows} crashes")
+    print(f"File saved successfully: {output_file_path}")
+    if parquet_path:
+        print(f"Parquet file saved successfully: {parquet_path}")
+
+
+# Parallel scrub
+
+# raw rows one worker process cleans at a time
+SHARD_ROWS = 100_000
+
+# the canonical names in a worker process, set once when it starts
+shard_canonical = None
+
+# what a worker sends back for one shard of raw rows:
+# text: the cleaned rows as CSV lines with times; date_text: without times, only
+# when the shard has no time other than midnight (else None); datetimes: DateTime
+# as int64 for the duplicate check; table: the rows as one Arrow table sorted by
+# year for the Parquet file (None without one); years: (year, rows) in table
+# order, year None for crashes without a date
+ScrubbedShard = namedtuple("ScrubbedShard", ["text", "date_text", "datetimes", "table", "years"])
+
+
+def start_shard_worker(canonical):
+    # the names are handed over once per process instead of with every shard
+    global shard_canonical
+    shard_canonical = canonical
+
+
+def scrub_shard(rows, datetime_format, parquet=False):
+    """Cleans one shard of raw rows in a worker process and renders its outputs."""
+    df_scrubbed = clean_crash_frame(rows, datetime_format, shard_canonical)
+    text = df_scrubbed.to_csv(header=False, index=False, date_format=DATETIME_FORMAT)
+    date_text = None
+    if csv_date_format(df_scrubbed["DateTime"]) == DATE_FORMAT:
+        date_text = df_scrubbed.to_csv(header=False, index=False, date_format=DATE_FORMAT)
+    table = None
+    years = []
+    if parquet:
+        import pyarrow as pa
+
+        # one table rather than one per year: a table of a slice of the rows
+        # is pickled back with the text of all of them
+        df = to_typed_frame(df_scrubbed, categories=False)
+        df = df.sort_values("Year", kind="stable", na_position="last")
+        table = pa.Table.from_pandas(df, schema=crash_parquet_schema(), preserve_index=False)
+        sizes = df.groupby("Year", sort=True, dropna=False).size()
+        years = [(None if pd.isna(year) else int(year), int(size)) for year, size in sizes.items()]
+    datetimes = df_scrubbed["DateTime"].to_numpy().view("i8")
+    return ScrubbedShard(text, date_text, datetimes, table, years)
+
+
+def raw_shards(filepath, shard_rows, canonical=None):
+    """Returns an iterator over the raw rows in shards of shard_rows, in file order.
+
+    Without canonical names the file is read shard by shard while the
+    workers clean the earlier ones. Canonical names depend on how often
+    every spelling occurs in the whole file, so with canonical the file is
+    read at once and the names learned first, the way clean_crash_frame
+    learns them, before this returns; the workers then only look them up.
+    """
+    if canonical is None:
+        return iter_raw_crash_chunks(filepath, shard_rows)
+    df_raw = load_raw_crash_data(filepath)
+    canonical.location.apply(df_raw["Location"])
+    canonical.operator.apply(df_raw["Operator"])
+    canonical.aircraft.apply(df_raw["Aircraft Type"].replace("?", "Unknown"))
+    return (
+        df_raw.iloc[start : start + shard_rows].reset_index(drop=True)
+        for start in range(0, len(df_raw), shard_rows)
+    )
+
+
+def scrub_crash_data_parallel(
+    filepath, output_file_path, processes, shard_rows=SHARD_ROWS, parquet_path=None, canonical=None
+):
+    """scrub_crash_data with the cleaning spread over worker processes.
+
+    The raw rows are cut into shards of shard_rows rows. Worker processes
+    clean them (dates, UniqueID hashes, counts, names) and render their CSV
+    lines and Parquet row groups. The parent writes the results in shard
+    order and checks the DateTimes of all shards for duplicates, so the
+    outputs are the same as those of scrub_crash_data. Shards are row
+    ranges rather than years: the cleaned CSV keeps the raw order, and
+    row ranges are all the same size.
+    """
+    raw_size = os.path.getsize(filepath)
+    header = pd.DataFrame(columns=SCRUBBED_COLUMNS).to_csv(index=False)
+    datetime_format = None
+    waiting = []  # (text, date_text) of the first shards, until one has a time
+    has_times = False
+    datetimes = []
+    tables = {}  # year -> its rows of every shard as Arrow tables, in shard order
+    rows_in = 0
+    shards = raw_shards(filepath, shard_rows, canonical)
+
+    def write(output, shard):
+        nonlocal has_times
+        datetimes.append(shard.datetimes)
+        offset = 0
+        for year, size in shard.years:
+            tables.setdefault(year, []).append(shard.table.slice(offset, size))
+            offset += size
+        if has_times:
+            output.write(shard.text)
+            return
+        waiting.append((shard.text, shard.date_text))
+        if shard.date_text is None:
+            # a time other than midnight: DateTime is written with times everywhere
+            has_times = True
+            output.writelines(text for text, _ in waiting)
+            waiting.clear()
+
+    with (
+        open(output_file_path, "w", encoding="utf-8", newline="") as output,
+        ProcessPoolExecutor(
+            max_workers=processes, initializer=start_shard_worker, initargs=(canonical,)
+        ) as pool,
+    ):
+        output.write(header)
+        pending = deque()
+        for rows in shards:
+            # the format is guessed from the first value, as pd.to_datetime would;
+            # shards before the first date have nothing but missing dates
+            datetime_format = datetime_format or guess_datetime_format(combine_date_time(rows))
+            rows_in += len(rows)
+            pending.append(pool.submit(scrub_shard, rows, datetime_format, parquet_path is not None))
+            # a few shards ahead of the writer keep the workers busy without piling up results
+            if len(pending) >= 2 * processes:
+                write(output, pending.popleft().result())
+        while pending:
+            write(output, pending.popleft().result())
+        # no crash has a time: pandas writes dates only
+        output.writelines(date_text for _, date_text in waiting)
+
+    if parquet_path:
+        import pyarrow as pa
+
+        with CrashParquetWriter(parquet_path) as writer:
+            # crashes without a date last, like the groupby in CrashParquetWriter.write
+            for year in sorted(tables, key=lambda year: (year is None, year or 0)):
+                writer.write_row_group(pa.concat_tables(tables[year]))
+
+    datetimes = np.concatenate(datetimes) if datetimes else np.empty(0, dtype=np.int64)
+    save_scrub_state(
+        filepath,
+        raw_size,
+        output_file_path,
+        parquet_path,
+        datetime_format,
+        DATETIME_FORMAT if has_times else DATE_FORMAT,
+        canonical=canonical,
+    )
+
+    # Check for duplicate DateTime entries (NaT counts as a duplicate of NaT, like duplicated())
+    report_duplicate_datetimes(len(datetimes) - len(np.unique(datetimes)))
+    count("rows_in", rows_in)
+    count("rows_out", len(datetimes))
+    print(f"Scrubbed {len(datetimes)} crashes in {processes} processes")
+    print(f"File saved successfully: {output_file_path}")
+    if parquet_path:
+        print(f"Parquet file saved successfully: {parquet_path}")
+
+
+def scrub_crash_data(
+    filepath,
+    output_file_path,
+    chunksize=None,
+    parquet_path=None,
+    incremental=False,
+    canonical=None,
+    processes=None,
+):
+    """Cleans the raw crash CSV and writes the scrubbed dataset.
+
+    With a chunksize the raw file is streamed through scrub_crash_data_in_chunks
+    instead of being loaded at once. With more than one process the rows
+    are cleaned in that many worker processes (see scrub_crash_data_parallel;
+    chunksize is then the shard size), with the same outputs. With a
+    parquet_path the scrubbed data is also written as a typed .parquet file
+    partitioned by year. With
+    incremental, only the raw rows added since the last scrub are cleaned and
+    merged in (see scrub_crash_data_incremental). With canonical (a
+    canonical.CanonicalNames) locations, operators and aircraft types get
+    canonical names; the caller saves the names it learned.
+    """
     try:
-        # load the CSV into a data frame
-        df = pd.read_csv(filepath)
-    
-        # drop rows that contain repeated column headers
-        df_cleaned = df.iloc[1::2].reset_index(drop=True)
-    
-        # rename columns
-        df_cleaned.columns = [
-            "Date",
-            "Time",
-            "Location",
-            "Operator",
-            "Flight #",
-            "Route",
-            "Aircraft Type",
-            "Registration",
-            "cn / ln",
-            "Aboard",
-            "Fatalities",
-            "Ground",
-            "Summary",
-        ]
-    
-        # drop any remaining rows with header-like attributes
-        df_cleaned = df_cleaned[1:].reset_index(drop=True)
-    
-        # display a preview of the cleaned data set
-        #print(df_cleaned.head(10))
-    
-        # Replace missing times ("?") with "0000"
-        df_cleaned["Time"] = df_cleaned["Time"].replace("?", "0000")
-        
-        # Ensure all times are in HH:MM format
-        df_cleaned["Time"] = (
-            df_cleaned["Time"].astype(str).str.zfill(4)
-        )  # Ensure 4-character format (e.g., '630' -> '0630')
-    
-        # Fix any formatting issues like "00::00"
-        df_cleaned["Time"] = df_cleaned["Time"].str.replace("::", ":", regex=False)
-        
-        # Create a combined DateTime column
-        df_cleaned["DateTime"] = df_cleaned["Date"] + " " + df_cleaned["Time"]
-        
-        # Convert to proper datetime format
-        df_cleaned["DateTime"] = pd.to_datetime(df_cleaned["DateTime"], errors="coerce")
-    
-    
+        if incremental:
+            return scrub_crash_data_incremental(
+                filepath, output_file_path, parquet_path, chunksize, canonical, processes
+            )
+        if processes and processes > 1:
+            return scrub_crash_data_parallel(
+                filepath,
+                output_file_path,
+                processes,
+                chunksize or SHARD_ROWS,
+                parquet_path,
+                canonical,
+            )
+        if chunksize:
+            return scrub_crash_data_in_chunks(
+                filepath, output_file_path, chunksize, parquet_path, canonical
+            )
+
+        raw_size = os.path.getsize(filepath)
+        df_raw = load_raw_crash_data(filepath)
+        df_scrubbed = clean_crash_frame(df_raw, canonical=canonical)
+        count("rows_in", len(df_raw))
+        count("rows_out", len(df_scrubbed))
+
         # Check for duplicate DateTime entries
-        duplicates = df_cleaned["DateTime"].duplicated().sum()
-        
-        if duplicates == 0:
-            print("✅ The DateTime column is unique and can be used as an identifier.")
-        else:
-            print(f"⚠️ The DateTime column has {duplicates} duplicates. Consider using an additional column for uniqueness.")
-        
-        
-        df_cleaned["UniqueID"] = df_cleaned.apply(generate_hash, axis=1)
-        
-        # Create a new column with cleaned location names
-        df_cleaned["Location_Cleaned"] = df_cleaned["Location"].apply(clean_location)
-        
-        # Create a new column with cleaned operator names
-        df_cleaned["Operator_Cleaned"] = df_cleaned["Operator"].apply(clean_operator)
-        
-        # Apply function to extract passengers and crew aboard
-        df_cleaned[["Passengers_Aboard", "Crew_Aboard"]] = df_cleaned["Aboard"].apply(
-            lambda x: pd.Series(extract_aboard_counts(x))
-        )
-        
-        # Fill missing values with 0 in Passengers_Aboard and Crew_Aboard columns
-        df_cleaned["Passengers_Aboard"] = df_cleaned["Passengers_Aboard"].fillna(0).astype(int)
-        df_cleaned["Crew_Aboard"] = df_cleaned["Crew_Aboard"].fillna(0).astype(int)
-        
-        # Identify inconsistencies in the Aboard column (entries containing "?")
-        inconsistent_aboard_entries = df_cleaned[
-            df_cleaned["Aboard"].str.contains(r"\?", na=False)
-        ]
-        
-        # Create a new column that sums Passengers_Aboard and Crew_Aboard
-        df_cleaned["Total_Aboard"] = df_cleaned["Passengers_Aboard"] + df_cleaned["Crew_Aboard"]
-          
-        # Apply function to extract passenger and crew fatalities
-        df_cleaned[["Passengers_Fatalities", "Crew_Fatalities"]] = df_cleaned[
-            "Fatalities"
-        ].apply(lambda x: pd.Series(extract_fatalities(x)))
-        
-        # Fill missing values with 0
-        df_cleaned["Passengers_Fatalities"] = (
-            df_cleaned["Passengers_Fatalities"].fillna(0).astype(int)
-        )
-        df_cleaned["Crew_Fatalities"] = df_cleaned["Crew_Fatalities"].fillna(0).astype(int)
-        
-        # Create a new column that sums Passengers_Fatalities and Crew_Fatalities
-        df_cleaned["Total_Fatalities"] = (
-            df_cleaned["Passengers_Fatalities"] + df_cleaned["Crew_Fatalities"]
-        )
-        
-        # Rename the "Ground" column to "Ground_Fatalities"
-        df_cleaned = df_cleaned.rename(columns={"Ground": "Ground_Fatalities"})
-        
-        # Replace "?" with "Unknown" in the Flight # column
-        df_cleaned["Flight #"] = df_cleaned["Flight #"].replace("?", "Unknown")
-        
-        # Replace "?" with "Unknown" in the Route column
-        df_cleaned["Route"] = df_cleaned["Route"].replace("?", "Unknown")
-        
-        # Replace "?" with "Unknown" in the Aircraft Type column
-        df_cleaned["Aircraft Type"] = df_cleaned["Aircraft Type"].replace("?", "Unknown")
-        
-        # Replace "?" with "Unknown" in the Registration column
-        df_cleaned["Registration"] = df_cleaned["Registration"].replace("?", "Unknown")
-        
-        # create a new dataset with just the columns we want to keeps
-        df_scrubbed = df_cleaned[
-            [
-                "UniqueID",
-                "DateTime",
-                "Location_Cleaned",
-                "Operator_Cleaned",
-                "Flight #",
-                "Route",
-                "Aircraft Type",
-                "Registration",
-                "Total_Aboard",
-                "Passengers_Aboard",
-                "Crew_Aboard",
-                "Total_Fatalities",
-                "Passengers_Fatalities",
-                "Crew_Fatalities",
-                "Summary",
-            ]
-        ]
-        
-        # Display the cleaned dataset
-        print("Scrubbed Data Summaries")
-        print(df_scrubbed.info())
-        print(df_scrubbed.head(10))
-        print(df_scrubbed.tail(10))
+        report_duplicate_datetimes(df_scrubbed["DateTime"].duplicated().sum())
+
+        # Display the cleaned dataset (debug output only)
+        if is_debug():
+            print("Scrubbed Data Summaries")
+            df_scrubbed.info()
+            print(df_scrubbed.head(10))
+            print(df_scrubbed.tail(10))
            
         # Write the DataFrame to a CSV file
         df_scrubbed.to_csv(output_file_path, index=False)
@@ -195,6 +544,261 @@ def scrub_crash_data(filepath, output_file_path):
         # Confirm file creation
         print(f"File saved successfully: {output_file_path}")
 
+        if parquet_path:
+            write_crash_parquet(df_scrubbed, parquet_path)
+            print(f"Parquet file saved successfully: {parquet_path}")
+
+        save_scrub_state(
+            filepath,
+            raw_size,
+            output_file_path,
+            parquet_path,
+            guess_datetime_format(combine_date_time(df_raw)),
+            csv_date_format(df_scrubbed["DateTime"]),
+            canonical=canonical,
+        )
+
     except FileNotFoundError:
         print(f"❌ File not found: {filepath}")
-        return None
\ No newline at end of file
+        return None
+
+
+# Incremental scrub
+
+def scrub_state_path(output_file_path):
+    """Returns the file that remembers what the cleaned dataset was made from."""
+    return os.path.splitext(output_file_path)[0] + ".scrub.json"
+
+
+def canonical_state(canonical):
+    # which canonical names the cleaned rows have; new rows must get the same ones
+    return None if canonical is None else {"id": canonical.id, "rules": canonical.rules()}
+
+
+def save_scrub_state(
+    filepath,
+    raw_size,
+    output_file_path,
+    parquet_path,
+    datetime_format,
+    date_format,
+    raw_md5=None,
+    canonical=None,
+):
+    """Records which raw bytes the cleaned outputs were made from, for the next incremental scrub."""
+    state = {
+        "raw_size": raw_size,
+        "raw_md5": raw_md5 or file_digest(filepath, raw_size),
+        "datetime_format": datetime_format,
+        "date_format": date_format,
+        "output": list(file_signature(output_file_path)),
+        "parquet": list(file_signature(parquet_path)) if parquet_path else None,
+        "canonical": canonical_state(canonical),
+    }
+    path = scrub_state_path(output_file_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def load_scrub_state(output_file_path):
+    try:
+        with open(scrub_state_path(output_file_path), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def read_appended_raw_rows(filepath, state):
+    """Returns (rows, new raw size, md5) for the raw rows appended since the state was saved.
+
+    Returns None if the raw file was changed other than by appending rows.
+    The file is read once: the old part is hashed to check it is unchanged,
+    and only the appended part is parsed.
+    """
+    with open(filepath, "rb") as file:
+        header = file.readline().decode("utf-8").strip()
+        if header != ",".join(RAW_COLUMNS):
+            return None  # the old alternating layout is never appended to
+        file.seek(0)
+        md5 = hashlib.md5()
+        remaining = state["raw_size"]
+        while remaining > 0:
+            block = file.read(min(1 << 20, remaining))
+            if not block:
+                return None  # the file got shorter
+            md5.update(block)
+            remaining -= len(block)
+        if md5.hexdigest() != state["raw_md5"]:
+            return None
+        appended = file.read()
+    md5.update(appended)
+    if appended.strip():
+        rows = pd.read_csv(io.BytesIO(appended), dtype=str, header=None, names=RAW_COLUMNS)
+    else:
+        rows = pd.DataFrame(columns=RAW_COLUMNS, dtype=str)
+    return rows, state["raw_size"] + len(appended), md5.hexdigest()
+
+
+def _csv_text(df_scrubbed, date_format):
+    # the scrubbed rows exactly as they read back from the cleaned CSV, every value a string
+    buffer = io.StringIO()
+    df_scrubbed.to_csv(buffer, index=False, date_format=date_format)
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype=str, keep_default_na=False)
+
+
+# columns an update of a crash page may change; a row that differs anywhere else is another crash
+UPDATABLE_COLUMNS = ["Summary"] + COUNT_COLUMNS
+
+
+def merge_crash_rows(existing, fresh):
+    """Decides what to do with every freshly scrubbed row.
+
+    existing holds the cleaned rows that share a UniqueID with a fresh row
+    and fresh the fresh rows, both as CSV text with the SCRUBBED_COLUMNS. A
+    fresh row equal to an existing one is skipped (a page crawled again). A
+    fresh row that matches exactly one row on UniqueID and every column
+    but the UPDATABLE_COLUMNS replaces it (the crash was updated, e.g. its
+    summary or counts changed); the UniqueID alone isn't enough, as some
+    different crashes share a date and place. Any other fresh row is a new
+    crash. Fresh rows are applied in order, so a later update wins.
+
+    Returns (updates, added): updates maps an existing index label to the
+    position of the fresh row replacing it, added lists the positions of
+    the fresh rows to append.
+    """
+    key_columns = [
+        index for index, column in enumerate(SCRUBBED_COLUMNS) if column not in UPDATABLE_COLUMNS
+    ]
+    rows = {}  # key -> [[label or ("added", n), values]]
+
+    def key(values):
+        return tuple(values[index] for index in key_columns)
+
+    for label, values in zip(existing.index, existing.itertuples(index=False, name=None)):
+        rows.setdefault(key(values), []).append([label, values])
+    updates = {}
+    added = []
+    for position, values in enumerate(fresh.itertuples(index=False, name=None)):
+        matches = rows.setdefault(key(values), [])
+        if any(old == values for _, old in matches):
+            continue
+        if len(matches) == 1:
+            label = matches[0][0]
+            if isinstance(label, tuple):
+                added[label[1]] = position  # updates a crash added earlier in this run
+            else:
+                updates[label] = position
+            matches[0][1] = values
+        else:
+            matches.append([("added", len(added)), values])
+            added.append(position)
+    return updates, added
+
+
+def scrub_crash_data_incremental(
+    filepath, output_file_path, parquet_path=None, chunksize=None, canonical=None, processes=None
+):
+    """Cleans only the raw rows appended since the last scrub and merges them into the outputs.
+
+    The crawl only ever appends to the raw CSV, so the last scrub's state
+    file records how many raw bytes went into the cleaned dataset (and
+    their md5). The appended rows are cleaned and merged by UniqueID with
+    merge_crash_rows: new crashes are appended to the cleaned CSV without
+    rewriting it; only updated crashes make it rewrite the CSV, with no
+    other row cleaned again. In the Parquet file only the years with new or
+    updated crashes are rewritten (see update_crash_parquet). A full scrub
+    (with chunksize, if given) runs instead when there is no usable state:
+    the first run, a raw file that was rewritten, outputs that changed since
+    the last scrub, or canonical names that were started afresh or made
+    with other rules. The full scrub uses `processes` worker processes.
+    """
+    state = load_scrub_state(output_file_path)
+    reason = None
+    if state is None:
+        reason = "no state from an earlier scrub"
+    elif not os.path.exists(output_file_path) or list(file_signature(output_file_path)) != state["output"]:
+        reason = f"{output_file_path} changed since the last scrub"
+    elif parquet_path and (
+        not os.path.exists(parquet_path) or list(file_signature(parquet_path)) != state["parquet"]
+    ):
+        reason = f"{parquet_path} changed since the last scrub"
+    elif state.get("canonical") != canonical_state(canonical):
+        reason = "the canonical names changed since the last scrub"
+    appended = None if reason else read_appended_raw_rows(filepath, state)
+    if reason is None and appended is None:
+        reason = f"{filepath} was rewritten, or isn't in the one-row-per-crash layout"
+    df_fresh = None
+    if appended is not None:
+        rows, raw_size, raw_md5 = appended
+        df_fresh = clean_crash_frame(rows, state["datetime_format"], canonical)
+        if state["date_format"] == DATE_FORMAT and csv_date_format(df_fresh["DateTime"]) != DATE_FORMAT:
+            reason = "the new crashes have times and the cleaned CSV has none"
+    if reason:
+        print(f"Full scrub: {reason}")
+        return scrub_crash_data(
+            filepath,
+            output_file_path,
+            chunksize,
+            parquet_path,
+            canonical=canonical,
+            processes=processes,
+        )
+
+    count("rows_in", len(rows))
+    date_format = state["date_format"]
+    fresh_text = _csv_text(df_fresh, date_format)
+    fresh_ids = set(fresh_text["UniqueID"])
+    if parquet_path:
+        ids = pd.read_parquet(parquet_path, columns=["UniqueID"])["UniqueID"]
+    else:
+        ids = pd.read_csv(output_file_path, usecols=["UniqueID"], dtype=str)["UniqueID"]
+    if ids.isin(fresh_ids).any():
+        # only the crashes sharing a UniqueID with a fresh row are compared
+        old_text = pd.read_csv(output_file_path, dtype=str, keep_default_na=False)
+        known = old_text["UniqueID"].isin(fresh_ids).to_numpy()
+        updates, added = merge_crash_rows(old_text[known], fresh_text)
+    else:
+        updates, added = {}, list(range(len(fresh_text)))
+
+    if updates:
+        # the CSV holds updated rows somewhere in the middle, so it is written again
+        for label, position in updates.items():
+            old_text.loc[label] = fresh_text.iloc[position].to_numpy()
+        pd.concat([old_text, fresh_text.iloc[added]], ignore_index=True).to_csv(
+            output_file_path, index=False
+        )
+    elif added:
+        with open(output_file_path, "a", encoding="utf-8", newline="") as output:
+            fresh_text.iloc[added].to_csv(output, header=False, index=False)
+    if parquet_path and (updates or added):
+        replaced = None
+        if updates:
+            # the n-th crash with a UniqueID is the same one in the CSV and the Parquet file
+            occurrences = old_text.groupby("UniqueID", sort=False).cumcount()
+            replaced = df_fresh.iloc[list(updates.values())].assign(
+                Occurrence=occurrences[list(updates)].to_numpy()
+            )
+        update_crash_parquet(parquet_path, df_fresh.iloc[added], replaced)
+    save_scrub_state(
+        filepath,
+        raw_size,
+        output_file_path,
+        parquet_path,
+        state["datetime_format"],
+        date_format,
+        raw_md5,
+        canonical,
+    )
+
+    count("rows_out", len(added) + len(updates))
+    skipped = len(fresh_text) - len(added) - len(updates)
+    print(
+        f"Scrubbed {len(fresh_text)} new raw rows: {len(added)} crashes added, "
+        f"{len(updates)} updated, {skipped} unchanged"
+    )
+    if updates or added:
+        print(f"File saved successfully: {output_file_path}")
+        if parquet_path:
+            print(f"Parquet file saved successfully: {parquet_path}")
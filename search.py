@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+"""
+Summary Search Index for Plane Crash Dummy Project
+
+An inverted index over the Summary column of the cleaned crash data, so
+keyword searches don't scan every summary with str.contains. Examples:
+    python search.py icing
+    python search.py '"loss of control" AND (fog OR storm)' --years 1970-1999
+    python search.py 'cfit OR "controlled flight into terrain"' --operator Aeroflot
+    python search.py --ngrams 2 --top 20 hijacking
+
+Every crash is a document numbered in the order it was indexed. A term's
+posting list holds (document gap, occurrences) pairs as varints (7 bits per
+byte). Every document's term ids are kept in order as well, for checking
+phrases and counting n-grams. Documents carry their UniqueID, year and operator
+for the facets. The index is saved to one .npz file and updated in place:
+new crashes are appended, changed or removed ones are marked deleted until
+enough of them pile up to make a rebuild worthwhile.
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from dataset import content_hashes, crash_occurrences, load_crash_data, match_crashes
+from metrics import count
+
+INDEX_PATH = "data/summary_index.npz"
+INDEX_FORMAT = 1
+
+# words are runs of letters, digits and _ in the lowercased summary
+TOKEN_PATTERN = r"\w+"
+
+# summaries tokenized at once while indexing
+BATCH_ROWS = 100_000
+
+# share of deleted documents at which update() rebuilds the index
+REBUILD_FRACTION = 0.25
+
+INDEX_COLUMNS = ["UniqueID", "Year", "Operator_Cleaned", "Summary"]
+
+
+def tokenize(text):
+    """Returns the index terms of a text, in order."""
+    return re.findall(TOKEN_PATTERN, str(text).lower())
+
+
+def tokenize_column(texts):
+    """tokenize for a whole column.
+
+    Returns (codes, terms, lengths): codes are all the texts' terms one
+    after the other as positions in the list of distinct terms, lengths the
+    number of terms per text. The texts are split at whitespace first (by
+    pyarrow when it is installed) and every distinct piece, like "dc-3," or
+    "crashed", is tokenized only once.
+    """
+    texts = texts.fillna("")
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        pieces = texts.astype(object).str.lower().str.split()
+        piece_counts = pieces.str.len().to_numpy()
+        piece_codes, distinct = pd.factorize(pieces.explode().dropna())
+    else:
+        pieces = pc.ascii_split_whitespace(pc.utf8_lower(pa.array(texts, type=pa.string())))
+        if isinstance(pieces, pa.ChunkedArray):
+            pieces = pieces.combine_chunks()
+        piece_counts = pc.list_value_length(pieces).to_numpy()
+        encoded = pc.dictionary_encode(pc.list_flatten(pieces))
+        piece_codes = encoded.indices.to_numpy()
+        distinct = encoded.dictionary.to_pylist()
+
+    terms = {}
+    piece_terms = [[terms.setdefault(term, len(terms)) for term in tokenize(piece)] for piece in distinct]
+    # every piece occurrence expands to its terms
+    sizes = np.array([len(codes) for codes in piece_terms], dtype=np.int64)
+    piece_starts = np.cumsum(sizes) - sizes
+    all_codes = np.fromiter(
+        (code for codes in piece_terms for code in codes), dtype=np.int64, count=sizes.sum()
+    )
+    counts = sizes[piece_codes]
+    shift = np.repeat(piece_starts[piece_codes] - (np.cumsum(counts) - counts), counts)
+    codes = all_codes[np.arange(counts.sum()) + shift]
+    owners = np.repeat(np.arange(len(texts)), piece_counts)
+    lengths = np.bincount(owners, weights=counts, minlength=len(texts)).astype(np.int64)
+    return codes, list(terms), lengths
+
+
+def encode_varints(values):
+    """Encodes non-negative ints as varints, 7 bits per byte with the high bit on all but the last.
+
+    Returns the bytes as a uint8 array and how many bytes each value took.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for bits in range(7, 63, 7):
+        sizes += values >= 1 << bits
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    data = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    data[starts] = values & 0x7F
+    for byte in range(1, int(sizes.max()) if len(sizes) else 0):
+        more = np.flatnonzero(sizes > byte)
+        data[starts[more] + byte - 1] |= 0x80
+        data[starts[more] + byte] = (values[more] >> (7 * byte)) & 0x7F
+    return data, sizes
+
+
+def decode_varints(data):
+    """Decodes varints written by encode_varints into an int64 array."""
+    data = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    sizes = ends - starts + 1
+    values = (data[starts] & 0x7F).astype(np.int64)
+    for byte in range(1, int(sizes.max()) if len(sizes) else 0):
+        more = sizes > byte
+        values[more] |= (data[starts[more] + byte] & 0x7F).astype(np.int64) << (7 * byte)
+    return values
+
+
+class SummaryIndex:
+    """Inverted index over crash summaries with year and operator facets.
+
+    Build or refresh it with update(), query it with search() and
+    ngram_counts(), and keep it with save() / SummaryIndex.load().
+    """
+
+    def __init__(self):
+        # per document
+        self.uids = np.empty(0, dtype=object)
+        self.occurrences = np.empty(0, dtype=np.int32)  # n-th crash with this UniqueID
+        self.years = np.empty(0, dtype=np.int16)  # -1 where the date is unknown
+        self.operators = np.empty(0, dtype=np.int32)  # position in operator_names
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.live = np.empty(0, dtype=bool)
+        # the term ids of document d in order are forward[token_offsets[d]:token_offsets[d + 1]]
+        self.forward = np.empty(0, dtype=np.uint16)
+        self.token_offsets = np.zeros(1, dtype=np.int64)
+        self.operator_names = []
+        self.operator_codes = {}
+        # per term
+        self.vocabulary = []
+        self.term_ids = {}
+        self.postings = []  # varint (document gap, occurrences) pairs
+        self.last_doc = []  # the last document in each posting list, -1 for none
+
+    @property
+    def size(self):
+        return len(self.uids)
+
+    @property
+    def documents(self):
+        """Number of documents that aren't deleted."""
+        return int(self.live.sum())
+
+    # building
+
+    def _term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.vocabulary)
+            self.vocabulary.append(term)
+            self.postings.append(b"")
+            self.last_doc.append(-1)
+        return term_id
+
+    def _operator_code(self, name):
+        code = self.operator_codes.get(name)
+        if code is None:
+            code = self.operator_codes[name] = len(self.operator_names)
+            self.operator_names.append(name)
+        return code
+
+    def add(self, df, occurrences, hashes):
+        """Appends the crashes in df (INDEX_COLUMNS) as new documents."""
+        for start in range(0, len(df), BATCH_ROWS):
+            stop = start + BATCH_ROWS
+            self._add_batch(df.iloc[start:stop], occurrences[start:stop], hashes[start:stop])
+
+    def _add_batch(self, df, occurrences, hashes):
+        first = self.size
+        rows = len(df)
+        codes, terms, lengths = tokenize_column(df["Summary"])
+        term_ids = np.array([self._term_id(term) for term in terms], dtype=np.int64)[codes]
+
+        # forward index, in uint16 until there are more terms than that holds
+        if len(self.vocabulary) - 1 > np.iinfo(self.forward.dtype).max:
+            self.forward = self.forward.astype(np.uint32)
+        self.forward = np.concatenate([self.forward, term_ids.astype(self.forward.dtype)])
+        self.token_offsets = np.concatenate(
+            [self.token_offsets, self.token_offsets[-1] + np.cumsum(lengths)]
+        )
+
+        # posting lists: (term, document) pairs sorted by term, then document
+        docs = np.repeat(np.arange(first, first + rows, dtype=np.int64), lengths)
+        pairs, occurrences_in_doc = np.unique(term_ids * (first + rows) + docs, return_counts=True)
+        pair_terms, pair_docs = np.divmod(pairs, first + rows)
+        term_starts = np.flatnonzero(np.r_[True, pair_terms[1:] != pair_terms[:-1]][: len(pairs)])
+        terms = pair_terms[term_starts]
+        gaps = np.diff(pair_docs, prepend=0)
+        gaps[term_starts] = pair_docs[term_starts] - np.array(
+            [self.last_doc[term] for term in terms], dtype=np.int64
+        )
+        data, sizes = encode_varints(np.column_stack([gaps, occurrences_in_doc]).ravel())
+        pair_bytes = np.concatenate([[0], np.cumsum(sizes.reshape(-1, 2).sum(axis=1))])
+        term_stops = np.r_[term_starts[1:], len(pairs)]
+        data = data.tobytes()
+        for term, start, stop in zip(terms.tolist(), term_starts.tolist(), term_stops.tolist()):
+            self.postings[term] += data[pair_bytes[start] : pair_bytes[stop]]
+            self.last_doc[term] = int(pair_docs[stop - 1])
+
+        # facets
+        years = df["Year"].astype("Int64").fillna(-1).to_numpy(dtype=np.int16)
+        codes, names = pd.factorize(df["Operator_Cleaned"].astype(object).fillna(""))
+        operators = np.array([self._operator_code(str(name)) for name in names], dtype=np.int32)
+        self.uids = np.concatenate([self.uids, df["UniqueID"].astype(object).to_numpy()])
+        self.occurrences = np.concatenate([self.occurrences, occurrences.astype(np.int32)])
+        self.years = np.concatenate([self.years, years])
+        self.operators = np.concatenate([self.operators, operators[codes]])
+        self.hashes = np.concatenate([self.hashes, hashes])
+        self.live = np.concatenate([self.live, np.ones(rows, dtype=bool)])
+
+    def update(self, df):
+        """Brings the index in line with the crashes in df (INDEX_COLUMNS).
+
+        A crash is identified by its UniqueID and how many crashes with
+        that UniqueID come before it. New crashes are appended, crashes
+        whose year, operator or summary changed are deleted and added
+        again, and crashes that are gone are deleted. Once more than
+        REBUILD_FRACTION of the documents are deleted the index is rebuilt.
+        Returns (added, deleted) counts.
+        """
+        df = df[INDEX_COLUMNS].reset_index(drop=True)
+        uids = df["UniqueID"].astype(object).to_numpy()
+        occurrences = crash_occurrences(uids)
+        years = df["Year"].astype("Int64").fillna(-1).to_numpy(dtype=np.int64)
+        hashes = content_hashes(
+            {"year": years, "operator": df["Operator_Cleaned"], "summary": df["Summary"]}
+        )
+
+        live_docs = np.flatnonzero(self.live)
+        # the document of every crash, -1 for new ones
+        docs = match_crashes(self.uids[live_docs], self.occurrences[live_docs], uids, occurrences)
+        found = docs >= 0
+        docs[found] = live_docs[docs[found]]
+        unchanged = found.copy()
+        unchanged[found] = self.hashes[docs[found]] == hashes[found]
+        kept = np.zeros(self.size, dtype=bool)
+        kept[docs[unchanged]] = True
+        deleted = live_docs[~kept[live_docs]]
+        added = np.flatnonzero(~unchanged)
+
+        if self.size - self.documents + len(deleted) > REBUILD_FRACTION * max(self.size, 1):
+            self.__init__()
+            self.add(df, occurrences, hashes)
+            added = np.arange(len(df))
+        else:
+            self.live[deleted] = False
+            self.add(df.iloc[added], occurrences[added], hashes[added])
+        return len(added), len(deleted)
+
+    # querying
+
+    def term_docs(self, term):
+        """Returns the documents containing a term (deleted ones included), sorted."""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int64)
+        return np.cumsum(decode_varints(self.postings[term_id])[0::2]) - 1
+
+    def _doc_terms(self, docs):
+        # (term ids of the documents one after the other, which of docs each term belongs to)
+        starts = self.token_offsets[docs]
+        lengths = self.token_offsets[docs + 1] - starts
+        shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        term_ids = self.forward[np.arange(lengths.sum()) + shift].astype(np.int64)
+        return term_ids, np.repeat(np.arange(len(docs)), lengths)
+
+    def phrase_docs(self, terms):
+        """Returns the documents with the terms next to each other in this order."""
+        if len(terms) == 1:
+            return self.term_docs(terms[0])
+        if any(term not in self.term_ids for term in terms):
+            return np.empty(0, dtype=np.int64)
+        # the documents with the two rarest terms are checked, common words like "of" are left out
+        rarest = sorted(set(terms), key=lambda term: len(self.postings[self.term_ids[term]]))
+        candidates = self.term_docs(rarest[0])
+        for term in rarest[1:2]:
+            candidates = np.intersect1d(candidates, self.term_docs(term), assume_unique=True)
+        term_ids, owners = self._doc_terms(candidates)
+        # phrase starts: where the rarest term is, minus its place in the phrase
+        anchor = terms.index(rarest[0])
+        starts = np.flatnonzero(term_ids == self.term_ids[rarest[0]]) - anchor
+        starts = starts[(starts >= 0) & (starts + len(terms) <= len(term_ids))]
+        match = owners[starts] == owners[starts + len(terms) - 1]
+        for offset, term in enumerate(terms):
+            match &= term_ids[starts + offset] == self.term_ids[term]
+        return np.unique(candidates[owners[starts[match]]])
+
+    def facet_mask(self, years=None, operators=None):
+        """Returns which documents are live and from the years and operators asked for."""
+        mask = self.live.copy()
+        if years is not None:
+            mask &= np.isin(self.years, list(years))
+        if operators is not None:
+            codes = [self.operator_codes[name] for name in operators if name in self.operator_codes]
+            mask &= np.isin(self.operators, codes)
+        return mask
+
+    def match(self, query, years=None, operators=None):
+        """Returns the live documents matching a query and the facets, sorted.
+
+        Terms next to each other must all occur (AND); OR, NOT (or a
+        leading -), parentheses and "quoted phrases" work as usual. A
+        word that tokenizes into several terms ("DC-3") is a phrase.
+        """
+        mask = self.facet_mask(years, operators)
+        if query is None or not query.strip():
+            return np.flatnonzero(mask)
+        docs = QueryParser(self, query).parse()
+        return docs[mask[docs]]
+
+    def search(self, query, years=None, operators=None):
+        """Returns the UniqueIDs of the crashes matching a query, in indexing order; see match()."""
+        return self.uids[self.match(query, years, operators)].tolist()
+
+    def ngram_counts(self, n=1, top=50, query=None, years=None, operators=None):
+        """Counts the n-word sequences in the matching summaries.
+
+        Returns a Series of the top most frequent n-grams and their counts,
+        like Counter.most_common.
+        """
+        docs = self.match(query, years, operators)
+        term_ids, owners = self._doc_terms(docs)
+        if n == 1:
+            counts = np.bincount(term_ids, minlength=len(self.vocabulary))
+            ranked = np.argsort(-counts, kind="stable")[:top]
+            ranked = ranked[counts[ranked] > 0]
+            return pd.Series(
+                counts[ranked], index=[self.vocabulary[term] for term in ranked], dtype=np.int64
+            )
+        starts = np.arange(max(len(term_ids) - n + 1, 0))
+        starts = starts[owners[starts] == owners[starts + n - 1]]
+        grams = np.column_stack([term_ids[starts + offset] for offset in range(n)])
+        unique, counts = np.unique(grams, axis=0, return_counts=True)
+        ranked = np.argsort(-counts, kind="stable")[:top]
+        names = [" ".join(self.vocabulary[term] for term in unique[row]) for row in ranked]
+        return pd.Series(counts[ranked], index=names, dtype=np.int64)
+
+    # storage
+
+    def save(self, path=INDEX_PATH):
+        lengths = np.array([len(posting) for posting in self.postings], dtype=np.int64)
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            np.savez(
+                file,
+                format=np.array([INDEX_FORMAT]),
+                uids=self.uids.astype(bytes),
+                occurrences=self.occurrences,
+                years=self.years,
+                operators=self.operators,
+                hashes=self.hashes,
+                live=self.live,
+                forward=self.forward,
+                token_offsets=self.token_offsets,
+                operator_names=np.array(self.operator_names, dtype=str),
+                vocabulary=np.array(self.vocabulary, dtype=str),
+                postings=np.frombuffer(b"".join(self.postings), dtype=np.uint8),
+                posting_offsets=np.concatenate([[0], np.cumsum(lengths)]),
+                last_doc=np.array(self.last_doc, dtype=np.int64),
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        """Reads an index saved with save(); returns an empty index if there is none or it's outdated."""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        with np.load(path, allow_pickle=False) as data:
+            if data["format"][0] != INDEX_FORMAT:
+                return index
+            index.uids = data["uids"].astype(str).astype(object)
+            for name in [
+                "occurrences",
+                "years",
+                "operators",
+                "hashes",
+                "live",
+                "forward",
+                "token_offsets",
+            ]:
+                setattr(index, name, data[name])
+            index.operator_names = data["operator_names"].tolist()
+            index.vocabulary = data["vocabulary"].tolist()
+            postings = data["postings"].tobytes()
+            offsets = data["posting_offsets"].tolist()
+            index.last_doc = data["last_doc"].tolist()
+        index.operator_codes = {name: code for code, name in enumerate(index.operator_names)}
+        index.term_ids = {term: term_id for term_id, term in enumerate(index.vocabulary)}
+        index.postings = [postings[start:stop] for start, stop in zip(offsets, offsets[1:])]
+        return index
+
+
+class QueryParser:
+    """Evaluates a query string against a SummaryIndex into a sorted array of documents."""
+
+    TOKENS = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"?|(-)(?=\S)|([^\s()"]+))')
+
+    def __init__(self, index, query):
+        self.index = index
+        self.items = []
+        for opening, closing, phrase, minus, word in self.TOKENS.findall(query):
+            if opening or closing:
+                self.items.append(opening or closing)
+            elif minus:
+                self.items.append("NOT")
+            elif word in ("AND", "OR", "NOT"):
+                self.items.append(word)
+            else:
+                self.items.append(("terms", tokenize(phrase or word)))
+        self.position = 0
+
+    def peek(self):
+        return self.items[self.position] if self.position < len(self.items) else None
+
+    def take(self):
+        item = self.peek()
+        self.position += 1
+        return item
+
+    def parse(self):
+        docs = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"Unexpected {self.peek()!r} in query")
+        return docs
+
+    def parse_or(self):
+        docs = self.parse_and()
+        while self.peek() == "OR":
+            self.take()
+            docs = np.union1d(docs, self.parse_and())
+        return docs
+
+    def parse_and(self):
+        docs = self.parse_not()
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            docs = np.intersect1d(docs, self.parse_not(), assume_unique=True)
+        return docs
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.take()
+            everything = np.arange(self.index.size, dtype=np.int64)
+            return np.setdiff1d(everything, self.parse_not(), assume_unique=True)
+        return self.parse_item()
+
+    def parse_item(self):
+        item = self.take()
+        if item == "(":
+            docs = self.parse_or()
+            if self.take() != ")":
+                raise ValueError("Missing ) in query")
+            return docs
+        if isinstance(item, tuple):
+            terms = item[1]
+            if not terms:
+                return np.arange(self.index.size, dtype=np.int64)  # nothing to look for, e.g. "&"
+            return self.index.phrase_docs(terms)
+        raise ValueError(f"Unexpected {item!r} in query" if item else "Query ends too early")
+
+
+def update_summary_index(source, path=INDEX_PATH):
+    """Builds or refreshes the summary index saved at path from the cleaned crash data."""
+    df = load_crash_data(source, columns=INDEX_COLUMNS)
+    count("rows_in", len(df))
+    index = SummaryIndex.load(path)
+    added, deleted = index.update(df)
+    index.save(path)
+    count("rows_out", added)
+    print(
+        f"Indexed {added} summaries, {deleted} removed "
+        f"({index.documents} crashes, {len(index.vocabulary)} terms)"
+    )
+    print(f"Index saved successfully: {path}")
+    return index
+
+
+def parse_years(text):
+    # "1990" or "1970-1999"
+    first, _, last = text.partition("-")
+    return range(int(first), int(last or first) + 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("query", nargs="*", help="words, \"phrases\", AND, OR, NOT, -word, ( )")
+    parser.add_argument("--index", default=INDEX_PATH, help="index file")
+    parser.add_argument("--years", type=parse_years, help="a year or range, e.g. 1970-1999")
+    parser.add_argument("--operator", action="append", help="only this operator (repeatable)")
+    parser.add_argument("--ngrams", type=int, help="count n-grams in the matches instead")
+    parser.add_argument("--top", type=int, default=20, help="how many results or n-grams to show")
+    args = parser.parse_args()
+
+    index = SummaryIndex.load(args.index)
+    if not index.size:
+        parser.error(f"no index at {args.index}; run python main.py summary_index first")
+    query = " ".join(args.query)
+    try:
+        if args.ngrams:
+            ngrams = index.ngram_counts(args.ngrams, args.top, query, args.years, args.operator)
+        else:
+            docs = index.match(query, args.years, args.operator)
+    except ValueError as err:  # a query that doesn't parse, e.g. "fire AND ("
+        parser.error(str(err))
+    if args.ngrams:
+        print(ngrams)
+    else:
+        print(f"{len(docs)} crashes match")
+        for doc in docs[: args.top]:
+            year = index.years[doc] if index.years[doc] >= 0 else "?"
+            print(f"{index.uids[doc]}  {year}  {index.operator_names[index.operators[doc]]}")
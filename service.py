@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Query Service for Plane Crash Dummy Project
+
+A local HTTP server answering analysis questions as JSON from a cleaned
+crash dataset that is loaded into memory once. Examples:
+    python service.py --data data/CrashTestInfo_Cleaned.parquet --port 8050
+    curl 'localhost:8050/years?years=1970-1979&operator=Aeroflot'
+    curl 'localhost:8050/top?by=locations&n=5&category=Weather-Related'
+    curl 'localhost:8050/worst?n=3'
+    curl 'localhost:8050/categories?window=3'
+
+Every question takes the filters years (e.g. 1990 or 1970-1999),
+category, operator and location (each repeatable). Counts come from an
+in-memory CrashCube, the worst crashes from the rows. Answers are cached
+by their normalized query (parameter order, duplicates and defaults don't
+matter), least recently used first out. The data file is checked at most
+every check_interval seconds; when it really changed it is loaded again,
+the cube updated for the changed crashes only, and the cache emptied.
+Questions asked during a reload are answered from the old data.
+"""
+import argparse
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_COLUMNS, CrashCube
+from dataset import read_crash_data
+from manifest import file_digest, file_signature
+from search import parse_years
+
+SERVICE_COLUMNS = CUBE_COLUMNS + ["DateTime"]
+
+# what a worst crash is shown with
+WORST_COLUMNS = ["UniqueID", "DateTime", "Location_Cleaned", "Operator_Cleaned", "Total_Fatalities", "Summary"]
+
+# the loaded data: rows, their cube, and what file it came from
+Snapshot = namedtuple("Snapshot", ["frame", "cube", "signature", "digest", "version"])
+
+
+class QueryError(ValueError):
+    """A question the service can't answer as asked; reported with HTTP 400."""
+
+
+class UnknownQuestion(QueryError):
+    """A question the service doesn't know; reported with HTTP 404."""
+
+
+class QueryCache:
+    """Thread-safe LRU cache of encoded answers, dropping the least recently used beyond max_entries."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def parse_int(params, name, default, low=1, high=1000):
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[-1])
+    except ValueError:
+        raise QueryError(f"{name} must be a whole number") from None
+    if not low <= value <= high:
+        raise QueryError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def normalize_query(path, params):
+    """Returns (question, options) with every filter and option spelled one way.
+
+    Filters become sorted tuples (years a sorted tuple of years), so the
+    result is a cache key; missing options get their defaults.
+    """
+    question = path.strip("/")
+    if question not in QUESTIONS:
+        raise UnknownQuestion(f"unknown question {question!r}; ask one of {', '.join(sorted(QUESTIONS))}")
+    options = {}
+    if params.get("years"):
+        years = set()
+        for text in params["years"]:
+            try:
+                years.update(parse_years(text))
+            except ValueError:
+                raise QueryError(f"years must look like 1990 or 1970-1999, not {text!r}") from None
+        options["years"] = tuple(sorted(years))
+    for name, key in [("category", "categories"), ("operator", "operators"), ("location", "locations")]:
+        if params.get(name):
+            options[key] = tuple(sorted(set(params[name])))
+    if question in ("top", "worst"):
+        options["n"] = parse_int(params, "n", 10)
+    if question == "top":
+        by = (params.get("by") or ["operators"])[-1]
+        if by not in ("operators", "locations"):
+            raise QueryError("by must be operators or locations")
+        options["by"] = by
+    if question == "categories":
+        options["window"] = parse_int(params, "window", 3, high=100)
+    if question == "survival":
+        options["bins"] = parse_int(params, "bins", 20)
+    return question, options
+
+
+def filters_of(options):
+    return {key: options.get(key) for key in ("years", "categories", "operators", "locations")}
+
+
+def per_year(snapshot, options):
+    filters = filters_of(options)
+    crashes = snapshot.cube.crashes_per_year(**filters)
+    return {
+        "years": crashes.index.tolist(),
+        "crashes": crashes.tolist(),
+        "fatalities": snapshot.cube.fatalities_per_year(**filters).tolist(),
+        "aboard": snapshot.cube.aboard_per_year(**filters).tolist(),
+    }
+
+
+def top(snapshot, options):
+    counts = snapshot.cube.top(options["by"], options["n"], **filters_of(options))
+    return {"names": counts.index.tolist(), "crashes": counts.tolist()}
+
+
+def worst(snapshot, options):
+    positions = snapshot.cube.worst_rows(options["n"], **filters_of(options))
+    rows = snapshot.frame.iloc[positions][WORST_COLUMNS]
+    rows = rows.assign(DateTime=rows["DateTime"].dt.strftime("%Y-%m-%dT%H:%M:%S"))
+    return {"crashes": json.loads(rows.to_json(orient="records"))}
+
+
+def categories(snapshot, options):
+    trends = snapshot.cube.category_trends(options["window"], **filters_of(options))
+    return {
+        "years": trends.index.tolist(),
+        "categories": {
+            name: [None if np.isnan(value) else value for value in trends[name].tolist()]
+            for name in trends.columns
+        },
+    }
+
+
+def survival(snapshot, options):
+    counts, edges = snapshot.cube.survival_histogram(options["bins"], **filters_of(options))
+    return {"counts": counts.tolist(), "edges": edges.tolist()}
+
+
+# question -> function answering it from a Snapshot and the normalized options
+QUESTIONS = {
+    "years": per_year,
+    "top": top,
+    "worst": worst,
+    "categories": categories,
+    "survival": survival,
+}
+
+
+def with_contiguous_text(frame):
+    """Returns frame with every Arrow-backed text column in one piece.
+
+    Read from Parquet a column comes in one chunk per row group, and
+    taking a few rows of a chunked column copies all of it first.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return frame
+    frame = frame.copy(deep=False)
+    for column in frame.columns:
+        if getattr(frame[column].dtype, "storage", None) != "pyarrow":
+            continue
+        chunks = pa.array(frame[column])
+        if isinstance(chunks, pa.ChunkedArray) and chunks.num_chunks > 1:
+            frame[column] = pd.array(chunks.combine_chunks(), dtype=frame[column].dtype)
+    return frame
+
+
+class CrashQueryService:
+    """Answers questions about the crash data in a file, caching the encoded answers.
+
+    Args:
+        path: CrashTestInfo_Cleaned.csv or the .parquet file.
+        cache_size: How many answers are kept.
+        check_interval: Seconds between checks of the file for changes.
+    """
+
+    def __init__(self, path, cache_size=1024, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.cache = QueryCache(cache_size)
+        self.reload_lock = threading.Lock()
+        self.snapshot = self._load(None)
+        self.checked = time.monotonic()
+
+    def _load(self, previous):
+        # reads the file; the cube of the previous snapshot is copied and updated
+        signature = file_signature(self.path)
+        digest = file_digest(self.path)
+        frame = with_contiguous_text(read_crash_data(self.path, columns=SERVICE_COLUMNS))
+        cube = CrashCube() if previous is None else copy.deepcopy(previous.cube)
+        cube.update(frame)
+        cube.worst_rows()  # sorts the crashes by fatalities before the first question
+        version = 0 if previous is None else previous.version + 1
+        return Snapshot(frame, cube, signature, digest, version)
+
+    def current(self):
+        """Returns the snapshot to answer from, loading the file again if it changed.
+
+        One thread checks and reloads at a time; the others don't wait for
+        it and answer from the snapshot they have until the new one is
+        swapped in. When the file can't be read (missing or half-written)
+        the last good snapshot is kept and the file is tried again after
+        check_interval.
+        """
+        if time.monotonic() - self.checked < self.check_interval:
+            return self.snapshot
+        if not self.reload_lock.acquire(blocking=False):
+            return self.snapshot  # another thread is checking or reloading
+        try:
+            snapshot = self.snapshot
+            signature = file_signature(self.path)
+            if signature != snapshot.signature:
+                if file_digest(self.path) == snapshot.digest:
+                    # touched or copied over with the same contents
+                    snapshot = snapshot._replace(signature=signature)
+                else:
+                    snapshot = self._load(snapshot)
+                    self.cache.clear()
+                self.snapshot = snapshot
+        except Exception as error:
+            print(
+                f"Could not reload {self.path}, still answering from version "
+                f"{self.snapshot.version}: {type(error).__name__}: {error}"
+            )
+        finally:
+            self.checked = time.monotonic()
+            self.reload_lock.release()
+        return self.snapshot
+
+    def answer(self, path, params):
+        """Returns the JSON answer (bytes) to a question with its query parameters."""
+        question, options = normalize_query(path, params)
+        snapshot = self.current()
+        key = (snapshot.version, question, tuple(sorted(options.items())))
+        body = self.cache.get(key)
+        if body is None:
+            result = QUESTIONS[question](snapshot, options)
+            body = json.dumps(result).encode("utf-8")
+            self.cache.put(key, body)
+        return body
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            "path": self.path,
+            "version": snapshot.version,
+            "crashes": len(snapshot.frame),
+            "cells": snapshot.cube.size,
+            "cache": self.cache.stats(),
+        }
+
+
+def make_server(service, host="127.0.0.1", port=8050):
+    """Returns a threaded HTTP server answering GET requests from service (port 0 picks a free one)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            try:
+                if url.path.strip("/") == "stats":
+                    body = json.dumps(service.stats()).encode("utf-8")
+                else:
+                    body = service.answer(url.path, parse_qs(url.query))
+                status = 200
+            except QueryError as error:
+                body = json.dumps({"error": str(error)}).encode("utf-8")
+                status = 404 if isinstance(error, UnknownQuestion) else 400
+            except Exception as error:
+                # e.g. a data file missing or half-written during a reload
+                message = f"internal error: {type(error).__name__}: {error}"
+                body = json.dumps({"error": message}).encode("utf-8")
+                status = 500
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client went away
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # the default backlog of 5 drops connections when many clients ask at once
+        request_queue_size = 128
+
+    return Server((host, port), Handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data", default="data/CrashTestInfo_Cleaned.parquet", help="cleaned dataset")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--cache", type=int, default=1024, help="answers kept in the cache")
+    args = parser.parse_args()
+
+    service = CrashQueryService(args.data, cache_size=args.cache)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving {args.data} ({len(service.snapshot.frame)} crashes) on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
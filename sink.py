@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Record Sink for Plane Crash Dummy Project
+
+Buffers parsed crash records and writes them to the raw CSV in batches, one
+row per crash with fixed named columns.
+"""
+import csv
+import os
+import time
+
+# fixed column layout of the raw crash CSV
+RAW_COLUMNS = [
+    "Date",
+    "Time",
+    "Location",
+    "Operator",
+    "Flight #",
+    "Route",
+    "Aircraft Type",
+    "Registration",
+    "cn / ln",
+    "Aboard",
+    "Fatalities",
+    "Ground",
+    "Summary",
+]
+
+# page labels that don't simply lose their colon
+LABEL_ALIASES = {"AC Type": "Aircraft Type"}
+
+
+def label_to_column(label):
+    """Maps a crash page label (e.g. "AC\\n        Type:") to its raw CSV column name."""
+    name = " ".join(label.split()).rstrip(":").strip()
+    return LABEL_ALIASES.get(name, name)
+
+
+def record_to_row(record):
+    """Turns a {label: value} crash record into a list of values in RAW_COLUMNS order."""
+    values = {label_to_column(label): value for label, value in record.items()}
+    return [values.get(column, "") for column in RAW_COLUMNS]
+
+
+class RecordSink:
+    """Buffered writer of crash records to a raw CSV with one row per crash.
+
+    Records are flushed when batch_size records are waiting or flush_interval
+    seconds have passed since the last flush, and on close. on_flush, if given,
+    is called with the keys passed to append once their rows are on disk.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=10.0, on_flush=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.rows = []
+        self.keys = []
+        self.written = 0
+        self.last_flush = time.monotonic()
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, "r", encoding="utf-8", newline="") as file:
+                header = next(csv.reader(file), [])
+            if header != RAW_COLUMNS:
+                raise ValueError(
+                    f"{path} doesn't have the one-row-per-crash layout; write to a new file"
+                )
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file, lineterminator="\n")
+        if not exists:
+            self.writer.writerow(RAW_COLUMNS)
+            self.file.flush()
+
+    def append(self, record, key=None):
+        """Buffers one crash record, flushing if the batch is full or old enough."""
+        self.rows.append(record_to_row(record))
+        if key is not None:
+            self.keys.append(key)
+        if (
+            len(self.rows) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Writes every buffered record to disk."""
+        if self.rows:
+            self.writer.writerows(self.rows)
+            self.file.flush()
+            self.written += len(self.rows)
+            self.rows = []
+        keys, self.keys = self.keys, []
+        if keys and self.on_flush is not None:
+            self.on_flush(keys)
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
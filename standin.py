@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Local Stand-in Server for Plane Crash Dummy Project
+
+Serves planecrashinfo.com style pages from memory on localhost so the
+scraping functions can be exercised without touching the real site.
+"""
+import hashlib
+import html
+import random
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+# labels exactly as they appear on the crash pages
+CRASH_LABELS = [
+    "Date:",
+    "Time:",
+    "Location:",
+    "Operator:",
+    "Flight #:",
+    "Route:",
+    "AC\n        Type:",
+    "Registration:",
+    "cn / ln:",
+    "Aboard:",
+    "Fatalities:",
+    "Ground:",
+    "Summary:",
+]
+
+
+def build_crash_page(values):
+    """Renders one crash page with the same table layout as planecrashinfo.com."""
+    rows = [
+        '<tr><td colspan="2"><div align="center"><font size="+1"><b>'
+        "Plane Crash Info</b></font></div></td></tr>"
+    ]
+    for label, value in zip(CRASH_LABELS, values):
+        rows.append(
+            '<tr><td width="100"><font size="2" face="Arial"><b>'
+            f"{html.escape(label)}</b></font></td>"
+            f'<td><font size="2" face="Arial">{html.escape(str(value))}</font></td></tr>'
+        )
+    return (
+        "<html><head><title>Plane Crash Info</title></head><body>\n"
+        '<table width="600" border="1" cellpadding="2">\n'
+        + "\n".join(rows)
+        + "\n</table>\n</body></html>\n"
+    )
+
+
+def build_link_page(links):
+    """Renders an index page that links to every entry of links."""
+    anchors = "\n".join(f'<a href="{html.escape(link)}">{html.escape(link)}</a><br>' for link in links)
+    return f"<html><body>\n{anchors}\n</body></html>\n"
+
+
+def fixture_pages(raw_csv, limit=None):
+    """Builds a site of crash pages, year pages and a database index from a raw crash CSV.
+
+    Returns a dict mapping each path (e.g. /1976/1976-1.htm) to its HTML.
+    """
+    df = pd.read_csv(raw_csv)
+    values = df.iloc[1::2].values.tolist()
+    if limit is not None:
+        values = values[:limit]
+    return build_site(values)
+
+
+def build_site(values):
+    """Builds the crash pages, year pages and database index for rows of crash page values.
+
+    Each row holds the values for CRASH_LABELS; the year is taken from the
+    end of the date. Returns a dict mapping each path to its HTML.
+    """
+    pages = {}
+    years = {}
+    for row in values:
+        year = str(row[0])[-4:]
+        years.setdefault(year, []).append(row)
+
+    for year, rows in years.items():
+        links = []
+        for number, row in enumerate(rows, start=1):
+            name = f"{year}-{number}.htm"
+            pages[f"/{year}/{name}"] = build_crash_page(row)
+            links.append(name)
+        pages[f"/{year}/{year}.htm"] = build_link_page(["/index.html"] + links)
+
+    pages["/database.htm"] = build_link_page([f"/{year}/{year}.htm" for year in years])
+    return pages
+
+
+# error_rate: share of requests answered with error_status (and Retry-After if set)
+# latency: seconds added to every response
+# capacity: requests in flight above which the server answers 503, like an overloaded site
+# stall_rate/stall: share of requests held for `stall` seconds first, to trigger client timeouts
+# seed: makes the injected faults repeatable
+Faults = namedtuple(
+    "Faults",
+    ["error_rate", "error_status", "retry_after", "latency", "capacity", "stall_rate", "stall", "seed"],
+    defaults=(0.0, 503, None, 0.0, None, 0.0, 0.0, None),
+)
+
+
+class StandinServer:
+    """Threaded HTTP server on localhost serving a dict of pages.
+
+    Pages carry an ETag and unchanged pages answer If-None-Match with 304.
+    With Faults the server also injects errors, latency, overload and
+    stalls; `stats` counts requests, injected errors and the most requests
+    that were in flight at once. Use as a context manager; `url(path)` gives
+    the absolute URL of a page.
+    """
+
+    def __init__(self, pages, faults=None):
+        self.pages = pages
+        self.faults = faults
+        self.stats = {"requests": 0, "errors": 0, "overloaded": 0, "stalled": 0, "peak_in_flight": 0}
+        pages_ref = self.pages
+        server = self
+        lock = threading.Lock()
+        in_flight = [0]
+        rng = random.Random(faults.seed if faults else None)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive like the real site
+
+            def do_GET(self):
+                with lock:
+                    in_flight[0] += 1
+                    server.stats["requests"] += 1
+                    server.stats["peak_in_flight"] = max(server.stats["peak_in_flight"], in_flight[0])
+                try:
+                    if faults is None or not self.inject_fault():
+                        self.serve_page()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up, e.g. after a stall made it time out
+                finally:
+                    with lock:
+                        in_flight[0] -= 1
+
+            def inject_fault(self):
+                # returns True if the request was answered with a fault
+                with lock:
+                    overloaded = faults.capacity is not None and in_flight[0] > faults.capacity
+                    error = rng.random() < faults.error_rate
+                    stall = rng.random() < faults.stall_rate
+                    key = "overloaded" if overloaded else "errors" if error else None
+                    if key:
+                        server.stats[key] += 1
+                    if stall:
+                        server.stats["stalled"] += 1
+                if stall:
+                    time.sleep(faults.stall)
+                if faults.latency:
+                    time.sleep(faults.latency)
+                if not (overloaded or error):
+                    return False
+                self.send_response(503 if overloaded else faults.error_status)
+                if faults.retry_after is not None:
+                    self.send_header("Retry-After", str(faults.retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return True
+
+            def serve_page(self):
+                # like the real site, //1976/1976.htm is the same page as /1976/1976.htm
+                body = pages_ref.get("/" + self.path.lstrip("/"))
+                if body is None:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                etag = '"%s"' % hashlib.md5(data).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return self.base_url + path
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -1,73 +1,50 @@
-import pandas as pd
-from collections import Counter
-import re
-import matplotlib.pyplot as plt
+from charts import Chart, output_charts
+from classifier import classify_crashes, crash_classifier
+from dataset import load_crash_data
+from metrics import count
 
-# Define keyword-based crash categories
+# Keyword-based crash categories; the rules live in classifier.CRASH_RULES
 def categorize_crash(summary):
-    summary = str(summary).lower()  # Convert to lowercase
+    return crash_classifier.categorize(summary)
 
-    if any(
-        keyword in summary for keyword in ["collision", "midair", "crash into another"]
-    ):
-        return "Mid-Air Collision"
-    elif any(
-        keyword in summary
-        for keyword in ["engine failure", "mechanical failure", "technical issue"]
-    ):
-        return "Mechanical Failure"
-    elif any(keyword in summary for keyword in ["weather", "storm", "turbulence"]):
-        return "Weather-Related"
-    elif any(keyword in summary for keyword in ["fire", "explosion", "smoke"]):
-        return "Fire/Explosion"
-    elif any(
-        keyword in summary
-        for keyword in ["pilot error", "loss of control", "incorrect maneuver"]
-    ):
-        return "Pilot Error"
-    elif any(keyword in summary for keyword in ["hijacking", "terrorist", "bomb"]):
-        return "Hijacking/Terrorism"
-    elif any(
-        keyword in summary for keyword in ["shot down", "missile", "military attack"]
-    ):
-        return "Shot Down (War/Conflict)"
-    elif any(keyword in summary for keyword in ["runway", "takeoff", "landing"]):
-        return "Takeoff/Landing Accident"
-    elif any(keyword in summary for keyword in ["fuel exhaustion", "ran out of fuel"]):
-        return "Fuel Exhaustion"
-    else:
-        return "Other/Unknown"
+def category_aggregates(source, processes=None):
+    """Returns crashes per year and category, smoothed over 3 years, from a path or DataFrame.
 
-def summarize_crashes(file_path):
-    df = pd.read_csv(file_path)
-    # make sure the DateTime column is datetime
-    df["DateTime"] = pd.to_datetime(df["DateTime"])
-    df["Year"] = df["DateTime"].dt.year
+    With processes the summaries are classified in that many worker processes.
+    """
+    # source is CrashTestInfo_Cleaned.csv, the Parquet file from scrub_crash_data
+    # or an already loaded DataFrame; files are only read once per process
+    # DateTime comes back parsed and with a Year column
+    df = load_crash_data(source, columns=["DateTime", "Year", "Summary"])
+    count("rows_in", len(df))
     
-    # Combine all summaries into one large text
-    #all_text = " ".join(df["Summary"].dropna()).lower()
-    
-    # Remove punctuation and split into words
-    #words = re.findall(r"\b\w+\b", all_text)
-    
-    # Count word frequencies
-    #word_counts = Counter(words)
-    
-    # Display the most common words
-    #print(word_counts.most_common(50))  # Show top 50 most frequent words
+    # the most common summary words come from the summary index:
+    # python search.py --ngrams 1 --top 50 (or SummaryIndex.ngram_counts)
 
-    # Apply the categorization function to the dataset
-    df["Crash_Category"] = df["Summary"].apply(categorize_crash)
+    # Categorize every summary in one batch
+    df["Crash_Category"] = classify_crashes(df["Summary"], processes=processes)
     
     #print(df["Crash_Category"].value_counts())
     
     df_grouped = df.groupby(["Year", "Crash_Category"]).size().unstack()
     df_smoothed = df_grouped.rolling(window=3, min_periods=1).mean()
-    df_smoothed.plot(
-        kind="line", figsize=(14, 7), title="Crash Categories Over Time (Smoothed)"
-    )
+    return df_smoothed
+
 
-    plt.xlabel("Year")
-    plt.ylabel("Number of Crashes")
-    plt.legend(title="Crash Category")
-    plt.show()
+def summarize_crashes(source, output_dir=None, processes=None):
+    """Plots the crash categories over time; with output_dir the chart is saved there instead."""
+    df_smoothed = category_aggregates(source, processes)
+    chart = Chart(
+        "crash_categories",
+        "line",
+        df_smoothed,
+        "Crash Categories Over Time (Smoothed)",
+        {
+            "figsize": (14, 7),
+            "xlabel": "Year",
+            "ylabel": "Number of Crashes",
+            "legend_title": "Crash Category",
+        },
+    )
+    output_charts([chart], output_dir, processes)
+    return df_smoothed
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Crash Table Parser for Plane Crash Dummy Project
+
+Pulls the label/value pairs out of the first table of a crash page without
+building a BeautifulSoup tree. Uses lxml (C-backed) when it is installed and
+a streaming stdlib tokenizer that stops at the end of the table otherwise.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # lxml is optional
+    lxml_html = None
+
+
+def _cell_text(pieces):
+    # same result as BeautifulSoup's get_text(strip=True)
+    return "".join(piece.strip() for piece in pieces)
+
+
+def _pairs_to_record(rows):
+    # skip the header row and keep rows that have both a label and a value
+    record = {}
+    for cells in rows[1:]:
+        if len(cells) >= 2:
+            record[cells[0]] = cells[1]
+    if not record:
+        raise IndexError("No table found on the page.")
+    return record
+
+
+class _CrashTableTokenizer(HTMLParser):
+    """Streams through a page and collects the cell texts of the first table."""
+
+    class _TableDone(Exception):
+        pass
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.depth = 0  # table nesting depth
+        self.seen_table = False
+        self.rows = []
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            if self.depth == 0 and self.seen_table:
+                raise self._TableDone
+            self.depth += 1
+            self.seen_table = True
+        elif self.depth == 0:
+            return
+        elif tag == "tr":
+            self.rows.append([])
+        elif tag == "td" and self.rows:
+            self.cell = []
+            self.rows[-1].append(self.cell)
+
+    def handle_endtag(self, tag):
+        if self.depth == 0:
+            return
+        if tag == "table":
+            self.depth -= 1
+            if self.depth == 0:
+                raise self._TableDone
+        elif tag in ("td", "tr"):
+            self.cell = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+
+    def table_rows(self, html):
+        try:
+            self.feed(html)
+            self.close()
+        except self._TableDone:
+            pass
+        return [[_cell_text(cell) for cell in row] for row in self.rows]
+
+
+def extract_crash_record_stdlib(html):
+    """Returns the crash table of a page as a {label: value} dict using the stdlib tokenizer."""
+    return _pairs_to_record(_CrashTableTokenizer().table_rows(html))
+
+
+def extract_crash_record_lxml(html):
+    """Returns the crash table of a page as a {label: value} dict using lxml."""
+    if not html or not html.strip():
+        raise IndexError("No table found on the page.")
+    try:
+        try:
+            document = lxml_html.fromstring(html)
+        except ValueError:  # str input with an encoding declaration
+            document = lxml_html.fromstring(html.encode("utf-8"))
+    except etree.ParserError:
+        # nothing but comments or whitespace; the ParserError itself can't be
+        # pickled back from a parse_pages worker
+        raise IndexError("No table found on the page.") from None
+    table = next(document.iter("table"), None)
+    if table is None:
+        raise IndexError("No table found on the page.")
+    rows = [
+        [_cell_text(cell.itertext()) for cell in row.iter("td")] for row in table.iter("tr")
+    ]
+    return _pairs_to_record(rows)
+
+
+def extract_crash_record(html):
+    """Returns the crash table of a page as a {label: value} dict.
+
+    Raises IndexError when the page has no crash table, like parse_crash_table.
+    """
+    if lxml_html is not None:
+        return extract_crash_record_lxml(html)
+    return extract_crash_record_stdlib(html)
+
+
+def _extract_or_none(html):
+    try:
+        return extract_crash_record(html)
+    except IndexError:
+        return None
+
+
+def parse_pages(pages, processes=None, chunksize=16):
+    """Parses an iterable of HTML pages in a process pool and yields their records in order.
+
+    Pages without a crash table yield None.
+    """
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        yield from pool.map(_extract_or_none, pages, chunksize=chunksize)
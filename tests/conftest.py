@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Test Setup for Plane Crash Dummy Project
+
+The modules are plain scripts in the project folder, so the folder is put
+on the import path; RAW_CSV and CLEANED_CSV are the checked-in sample data.
+"""
+import os
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+RAW_CSV = os.path.join(PROJECT_DIR, "data", "crashtestdummy.csv")
+CLEANED_CSV = os.path.join(PROJECT_DIR, "data", "CrashTestInfo_Cleaned.csv")
+
+
+@pytest.fixture(scope="session")
+def raw_crashes():
+    """The raw sample crashes, one row per crash."""
+    from scrubdata import load_raw_crash_data
+
+    return load_raw_crash_data(RAW_CSV)
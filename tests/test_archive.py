@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the raw page archive.
+"""
+import os
+
+from archive import PageArchive
+
+
+def test_pages_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "pages.pca")
+    with PageArchive(path) as archive:
+        archive.put("http://x/1", "<p>one</p>", etag='"a"')
+        archive.put("http://x/2", "<p>two</p>")
+        archive.put("http://x/1", "<p>one again</p>")
+    with PageArchive(path) as archive:
+        assert len(archive) == 2
+        assert archive.get("http://x/1").body == "<p>one again</p>"
+        assert archive.get("http://x/1").etag is None
+        assert archive.get("http://x/2").body == "<p>two</p>"
+        assert archive.get("http://x/3") is None
+        assert archive.urls() == ["http://x/1", "http://x/2"]
+
+
+def test_index_grows_past_its_initial_size(tmp_path):
+    with PageArchive(str(tmp_path / "pages.pca")) as archive:
+        for number in range(10_000):
+            archive.put(f"http://x/{number}", str(number))
+        assert len(archive) == 10_000
+        assert all(archive.get(f"http://x/{number}").body == str(number) for number in range(0, 10_000, 97))
+
+
+def test_torn_tail_is_truncated_on_reopen(tmp_path):
+    path = str(tmp_path / "pages.pca")
+    with PageArchive(path) as archive:
+        archive.put("http://x/1", "<p>one</p>")
+        archive.put("http://x/2", "<p>two</p>")
+    complete = os.path.getsize(path)
+    with open(path, "ab") as file:
+        file.write(b"PCA1\x05\x00")  # a write cut off by a crash
+    with PageArchive(path) as archive:
+        assert os.path.getsize(path) == complete
+        archive.put("http://x/3", "<p>three</p>")
+    # the page written after the crash can be found, also by a full rebuild
+    os.remove(path + ".idx")
+    with PageArchive(path) as archive:
+        assert archive.urls() == ["http://x/1", "http://x/2", "http://x/3"]
+        assert archive.get("http://x/3").body == "<p>three</p>"
+
+
+def test_records_after_the_index_are_indexed_on_reopen(tmp_path):
+    path = str(tmp_path / "pages.pca")
+    with PageArchive(path) as archive:
+        archive.put("http://x/1", "<p>one</p>")
+    index = open(path + ".idx", "rb").read()
+    with PageArchive(path) as archive:
+        archive.put("http://x/2", "<p>two</p>")
+    # a crash before the index was written leaves the old one behind
+    with open(path + ".idx", "wb") as file:
+        file.write(index)
+    with PageArchive(path) as archive:
+        assert archive.get("http://x/2").body == "<p>two</p>"
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the canonical location, operator and aircraft type names.
+"""
+import pandas as pd
+
+from canonical import CanonicalNames, fingerprint
+
+
+def names_of(canonicalizer, counts):
+    # the canonical name of every spelling in {spelling: how often it occurs}
+    column = pd.Series([value for value, count in counts.items() for _ in range(count)])
+    return dict(zip(column, canonicalizer.apply(column)))
+
+
+def test_fingerprint_ignores_case_punctuation_and_accents():
+    assert fingerprint("U.S. Navy") == fingerprint("us navy")
+    assert fingerprint("Bogotá, Colombia") == fingerprint("Bogota Colombia")
+    assert fingerprint("Colombia, Bogota") == fingerprint("Bogota, Colombia")
+    assert fingerprint("Aeroflot / Aeroflot") != fingerprint("Aeroflot")
+
+
+def test_operator_word_order_matters():
+    names = names_of(CanonicalNames().operator, {"Air Services": 3, "Services Air": 3})
+    assert names == {"Air Services": "Air Services", "Services Air": "Services Air"}
+
+
+def test_spellings_of_one_name_are_joined():
+    names = names_of(CanonicalNames().operator, {"U.S. Navy": 5, "US  Navy": 2, "?": 1, "unknown": 1})
+    assert names == {
+        "U.S. Navy": "U.S. Navy",
+        "US  Navy": "U.S. Navy",
+        "?": "Unknown Operator",
+        "unknown": "Unknown Operator",
+    }
+
+
+def test_rare_typo_joins_a_dominant_name():
+    names = names_of(CanonicalNames().location, {"Seattle, Washington": 8, "Near Seattle, Washingon": 1})
+    assert set(names.values()) == {"Seattle, Washington"}
+
+
+def test_similar_counts_stay_apart():
+    names = names_of(CanonicalNames().location, {"Trondheim, Norway": 2, "Trontheim, Norway": 1})
+    assert names == {"Trondheim, Norway": "Trondheim, Norway", "Trontheim, Norway": "Trontheim, Norway"}
+
+
+def test_names_kept_apart_are_never_joined():
+    names = names_of(CanonicalNames().operator, {"Capital Airlines": 20, "Capitol Airlines": 1})
+    assert names == {"Capital Airlines": "Capital Airlines", "Capitol Airlines": "Capitol Airlines"}
+
+
+def test_short_words_and_numbers_are_never_corrected():
+    aircraft = names_of(CanonicalNames().aircraft, {"Antonov An-24": 30, "Antonov An-26": 1})
+    operators = names_of(CanonicalNames().operator, {"Air Nigeria": 30, "Air Niger": 1})
+    assert len(set(aircraft.values())) == 2 and len(set(operators.values())) == 2
+
+
+def test_saved_names_and_counts_are_used_by_the_next_run(tmp_path):
+    path = str(tmp_path / "canonical.json")
+    with CanonicalNames(path) as canonical:
+        names_of(canonical.location, {"Seattle, Washington": 8})
+    with CanonicalNames(path) as canonical:
+        assert names_of(canonical.location, {"Seattle, Washingon": 1}) == {
+            "Seattle, Washingon": "Seattle, Washington"
+        }
+
+
+def test_values_dropped_from_the_cache_are_not_counted_twice():
+    counts = {
+        "Seattle, Washington": 8,
+        "Near Seattle, Washingon": 1,
+        "Moscow, Russia": 5,
+        "Near Moscow, Russia": 3,
+        "Bogotá, Colombia": 2,
+    }
+    column = pd.Series([value for value, count in counts.items() for _ in range(count)])
+    small = CanonicalNames(cache_size=2).location
+    large = CanonicalNames().location
+    first = small.apply(column)
+    for _ in range(3):
+        assert small.apply(column).tolist() == first.tolist()
+        assert small.apply(column[::-1]).tolist() == first[::-1].tolist()
+        assert small.canonical("Near Moscow, Russia") == "Moscow, Russia"
+    assert len(small.forms) == 2
+    assert first.tolist() == large.apply(column).tolist()
+    assert small.counts == large.counts == {
+        fingerprint("Seattle Washington"): 8,
+        fingerprint("Seattle Washingon"): 1,
+        fingerprint("Moscow Russia"): 8,
+        fingerprint("Bogota Colombia"): 2,
+    }
+
+
+def test_counted_values_are_saved(tmp_path):
+    path = str(tmp_path / "canonical.json")
+    column = pd.Series(["Moscow, Russia"] * 4 + ["Oslo, Norway"])
+    with CanonicalNames(path, cache_size=1) as canonical:
+        canonical.location.apply(column)
+    with CanonicalNames(path, cache_size=1) as canonical:
+        canonical.location.apply(column)
+        assert canonical.location.counts == {fingerprint("Moscow Russia"): 4, fingerprint("Norway Oslo"): 1}
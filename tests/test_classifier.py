@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the batch crash classifier against the original if/elif categorize_crash.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import classifier
+from benchmark import categorize_crash_ifchain
+from classifier import CRASH_RULES, DEFAULT_CATEGORY, CrashClassifier, classify_crashes
+from conftest import CLEANED_CSV
+
+EDGE_SUMMARIES = [
+    None,
+    np.nan,
+    float("nan"),
+    "",
+    "   ",
+    "nan",
+    "None",
+    42,
+    "FIRE on board",
+    "Fire after a midair collision in a storm",  # several rules, the first wins
+    "storm then engine failure",
+    "Mid-air collision",  # no keyword: "midair" is written without the dash
+    "The fuel tank exploded",  # "explosion" isn't a substring
+    "ran out of fuel on the runway",
+    "Takeoff in turbulence; missile strike",
+    "İSTANBUL: smoke in the cabin",  # lower() makes İ two characters
+    "Straße nach Köln, WEATHER",
+    "Ｆｉｒｅ in fullwidth letters",  # no ASCII keyword
+    "pilot\nerror",  # a line break isn't a space
+    "bombardier jet",  # "bomb" is a plain substring
+    "misfire",
+    "Crash into another aircraft",
+    "technical issues, hijacking",
+]
+
+
+@pytest.fixture(scope="module")
+def summaries():
+    real = pd.read_csv(CLEANED_CSV, usecols=["Summary"])["Summary"]
+    return pd.concat([real, pd.Series(EDGE_SUMMARIES, dtype=object)], ignore_index=True)
+
+
+def test_classify_matches_the_original_if_chain(summaries):
+    expected = summaries.apply(categorize_crash_ifchain)
+    result = classify_crashes(summaries)
+    assert result.index.equals(summaries.index)
+    assert result.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("summary", EDGE_SUMMARIES)
+def test_edge_cases_match_the_original_if_chain(summary):
+    expected = categorize_crash_ifchain(summary)
+    assert classify_crashes([summary]).tolist() == [expected]
+    assert classifier.crash_classifier.categorize(summary) == expected
+
+
+def test_multi_label_first_column_is_the_single_label(summaries):
+    single = classify_crashes(summaries)
+    multi = classify_crashes(summaries, multi_label=True)
+    assert list(multi.columns) == [category for category, _ in CRASH_RULES] + [DEFAULT_CATEGORY]
+    assert (multi.idxmax(axis=1) == single).all()
+    assert (multi.sum(axis=1) >= 1).all()
+    row = multi.iloc[len(summaries) - len(EDGE_SUMMARIES) + EDGE_SUMMARIES.index("storm then engine failure")]
+    assert row[row].index.tolist() == ["Mechanical Failure", "Weather-Related"]
+
+
+def test_sharded_classification_matches(summaries, monkeypatch):
+    monkeypatch.setattr(classifier, "CLASSIFY_SHARD_ROWS", 1000)
+    assert classify_crashes(summaries, processes=2).equals(classify_crashes(summaries))
+    multi = classify_crashes(summaries, multi_label=True, processes=2)
+    assert multi.equals(classify_crashes(summaries, multi_label=True))
+
+
+def test_rules_are_checked():
+    with pytest.raises(ValueError):
+        CrashClassifier([])
+    with pytest.raises(ValueError):
+        CrashClassifier([("Empty", [])])
+    custom = CrashClassifier([("A", ["a+b"]), ("B", ["b"])], default="None")
+    assert custom.classify(["xa+by", "ab", "c"]).tolist() == ["A", "B", "None"]
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the concurrent crawler against the stand-in server.
+"""
+import time
+
+import pandas as pd
+import pytest
+
+from crawler import crawl_crash_pages, crawl_site
+from manifest import DONE, FAILED, CrawlManifest
+from retry import RetryPolicy
+from sink import RAW_COLUMNS
+from standin import Faults, StandinServer, build_site
+
+# retries quickly, so injected faults don't slow the tests down
+FAST_POLICY = RetryPolicy(retries=6, timeout=5.0, backoff=0.01, max_backoff=0.05)
+
+
+@pytest.fixture(scope="module")
+def crash_values(raw_crashes):
+    return raw_crashes.iloc[:40].fillna("").values.tolist()
+
+
+@pytest.fixture(scope="module")
+def site(crash_values):
+    return build_site(crash_values)
+
+
+def crash_urls(server, pages):
+    return [server.url(path) for path in pages if path.count("-") == 1]
+
+
+def read_rows(path):
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    assert list(df.columns) == RAW_COLUMNS
+    return df.values.tolist()
+
+
+def test_crawl_writes_every_page_in_input_order(tmp_path, site, crash_values):
+    output = tmp_path / "raw.csv"
+    # with some latency the pages finish out of order, so the order has to be restored
+    with StandinServer(site, Faults(latency=0.05)) as server:
+        urls = crash_urls(server, site)
+        written = crawl_crash_pages(urls, str(output), rate=500, concurrency=8, processes=1)
+        assert server.stats["peak_in_flight"] > 1  # the pages really were fetched concurrently
+    assert written == len(crash_values)
+    assert read_rows(output) == crash_values
+
+
+def test_crawl_skips_pages_without_a_crash_table(tmp_path, site, crash_values):
+    output = tmp_path / "raw.csv"
+    pages = dict(site)
+    broken = [path for path in pages if path.count("-") == 1][:2]
+    pages[broken[0]] = ""
+    pages[broken[1]] = "<!-- moved -->"
+    with StandinServer(pages) as server:
+        urls = crash_urls(server, pages)
+        with CrawlManifest(str(tmp_path / "manifest.jsonl")) as manifest:
+            written = crawl_crash_pages(urls, str(output), rate=500, manifest=manifest, processes=1)
+            statuses = [manifest.entries[url]["status"] for url in urls]
+    assert written == len(crash_values) - 2
+    assert statuses[:2] == [FAILED, FAILED] and set(statuses[2:]) == {DONE}
+    assert read_rows(output) == crash_values[2:]
+
+
+def test_crawl_site_discovers_and_writes_every_page(tmp_path, site, crash_values):
+    output = tmp_path / "raw.csv"
+    snapshot = tmp_path / "crashurls.txt"
+    with StandinServer(site) as server:
+        written = crawl_site(
+            server.url("/database.htm"), str(output), rate=500, processes=1, snapshot=str(snapshot)
+        )
+    assert written == len(crash_values)
+    assert read_rows(output) == crash_values
+    assert len(snapshot.read_text().split()) == len(crash_values)
+
+
+def test_crawl_retries_injected_errors(tmp_path, site, crash_values):
+    output = tmp_path / "raw.csv"
+    faults = Faults(error_rate=0.3, seed=1)
+    with StandinServer(site, faults) as server:
+        urls = crash_urls(server, site)
+        written = crawl_crash_pages(urls, str(output), rate=500, processes=1, policy=FAST_POLICY)
+        assert server.stats["errors"] > 0
+    assert written == len(crash_values)
+    assert read_rows(output) == crash_values
+
+
+def test_crawl_honours_retry_after(tmp_path, site):
+    output = tmp_path / "raw.csv"
+    faults = Faults(error_rate=1.0, error_status=429, retry_after=1)
+    policy = RetryPolicy(retries=1, timeout=5.0, backoff=0.01, max_backoff=0.05)
+    with StandinServer(site, faults) as server:
+        urls = crash_urls(server, site)[:1]
+        with CrawlManifest(str(tmp_path / "manifest.jsonl")) as manifest:
+            start = time.perf_counter()
+            written = crawl_crash_pages(urls, str(output), manifest=manifest, processes=1, policy=policy)
+            assert time.perf_counter() - start >= 1  # waited as long as the server asked
+        assert server.stats["requests"] == 2  # the first try and one retry
+    assert written == 0
+    assert manifest.entries[urls[0]]["status"] == FAILED
+    assert manifest.entries[urls[0]]["http"] == 429
+
+
+def test_crawl_gives_up_on_stalled_pages(tmp_path, site):
+    output = tmp_path / "raw.csv"
+    faults = Faults(stall_rate=1.0, stall=1.0)
+    policy = RetryPolicy(retries=0, timeout=0.2)
+    with StandinServer(site, faults) as server:
+        written = crawl_crash_pages(crash_urls(server, site)[:3], str(output), processes=1, policy=policy)
+    assert written == 0
+
+
+def test_concurrency_backs_off_from_an_overloaded_server(tmp_path, site, crash_values, capsys):
+    output = tmp_path / "raw.csv"
+    faults = Faults(latency=0.02, capacity=3)
+    with StandinServer(site, faults) as server:
+        urls = crash_urls(server, site)
+        written = crawl_crash_pages(
+            urls, str(output), rate=500, concurrency=12, processes=1, policy=FAST_POLICY
+        )
+        assert server.stats["overloaded"] > 0
+    assert written == len(crash_values)
+    assert "Server pushed back" in capsys.readouterr().out
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the aggregate cube against the pandas analysis.
+"""
+import pandas as pd
+import pytest
+
+from analysis import top_counts
+from classifier import classify_crashes
+from conftest import CLEANED_CSV
+from cube import CUBE_COLUMNS, CrashCube
+from dataset import read_crash_data
+
+
+@pytest.fixture(scope="module")
+def crashes():
+    return read_crash_data(CLEANED_CSV, columns=CUBE_COLUMNS)
+
+
+@pytest.fixture(scope="module")
+def cube(crashes):
+    cube = CrashCube()
+    cube.update(crashes)
+    return cube
+
+
+def assert_same_top(top, expected):
+    # the names and counts must match; the cube keeps its names as objects
+    pd.testing.assert_series_equal(top, expected, check_dtype=False, check_index_type=False)
+
+
+@pytest.mark.parametrize("dimension", ["operators", "locations"])
+@pytest.mark.parametrize("years", [None, range(1970, 1980), range(1990, 2000)])
+@pytest.mark.parametrize("n", [5, 10, 25])
+def test_top_matches_top_counts(crashes, cube, dimension, years, n):
+    column = "Operator_Cleaned" if dimension == "operators" else "Location_Cleaned"
+    rows = crashes if years is None else crashes[crashes["Year"].isin(years)]
+    assert_same_top(cube.top(dimension, n, years=years), top_counts(rows[column], n))
+
+
+def test_top_breaks_ties_by_name():
+    cube = CrashCube()
+    crashes = pd.DataFrame(
+        {
+            "UniqueID": [str(number) for number in range(6)],
+            "Year": [1990] * 6,
+            "Operator_Cleaned": ["Zeta Air", "Alpha Air", "Mu Air", "Zeta Air", "Alpha Air", "Beta Air"],
+            "Location_Cleaned": ["Here"] * 6,
+            "Summary": [""] * 6,
+            "Total_Fatalities": [1] * 6,
+            "Total_Aboard": [2] * 6,
+        }
+    )
+    cube.update(crashes)
+    top = cube.top("operators", 3)
+    assert list(top.items()) == [("Alpha Air", 2), ("Zeta Air", 2), ("Beta Air", 1)]
+    assert_same_top(top, top_counts(crashes["Operator_Cleaned"], 3))
+
+
+@pytest.mark.parametrize("filters", [{}, {"years": range(1970, 1980)}, {"operators": ["Aeroflot"]}])
+def test_category_queries_match_pandas(crashes, cube, filters):
+    rows = crashes.assign(Crash_Category=classify_crashes(crashes["Summary"]).to_numpy())
+    if "years" in filters:
+        rows = rows[rows["Year"].isin(filters["years"])]
+    if "operators" in filters:
+        rows = rows[rows["Operator_Cleaned"].isin(filters["operators"])]
+    counts = rows.groupby(["Year", "Crash_Category"]).size().unstack()
+    for _ in range(2):  # unfiltered answers come from the rollups the second time
+        frame = cube.category_counts(**filters)
+        pd.testing.assert_frame_equal(
+            frame, counts, check_dtype=False, check_index_type=False, check_column_type=False
+        )
+        frame.iloc[:, :] = 0  # changing an answer leaves the cube alone
+        pd.testing.assert_frame_equal(
+            cube.category_trends(**filters),
+            counts.rolling(window=3, min_periods=1).mean(),
+            check_index_type=False,
+            check_column_type=False,
+        )
+
+
+def test_unfiltered_answers_follow_updates(crashes):
+    cube = CrashCube()
+    cube.update(crashes)
+    busiest = cube.top("operators", 1).index[0]
+    total = cube.category_counts().sum().sum()
+    rest = crashes[crashes["Operator_Cleaned"] != busiest]
+    cube.update(rest)
+    assert_same_top(cube.top("operators", 5), top_counts(rest["Operator_Cleaned"], 5))
+    removed = crashes["Operator_Cleaned"].eq(busiest) & crashes["Year"].notna()
+    assert cube.category_counts().sum().sum() == total - removed.sum()
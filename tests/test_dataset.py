@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the memoized crash data loader.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+import dataset
+from conftest import CLEANED_CSV
+from dataset import load_crash_data, write_crash_parquet
+
+
+@pytest.fixture(scope="module")
+def cleaned():
+    return pd.read_csv(CLEANED_CSV)
+
+
+def write(cleaned, path, rows):
+    if path.endswith(".parquet"):
+        write_crash_parquet(cleaned.iloc[rows], path)
+    else:
+        cleaned.iloc[rows].to_csv(path, index=False)
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def data_file(request, tmp_path, cleaned):
+    path = str(tmp_path / f"cleaned.{request.param}")
+    write(cleaned, path, slice(0, 3000))
+    return path
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Counts the files read and hashed by the loader."""
+    calls = {"read": [], "digest": []}
+    read_crash_data = dataset.read_crash_data
+    file_digest = dataset.file_digest
+
+    def counted_read(path, columns=None, years=None):
+        calls["read"].append(list(columns))
+        return read_crash_data(path, columns, years)
+
+    def counted_digest(path, size=None):
+        calls["digest"].append(path)
+        return file_digest(path, size)
+
+    monkeypatch.setattr(dataset, "read_crash_data", counted_read)
+    monkeypatch.setattr(dataset, "file_digest", counted_digest)
+    monkeypatch.setattr(dataset, "_dataset_cache", {})
+    return calls
+
+
+def test_an_unchanged_file_is_not_read_again(data_file, reads):
+    first = load_crash_data(data_file, columns=["UniqueID", "Year"])
+    second = load_crash_data(data_file, columns=["UniqueID", "Year"])
+    pd.testing.assert_frame_equal(first, second)
+    assert reads == {"read": [["UniqueID", "Year"]], "digest": [data_file]}
+
+
+def test_only_missing_columns_are_read(data_file, reads):
+    load_crash_data(data_file, columns=["UniqueID"])
+    df = load_crash_data(data_file, columns=["UniqueID", "Total_Fatalities"])
+    assert reads["read"] == [["UniqueID"], ["Total_Fatalities"]]
+    assert list(df.columns) == ["UniqueID", "Total_Fatalities"] and len(df) == 3000
+
+
+def test_a_touched_file_with_the_same_contents_is_hashed_not_read(data_file, reads):
+    load_crash_data(data_file, columns=["UniqueID"])
+    stat = os.stat(data_file)
+    os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    load_crash_data(data_file, columns=["UniqueID"])
+    load_crash_data(data_file, columns=["UniqueID"])
+    assert len(reads["read"]) == 1
+    assert len(reads["digest"]) == 2  # once when first read, once after the touch
+
+
+def test_a_rewritten_file_returns_the_new_rows(data_file, reads, cleaned):
+    before = load_crash_data(data_file, columns=["UniqueID", "Total_Fatalities"])
+    write(cleaned, data_file, slice(1000, 4500))
+    after = load_crash_data(data_file, columns=["UniqueID", "Total_Fatalities"])
+    assert len(reads["read"]) == 2
+    assert len(before) == 3000 and len(after) == 3500
+    expected = dataset.read_crash_data(data_file, columns=["UniqueID", "Total_Fatalities"])
+    pd.testing.assert_frame_equal(after, expected)
+    assert sorted(after["UniqueID"]) == sorted(cleaned["UniqueID"].iloc[1000:4500])
+
+
+def test_a_rewrite_of_the_same_size_is_noticed(tmp_path, reads, cleaned):
+    path = str(tmp_path / "cleaned.csv")
+    cleaned.iloc[:100].to_csv(path, index=False)
+    first = cleaned["UniqueID"].iloc[0]
+    assert load_crash_data(path, columns=["UniqueID"])["UniqueID"].iloc[0] == first
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text.replace(first, "0" * len(first), 1))
+    # coarse filesystem clocks can keep the mtime of a quick rewrite
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_crash_data(path, columns=["UniqueID"])["UniqueID"].iloc[0] == "0" * len(first)
+    assert len(reads["read"]) == 2
+
+
+def test_returned_frames_can_be_changed_without_touching_the_cache(data_file, reads):
+    df = load_crash_data(data_file, columns=["UniqueID", "Total_Fatalities"])
+    df["Total_Fatalities"] = -1
+    df["Extra"] = 1
+    again = load_crash_data(data_file, columns=["UniqueID", "Total_Fatalities"])
+    assert (again["Total_Fatalities"] >= 0).all() and "Extra" not in again
+    assert len(reads["read"]) == 1
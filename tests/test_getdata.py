@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the year index handling of the requests based scraper.
+"""
+import pytest
+
+from getdata import page_year, process_url_list
+from manifest import CrawlManifest
+from standin import StandinServer, build_site
+
+
+@pytest.mark.parametrize(
+    "entry, year",
+    [
+        ("/1976/1976.htm", 1976),
+        ("1976/1976.htm", 1976),
+        ("/2025/", 2025),
+        ("2025", 2025),
+        ("index.html", None),
+        ("/index.html", None),
+        ("1976-1.htm", None),
+        ("/1976/1976-1.htm", None),
+        ("", None),
+    ],
+)
+def test_page_year(entry, year):
+    assert page_year(entry) == year
+
+
+def test_reruns_only_fetch_the_newest_year_page(tmp_path, raw_crashes):
+    site = build_site(raw_crashes.iloc[:10].fillna("").values.tolist())
+    year_pages = [path for path in site if path.endswith(".htm") and path.count("/") == 2 and "-" not in path]
+    input_file = tmp_path / "yearurls.txt"
+    # the year index ends with a link back to the home page, like the real one
+    input_file.write_text("\n".join(year_pages + ["index.html"]) + "\n")
+    with StandinServer(site) as server, CrawlManifest(str(tmp_path / "manifest.jsonl")) as manifest:
+        domain = server.base_url + "/"
+        process_url_list(str(input_file), str(tmp_path / "links.txt"), manifest=manifest, domain=domain)
+        first = server.stats["requests"]
+        process_url_list(str(input_file), str(tmp_path / "links.txt"), manifest=manifest, domain=domain)
+        # the newest year page and the failed index.html are fetched again, nothing else
+        assert server.stats["requests"] - first == 2
+    assert first == len(year_pages) + 1
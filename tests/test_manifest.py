@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the crawl manifest and resuming a crawl with it.
+"""
+import pandas as pd
+
+from crawler import crawl_crash_pages
+from manifest import DONE, FAILED, CrawlManifest
+from standin import StandinServer, build_site
+
+
+def test_last_status_wins_and_survives_a_reopen(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    with CrawlManifest(path) as manifest:
+        manifest.record("http://x/1", FAILED, 503)
+        manifest.record("http://x/2", DONE, 200, "abc")
+        manifest.record("http://x/1", DONE, 200, "def")
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"url": "http://x/3", "sta')  # torn last line from an interrupted run
+    with CrawlManifest(path) as manifest:
+        assert manifest.is_done("http://x/1") and manifest.is_done("http://x/2")
+        assert manifest.entries["http://x/1"]["hash"] == "def"
+        assert manifest.pending(["http://x/3", "http://x/1", "http://x/3"]) == ["http://x/3"]
+        assert manifest.summary() == {DONE: 2}
+        manifest.compact()
+    with open(path, encoding="utf-8") as file:
+        assert len(file.readlines()) == 2
+
+
+def test_manifest_resumes_an_interrupted_crawl(tmp_path, raw_crashes):
+    crash_values = raw_crashes.iloc[:40].fillna("").values.tolist()
+    site = build_site(crash_values)
+    output = tmp_path / "raw.csv"
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    with StandinServer(site) as server:
+        urls = [server.url(path) for path in site if path.count("-") == 1]
+        with CrawlManifest(manifest_path) as manifest:
+            crawl_crash_pages(urls[:15], str(output), rate=500, manifest=manifest, processes=1)
+        requests = server.stats["requests"]
+        with CrawlManifest(manifest_path) as manifest:
+            written = crawl_crash_pages(urls, str(output), rate=500, manifest=manifest, processes=1)
+        # only the pages the first run didn't get to are fetched again
+        assert server.stats["requests"] - requests == len(urls) - 15
+    assert written == len(urls) - 15
+    rows = pd.read_csv(output, dtype=str, keep_default_na=False).values.tolist()
+    assert rows == crash_values
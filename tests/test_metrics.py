@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the JSONL metrics stream.
+"""
+import json
+
+import pytest
+
+import metrics
+from metrics import count, debug, latency_histogram, measure_stage, record_request, recording, set_debug
+from pipeline import Stage, main
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_nothing_is_recorded_without_a_recorder(tmp_path):
+    count("rows_in", 5)
+    record_request("http://x/1", 200, 0.1)
+    with measure_stage("idle"):
+        pass
+    assert metrics._recorder is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stage_request_and_summary_lines(tmp_path, capsys):
+    path = str(tmp_path / "metrics.jsonl")
+    with recording(path):
+        with measure_stage("scrub"):
+            count("rows_in", 10)
+            count("rows_in", 5)
+            count("rows_out", 12)
+            record_request("http://x/1", 200, 0.004, size=100)
+            record_request("http://x/2", 503, 0.030, retries=2, error="Service Unavailable")
+            record_request("http://x/3", 200, 0, source="archive")
+        with pytest.raises(RuntimeError):
+            with measure_stage("broken"):
+                raise RuntimeError("boom")
+    events = read_events(path)
+    assert [event["event"] for event in events] == ["request"] * 3 + ["stage", "stage", "summary"]
+    assert len({event["run"] for event in events}) == 1
+
+    first, failed = events[:2]
+    assert (first["stage"], first["url"], first["status"], first["ms"], first["bytes"]) == (
+        "scrub", "http://x/1", 200, 4.0, 100
+    )
+    assert "error" not in first
+    assert (failed["retries"], failed["error"]) == (2, "Service Unavailable")
+
+    stage, broken, summary = events[3:]
+    assert (stage["name"], stage["ok"], stage["rows_in"], stage["rows_out"]) == ("scrub", True, 15, 12)
+    assert stage["seconds"] >= 0 and stage["stage"] == "scrub" and summary["stage"] is None
+    assert (broken["name"], broken["ok"]) == ("broken", False)
+    assert "rows_in" not in broken  # counters belong to one stage
+
+    assert summary["requests"] == 3 and summary["bytes"] == 100 and summary["retries"] == 2
+    assert summary["status"] == {"200": 2, "503": 1}
+    assert summary["source"] == {"network": 2, "archive": 1}
+    assert summary["latency_ms"]["count"] == 2  # archive hits have no latency
+    assert summary["latency_ms"]["buckets"]["<=5"] == 1 and summary["latency_ms"]["buckets"]["<=50"] == 1
+    assert [stage["name"] for stage in summary["stages"]] == ["scrub", "broken"]
+    assert f"Metrics appended to {path}" in capsys.readouterr().out
+    assert metrics._recorder is None
+
+
+def test_runs_are_appended(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    for _ in range(2):
+        with recording(path):
+            pass
+    events = read_events(path)
+    assert [event["event"] for event in events] == ["summary", "summary"]
+    assert events[0]["run"] != events[1]["run"]
+
+
+def test_latency_histogram():
+    histogram = latency_histogram([0.5, 1, 1.5, 30, 20000])
+    assert histogram["count"] == 5
+    assert histogram["buckets"]["<=1"] == 2 and histogram["buckets"]["<=2"] == 1
+    assert histogram["buckets"][">10000"] == 1
+    assert (histogram["p50"], histogram["max"]) == (1.5, 20000)
+    assert latency_histogram([])["p50"] is None
+
+
+def test_debug_only_prints_when_enabled(capsys, monkeypatch):
+    monkeypatch.setattr(metrics, "_debug", False)
+    debug("hidden", 1)
+    assert capsys.readouterr().out == ""
+    set_debug(True)
+    debug("shown", 1)
+    assert capsys.readouterr().out == "shown 1\n"
+    assert metrics.is_debug()
+    set_debug(False)
+
+
+def test_the_pipeline_records_one_stage_event_per_stage_that_ran(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    output = str(tmp_path / "out.txt")
+
+    def write():
+        count("rows_out", 3)
+        with open(output, "w", encoding="utf-8") as file:
+            file.write("done")
+
+    stages = [Stage("write", write, [], [output])]
+    argv = ["--state", str(tmp_path / "state.json"), "--metrics", path]
+    assert main(stages, argv) == 0
+    assert main(stages, argv) == 0  # up to date, so no stage event
+    events = read_events(path)
+    assert [event["event"] for event in events] == ["stage", "summary", "summary"]
+    assert (events[0]["name"], events[0]["rows_out"]) == ("write", 3)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the stage pipeline's input-hash skipping, --force and --only.
+"""
+import os
+
+import pytest
+
+from pipeline import Stage, main, run_pipeline, select_stages
+
+
+@pytest.fixture
+def chain(tmp_path):
+    """raw.txt -> upper -> upper.txt -> count -> count.txt, and other.txt -> copy -> copy.txt.
+
+    Returns (stages, paths, runs); runs lists the stages in the order they ran.
+    """
+    paths = {name: str(tmp_path / f"{name}.txt") for name in ["raw", "upper", "count", "other", "copy"]}
+    runs = []
+
+    def write(stage, output, text):
+        runs.append(stage)
+        with open(paths[output], "w", encoding="utf-8") as file:
+            file.write(text)
+
+    def read(name):
+        with open(paths[name], encoding="utf-8") as file:
+            return file.read()
+
+    stages = [
+        Stage("upper", lambda: write("upper", "upper", read("raw").upper()), [paths["raw"]], [paths["upper"]]),
+        Stage("count", lambda: write("count", "count", str(len(read("upper")))), [paths["upper"]], [paths["count"]]),
+        Stage("copy", lambda: write("copy", "copy", read("other")), [paths["other"]], [paths["copy"]]),
+    ]
+    for name, text in [("raw", "abc"), ("other", "xyz")]:
+        with open(paths[name], "w", encoding="utf-8") as file:
+            file.write(text)
+    return stages, paths, runs
+
+
+def run(stages, tmp_path, *argv):
+    return main(stages, list(argv) + ["--state", str(tmp_path / "state.json"), "--metrics", ""])
+
+
+def test_a_rerun_without_changes_is_skipped(tmp_path, chain, capsys):
+    stages, paths, runs = chain
+    assert run(stages, tmp_path) == 0
+    assert runs == ["upper", "count", "copy"]
+    assert run(stages, tmp_path) == 0
+    assert runs == ["upper", "count", "copy"]
+    assert capsys.readouterr().out.count("up to date") == 3
+
+
+def test_a_touched_input_with_the_same_contents_is_skipped(tmp_path, chain):
+    stages, paths, runs = chain
+    run(stages, tmp_path)
+    stat = os.stat(paths["raw"])
+    os.utime(paths["raw"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    run(stages, tmp_path)
+    assert runs == ["upper", "count", "copy"]
+
+
+def test_a_changed_input_reruns_its_stage_and_the_ones_after_it(tmp_path, chain):
+    stages, paths, runs = chain
+    run(stages, tmp_path)
+    runs.clear()
+    with open(paths["raw"], "w", encoding="utf-8") as file:
+        file.write("abcdef")
+    run(stages, tmp_path)
+    assert runs == ["upper", "count"]
+    with open(paths["count"], encoding="utf-8") as file:
+        assert file.read() == "6"
+
+
+def test_an_output_with_unchanged_contents_stops_the_rerun(tmp_path, chain):
+    stages, paths, runs = chain
+    run(stages, tmp_path)
+    runs.clear()
+    with open(paths["raw"], "w", encoding="utf-8") as file:
+        file.write("ABC")  # upper.txt comes out the same
+    run(stages, tmp_path)
+    assert runs == ["upper"]
+
+
+def test_a_missing_output_is_made_again(tmp_path, chain):
+    stages, paths, runs = chain
+    run(stages, tmp_path)
+    runs.clear()
+    os.remove(paths["copy"])
+    run(stages, tmp_path)
+    assert runs == ["copy"]
+
+
+def test_force_reruns_the_target_stages_only(tmp_path, chain):
+    stages, paths, runs = chain
+    run(stages, tmp_path)
+    runs.clear()
+    run(stages, tmp_path, "count", "--force")
+    assert runs == ["count"]  # upper is needed for count but up to date
+    runs.clear()
+    run(stages, tmp_path, "--force")
+    assert runs == ["upper", "count", "copy"]
+
+
+def test_only_leaves_out_the_upstream_stages(tmp_path, chain):
+    stages, paths, runs = chain
+    run(stages, tmp_path)
+    runs.clear()
+    with open(paths["raw"], "w", encoding="utf-8") as file:
+        file.write("abcdef")
+    run(stages, tmp_path, "count", "--only")
+    assert runs == []  # upper.txt didn't change, so count is up to date
+    run(stages, tmp_path, "count", "--only", "--force")
+    assert runs == ["count"]
+    runs.clear()
+    run(stages, tmp_path, "count")
+    assert runs == ["upper", "count"]
+
+
+def test_targets_can_be_output_files(chain):
+    stages, paths, runs = chain
+    assert [stage.name for stage in select_stages(stages, [paths["count"]])] == ["upper", "count"]
+    assert [stage.name for stage in select_stages(stages, [paths["count"]], only=True)] == ["count"]
+    with pytest.raises(ValueError):
+        select_stages(stages, ["nothing"])
+
+
+def test_unknown_targets_are_usage_errors(tmp_path, chain):
+    stages, paths, runs = chain
+    with pytest.raises(SystemExit) as exit:
+        run(stages, tmp_path, "nothing")
+    assert exit.value.code == 2
+    assert runs == []
+
+
+def test_a_failed_stage_runs_again_next_time(tmp_path, chain):
+    stages, paths, runs = chain
+    state = str(tmp_path / "state.json")
+
+    def fail():
+        runs.append("broken")
+        raise RuntimeError("boom")
+
+    broken = stages[:1] + [stages[1]._replace(run=fail)]
+    assert not run_pipeline(broken, state_path=state)
+    assert not run_pipeline(broken, state_path=state)
+    assert runs == ["upper", "broken", "broken"]
+    assert run_pipeline(stages[:2], state_path=state)
+    assert runs[-1] == "count"
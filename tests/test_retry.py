@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the retry policy and the adaptive concurrency limit.
+"""
+import asyncio
+
+from crawler import AdaptiveLimit
+from retry import RetryPolicy, backoff_delay, retry_after_seconds
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("") is None
+    assert retry_after_seconds(" 7 ") == 7.0
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412500.0) == 0.0
+    assert retry_after_seconds("soon") is None
+
+
+def test_backoff_delay_stays_within_bounds():
+    policy = RetryPolicy(backoff=0.5, max_backoff=4.0, max_retry_after=60.0)
+    for attempt in range(8):
+        delay = backoff_delay(policy, attempt)
+        assert 0 <= delay <= min(4.0, 0.5 * 2**attempt)
+    assert backoff_delay(policy, 0, retry_after=10) >= 10
+    assert backoff_delay(policy, 0, retry_after=3600) <= 60.0
+
+
+def test_adaptive_limit_halves_once_per_round_and_grows_back():
+    async def run():
+        limit = AdaptiveLimit(8, initial=8)
+        tokens = [await limit.acquire() for _ in range(8)]
+        # a whole round of errors cuts the limit once, not eight times
+        for token in tokens:
+            limit.release(token, pushback=True)
+        assert limit.limit == 4 and limit.cuts == 1
+        for _ in range(20):
+            limit.release(await limit.acquire())
+        assert 4 < limit.limit <= 8
+
+    asyncio.run(run())
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the vectorized, chunked, incremental and parallel scrubs.
+"""
+import filecmp
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import clean_crash_frame_rowwise
+from conftest import CLEANED_CSV, RAW_CSV
+from scrubdata import clean_crash_frame, scrub_crash_data
+from sink import RAW_COLUMNS
+
+# one raw row with every column set; the edge cases below change single fields
+PLAIN_ROW = {
+    "Date": "March 02, 1975",
+    "Time": "1430",
+    "Location": "Near Moscow, Russia",
+    "Operator": "Aeroflot",
+    "Flight #": "101",
+    "Route": "Moscow - Kiev",
+    "Aircraft Type": "Tupolev Tu-134",
+    "Registration": "CCCP-65000",
+    "cn / ln": "1234",
+    "Aboard": "72 \xa0 (passengers:66\xa0 crew:6)",
+    "Fatalities": "40 \xa0 (passengers:36\xa0 crew:4)",
+    "Ground": "0",
+    "Summary": "Crashed on approach in fog.",
+}
+
+EDGE_CASES = [
+    {},
+    {"Time": "?"},
+    {"Time": "930"},
+    {"Time": "14::30"},
+    {"Time": ""},
+    {"Date": "?"},
+    {"Date": "February 30, 1975"},
+    {"Date": ""},
+    {"Date": None, "Time": None},
+    {"Location": "?", "Operator": "?"},
+    {"Location": "", "Operator": ""},
+    {"Location": None, "Operator": None},
+    {"Location": "  Near  Lima,   Peru ", "Operator": "  Faucett   Peru  "},
+    {"Operator": "unknown"},
+    {"Operator": "Unknown"},
+    {"Flight #": "?", "Route": "?", "Aircraft Type": "?", "Registration": "?"},
+    {"Flight #": "", "Route": None},
+    {"Aboard": "?", "Fatalities": "?"},
+    {"Aboard": "", "Fatalities": ""},
+    {"Aboard": None, "Fatalities": None},
+    {"Aboard": "3 \xa0 (passengers:?\xa0 crew:3)", "Fatalities": "0 (ground: 12)"},
+    {"Fatalities": "0 \xa0 (passengers:0\xa0 crew:0) (ground: 4)"},
+    {"Fatalities": "5 (passengers:2 crew:3)(ground:1)"},
+    {"Ground": "?", "Summary": None},
+    {"Summary": ""},
+]
+
+
+def edge_rows():
+    rows = [{**PLAIN_ROW, **change} for change in EDGE_CASES]
+    return pd.DataFrame(rows, columns=RAW_COLUMNS).astype(object)
+
+
+def test_clean_crash_frame_matches_rowwise_original_on_sample(raw_crashes):
+    expected = clean_crash_frame_rowwise(raw_crashes)
+    pd.testing.assert_frame_equal(clean_crash_frame(raw_crashes), expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("position", range(len(EDGE_CASES)))
+def test_clean_crash_frame_matches_rowwise_original_on_edge_values(position):
+    rows = edge_rows().iloc[[0, position]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(
+        clean_crash_frame(rows), clean_crash_frame_rowwise(rows), check_dtype=False
+    )
+
+
+def test_clean_crash_frame_counts_and_defaults():
+    df = clean_crash_frame(edge_rows())
+    by_case = {i: row for i, row in df.iterrows()}
+    assert by_case[0]["Total_Aboard"] == 72 and by_case[0]["Total_Fatalities"] == 40
+    assert by_case[0]["Location_Cleaned"] == "Moscow, Russia"
+    assert by_case[1]["DateTime"] == pd.Timestamp("1975-03-02 00:00")
+    assert by_case[2]["DateTime"] == pd.Timestamp("1975-03-02 09:30")
+    # the format is inferred from the first row, so "14:30" no longer fits it
+    assert pd.isna(by_case[3]["DateTime"])
+    assert pd.isna(by_case[6]["DateTime"])  # no February 30
+    assert by_case[9]["Operator_Cleaned"] == "Unknown Operator"
+    assert by_case[15][["Flight #", "Route", "Aircraft Type", "Registration"]].tolist() == ["Unknown"] * 4
+    # counts without the passengers/crew split, and ground-only fatalities, become 0
+    for case in (17, 18, 19, 20):
+        assert by_case[case]["Total_Fatalities"] == 0
+    assert by_case[21]["Total_Fatalities"] == 0
+    assert by_case[22][["Passengers_Fatalities", "Crew_Fatalities"]].tolist() == [2, 3]
+
+
+def test_scrub_output_matches_checked_in_cleaned_csv(tmp_path):
+    output = tmp_path / "cleaned.csv"
+    scrub_crash_data(RAW_CSV, str(output))
+    assert filecmp.cmp(output, CLEANED_CSV, shallow=False)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{"chunksize": 700}, {"chunksize": 700, "processes": 2}],
+    ids=["chunked", "parallel"],
+)
+def test_streaming_scrubs_match_full_scrub(tmp_path, options):
+    full = tmp_path / "full.csv"
+    other = tmp_path / "other.csv"
+    scrub_crash_data(RAW_CSV, str(full), parquet_path=str(tmp_path / "full.parquet"))
+    scrub_crash_data(RAW_CSV, str(other), parquet_path=str(tmp_path / "other.parquet"), **options)
+    assert filecmp.cmp(full, other, shallow=False)
+    # each chunk writes its own row group per year, so only the rows must match
+    by_id = lambda path: pd.read_parquet(path).sort_values("UniqueID", kind="stable").reset_index(drop=True)
+    pd.testing.assert_frame_equal(by_id(tmp_path / "full.parquet"), by_id(tmp_path / "other.parquet"))
+
+
+def test_parallel_scrub_writes_dates_only_when_no_crash_has_a_time(tmp_path, raw_crashes):
+    raw = raw_crashes.iloc[:1500].copy()
+    raw["Time"] = "?"
+    raw.loc[:600, "Date"] = None  # the first shards have no dates at all
+    raw.to_csv(tmp_path / "raw.csv", index=False)
+    scrub_crash_data(str(tmp_path / "raw.csv"), str(tmp_path / "serial.csv"))
+    scrub_crash_data(str(tmp_path / "raw.csv"), str(tmp_path / "parallel.csv"), 400, processes=3)
+    assert filecmp.cmp(tmp_path / "serial.csv", tmp_path / "parallel.csv", shallow=False)
+
+
+def test_incremental_scrub_matches_full_scrub(tmp_path, raw_crashes):
+    raw_path = tmp_path / "raw.csv"
+    raw_crashes.iloc[:4000].to_csv(raw_path, index=False)
+    output = tmp_path / "incremental.csv"
+    scrub_crash_data(str(raw_path), str(output), incremental=True)
+    added = raw_crashes.iloc[4000:].copy()
+    added.to_csv(raw_path, mode="a", header=False, index=False)
+    scrub_crash_data(str(raw_path), str(output), incremental=True)
+    scrub_crash_data(str(raw_path), str(tmp_path / "full.csv"))
+    assert filecmp.cmp(output, tmp_path / "full.csv", shallow=False)
+
+
+def test_duplicate_datetimes_are_counted_across_shards(tmp_path, raw_crashes, capsys):
+    raw_crashes.to_csv(tmp_path / "raw.csv", index=False)
+    scrub_crash_data(str(tmp_path / "raw.csv"), str(tmp_path / "serial.csv"))
+    serial = capsys.readouterr().out
+    scrub_crash_data(str(tmp_path / "raw.csv"), str(tmp_path / "parallel.csv"), 500, processes=2)
+    parallel = capsys.readouterr().out
+    duplicates = pd.read_csv(tmp_path / "serial.csv")["DateTime"].duplicated().sum()
+    assert np.int64(duplicates) > 0
+    assert f"has {duplicates} duplicates" in serial
+    assert f"has {duplicates} duplicates" in parallel
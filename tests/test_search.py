@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the summary search index, checked against scanning the summaries.
+"""
+import re
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import CLEANED_CSV, PROJECT_DIR
+from dataset import read_crash_data
+from search import INDEX_COLUMNS, SummaryIndex, decode_varints, encode_varints, tokenize
+
+
+@pytest.fixture(scope="module")
+def crashes():
+    return read_crash_data(CLEANED_CSV, columns=INDEX_COLUMNS)
+
+
+@pytest.fixture(scope="module")
+def index(crashes):
+    index = SummaryIndex()
+    index.update(crashes)
+    return index
+
+
+def contains(summaries, text):
+    # rows whose summary has the terms of text next to each other, by str.contains
+    words = r"\W+".join(re.escape(term) for term in tokenize(text))
+    return summaries.fillna("").str.lower().str.contains(rf"(?<!\w){words}(?!\w)", regex=True).to_numpy()
+
+
+# query -> the same question asked of the summaries with str.contains
+QUERIES = {
+    "fire": lambda s: contains(s, "fire"),
+    "Fire": lambda s: contains(s, "fire"),
+    "engine fire": lambda s: contains(s, "engine") & contains(s, "fire"),
+    "engine AND fire": lambda s: contains(s, "engine") & contains(s, "fire"),
+    '"engine fire"': lambda s: contains(s, "engine fire"),
+    '"loss of control"': lambda s: contains(s, "loss of control"),
+    "fog OR storm": lambda s: contains(s, "fog") | contains(s, "storm"),
+    "fire NOT engine": lambda s: contains(s, "fire") & ~contains(s, "engine"),
+    "fire -engine": lambda s: contains(s, "fire") & ~contains(s, "engine"),
+    "NOT fire": lambda s: ~contains(s, "fire"),
+    "-(fog OR rain) approach": lambda s: ~(contains(s, "fog") | contains(s, "rain")) & contains(s, "approach"),
+    '(fog OR storm) AND "on approach"': lambda s: (contains(s, "fog") | contains(s, "storm"))
+    & contains(s, "on approach"),
+    "DC-3": lambda s: contains(s, "dc 3"),
+    # AND binds tighter than OR
+    "shot down OR hijacked": lambda s: contains(s, "shot") & contains(s, "down") | contains(s, "hijacked"),
+    "zzzunknownword": lambda s: contains(s, "zzzunknownword"),
+    '"no such phrase anywhere"': lambda s: contains(s, "no such phrase anywhere"),
+}
+
+
+def matching_uids(index, query, **facets):
+    return sorted(index.search(query, **facets))
+
+
+def expected_uids(crashes, query):
+    return sorted(crashes["UniqueID"][QUERIES[query](crashes["Summary"])])
+
+
+def test_varints_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**35, 2**62 - 1, 5], dtype=np.int64)
+    data, sizes = encode_varints(values)
+    assert sizes.tolist() == [1, 1, 1, 2, 2, 2, 3, 6, 9, 1]
+    assert decode_varints(data.tobytes()).tolist() == values.tolist()
+    assert decode_varints(np.empty(0, dtype=np.uint8)).tolist() == []
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_match_equals_scanning_the_summaries(crashes, index, query):
+    assert matching_uids(index, query) == expected_uids(crashes, query)
+
+
+def test_phrase_docs_equals_scanning_the_summaries(crashes, index):
+    for phrase in ["crashed into", "the aircraft", "loss of control", "of the"]:
+        expected = np.flatnonzero(contains(crashes["Summary"], phrase))
+        assert index.phrase_docs(tokenize(phrase)).tolist() == expected.tolist()
+
+
+def test_facets(crashes, index):
+    rows = crashes["Year"].between(1970, 1979) & (crashes["Operator_Cleaned"] == "Aeroflot")
+    found = matching_uids(index, "crashed", years=range(1970, 1980), operators=["Aeroflot"])
+    assert found == sorted(crashes["UniqueID"][rows & contains(crashes["Summary"], "crashed")])
+    assert len(index.match("", operators=["No Such Operator"])) == 0
+
+
+@pytest.mark.parametrize("query", ["fire AND (", "fire )", "(fire", "fire OR", "NOT"])
+def test_malformed_queries_raise_value_error(index, query):
+    with pytest.raises(ValueError):
+        index.match(query)
+
+
+def changed_crashes(crashes):
+    # a later version of the data: some summaries rewritten, some crashes gone
+    changed = crashes.copy()
+    changed.loc[changed.index[10:60], "Summary"] = "Rewritten after a fire on approach in fog."
+    return changed.drop(changed.index[100:150]).reset_index(drop=True)
+
+
+def test_incremental_update_equals_scanning_the_summaries(crashes):
+    index = SummaryIndex()
+    index.update(crashes.iloc[:4000])
+    changed = changed_crashes(crashes)
+    added, deleted = index.update(changed)
+    # 50 of the first 4000 crashes are gone and 50 rewritten
+    assert (added, deleted) == (len(changed) - (4000 - 50) + 50, 50 + 50)
+    assert index.size > index.documents  # updated in place, not rebuilt
+    for query in QUERIES:
+        assert matching_uids(index, query) == expected_uids(changed, query), query
+
+
+def test_rebuild_after_many_changes_equals_scanning_the_summaries(crashes):
+    index = SummaryIndex()
+    index.update(crashes)
+    changed = crashes.iloc[: len(crashes) // 2].copy()
+    index.update(changed)
+    assert index.size == index.documents == len(changed)  # rebuilt without deleted documents
+    for query in QUERIES:
+        assert matching_uids(index, query) == expected_uids(changed, query), query
+
+
+def test_saved_index_loads_and_keeps_updating(tmp_path, crashes):
+    path = str(tmp_path / "summary_index.npz")
+    index = SummaryIndex()
+    index.update(crashes.iloc[:4000])
+    index.save(path)
+    loaded = SummaryIndex.load(path)
+    for query in QUERIES:
+        assert matching_uids(loaded, query) == matching_uids(index, query), query
+    changed = changed_crashes(crashes)
+    loaded.update(changed)
+    for query in QUERIES:
+        assert matching_uids(loaded, query) == expected_uids(changed, query), query
+    assert SummaryIndex.load(str(tmp_path / "missing.npz")).size == 0
+
+
+def test_cli_reports_malformed_queries(tmp_path, index):
+    path = str(tmp_path / "summary_index.npz")
+    index.save(path)
+    command = [sys.executable, "search.py", "--index", path]
+    ok = subprocess.run(command + ["fire"], cwd=PROJECT_DIR, capture_output=True, text=True)
+    assert ok.returncode == 0 and "crashes match" in ok.stdout
+    broken = subprocess.run(command + ["fire AND ("], cwd=PROJECT_DIR, capture_output=True, text=True)
+    assert broken.returncode == 2
+    assert "error: Query ends too early" in broken.stderr
+    assert "Traceback" not in broken.stderr
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the query service over HTTP.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+import service as service_module
+from conftest import CLEANED_CSV
+from manifest import file_signature
+from service import CrashQueryService, make_server
+
+
+@pytest.fixture
+def served(tmp_path):
+    # a service over a copy of the cleaned data that checks the file on every question
+    path = str(tmp_path / "cleaned.csv")
+    shutil.copyfile(CLEANED_CSV, path)
+    service = CrashQueryService(path, check_interval=0)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield service, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def ask(url):
+    # (status, decoded JSON) of a GET
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def append_first_crash(path):
+    # the same crash again changes the file's contents
+    with open(path, "r+", encoding="utf-8") as file:
+        first_crash = file.read().split("\n", 2)[1]
+        file.write(first_crash + "\n")
+
+
+def test_answers_and_client_errors(served):
+    service, base = served
+    status, years = ask(base + "/years?years=1970-1979")
+    assert status == 200
+    crashes = pd.read_csv(service.path, usecols=["DateTime"], parse_dates=["DateTime"])
+    assert years["years"] == list(range(1970, 1980))
+    assert sum(years["crashes"]) == crashes["DateTime"].dt.year.between(1970, 1979).sum()
+    assert ask(base + "/top?n=0")[0] == 400
+    assert ask(base + "/nothing")[0] == 404
+
+
+def test_unexpected_errors_are_answered_with_500(served, monkeypatch):
+    service, base = served
+
+    def broken(snapshot, options):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(service_module.QUESTIONS, "top", broken)
+    status, answer = ask(base + "/top?by=operators")
+    assert status == 500
+    assert answer == {"error": "internal error: RuntimeError: boom"}
+    # the server keeps answering
+    assert ask(base + "/years")[0] == 200
+
+
+def test_a_broken_data_file_is_answered_from_the_last_good_data(served):
+    service, base = served
+    before = ask(base + "/top?by=operators")[1]
+    os.remove(service.path)
+    assert ask(base + "/top?by=operators") == (200, before)
+    with open(service.path, "w", encoding="utf-8") as file:
+        file.write("UniqueID,Date")  # half-written
+    assert ask(base + "/top?by=operators") == (200, before)
+    assert service.snapshot.version == 0
+    # a good file with new contents is loaded again
+    shutil.copyfile(CLEANED_CSV, service.path)
+    append_first_crash(service.path)
+    ask(base + "/top?by=operators")
+    assert service.snapshot.version == 1
+
+
+def test_a_broken_data_file_is_retried_once_per_check_interval(served, monkeypatch):
+    service, base = served
+    checks = []
+
+    def counted_signature(path):
+        checks.append(path)
+        return file_signature(path)
+
+    monkeypatch.setattr(service_module, "file_signature", counted_signature)
+    service.check_interval = 3600
+    os.remove(service.path)
+    service.checked = time.monotonic() - 3600  # the interval is up
+    for _ in range(3):
+        assert ask(base + "/top?by=operators")[0] == 200
+    assert len(checks) == 1
+
+
+def test_questions_during_a_reload_are_answered_from_the_old_data(served):
+    service, base = served
+    before = ask(base + "/top?by=operators")[1]
+    append_first_crash(service.path)
+    with service.reload_lock:  # as if another thread were reloading
+        start = time.perf_counter()
+        status, answer = ask(base + "/top?by=operators")
+        assert time.perf_counter() - start < 2
+        assert status == 200 and answer == before
+        assert service.snapshot.version == 0
+    ask(base + "/top?by=operators")
+    assert service.snapshot.version == 1
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the crash table parsers.
+"""
+import pytest
+
+from getdata import parse_crash_table
+from tableparser import (
+    extract_crash_record,
+    extract_crash_record_lxml,
+    extract_crash_record_stdlib,
+    parse_pages,
+)
+from standin import build_crash_page
+
+PARSERS = [extract_crash_record_stdlib, extract_crash_record_lxml]
+
+EMPTY_PAGES = ["", "   \n", "<!-- moved -->", "<html><body>No crash here</body></html>"]
+
+
+@pytest.fixture(scope="module")
+def crash_pages(raw_crashes):
+    return [build_crash_page(values) for values in raw_crashes.iloc[:200].fillna("").values.tolist()]
+
+
+@pytest.mark.parametrize("extract", PARSERS, ids=["stdlib", "lxml"])
+def test_parsers_match_beautifulsoup(crash_pages, extract):
+    for html in crash_pages:
+        labels, values = parse_crash_table(html).values.tolist()
+        assert extract(html) == dict(zip(labels, values))
+
+
+@pytest.mark.parametrize("extract", PARSERS, ids=["stdlib", "lxml"])
+@pytest.mark.parametrize("html", EMPTY_PAGES)
+def test_pages_without_a_table_raise_index_error(extract, html):
+    with pytest.raises(IndexError):
+        extract(html)
+
+
+def test_parse_pages_yields_none_for_pages_without_a_table(crash_pages):
+    pages = crash_pages[:3] + EMPTY_PAGES
+    records = list(parse_pages(pages, processes=1))
+    assert records[:3] == [extract_crash_record(html) for html in crash_pages[:3]]
+    assert records[3:] == [None] * len(EMPTY_PAGES)